@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+#encoding: UTF-8
+from typing import Dict,List
+import os, random, json, argparse
+
+__doc__ = """
+Generates a deterministic, synthetic corpus of polyblock sources, so that
+benchmark runs can be compared with each other. The same `seed` and
+`scale` always produce the same files.
+
+The corpus is made of the following kinds of files:
+
+- `block`: standalone `.block` documents with headings, text, code and
+  symbol blocks,
+- `embedded`: `.py` and `.js` sources with blocks embedded in comments,
+- `json` and `hjson`: documents with large data blocks,
+- `headers`: header-heavy documents (like `test/component.block`), where
+  most lines are block headers with names, processors and attributes.
+"""
+
+WORDS = (
+	"block", "parser", "input", "header", "content", "stream", "value",
+	"symbol", "anchor", "heading", "section", "index", "weave", "writer",
+	"module", "function", "data", "format", "source", "output", "event",
+	"token", "buffer", "line", "offset", "cache", "node", "tree", "page",
+)
+
+# -----------------------------------------------------------------------------
+#
+# GENERATORS
+#
+# -----------------------------------------------------------------------------
+
+#@symbol benchmarks.corpus.Generator
+class Generator:
+	"""Generates the text of the corpus files, using its own random
+	generator so that the output only depends on the seed."""
+
+	def __init__( self, seed:int=0 ):
+		self.random = random.Random(seed)
+
+	def words( self, count:int ) -> str:
+		return " ".join(self.random.choice(WORDS) for _ in range(count))
+
+	def name( self ) -> str:
+		return "{0}_{1}".format(self.random.choice(WORDS), self.random.randint(0, 999))
+
+	def paragraph( self, indent:str="\t" ) -> List[str]:
+		return [indent + self.words(self.random.randint(6, 14)) for _ in range(self.random.randint(2, 8))]
+
+	def code( self, indent:str="\t" ) -> List[str]:
+		lines = []
+		for _ in range(self.random.randint(4, 16)):
+			lines.append("{0}{1}{2} = {3}({4})".format(
+				indent, "    " * self.random.randint(0, 2),
+				self.name(), self.name(), self.random.randint(0, 100)))
+		return lines
+
+	def data( self, depth:int=0 ):
+		"""Returns a random JSON-compatible value."""
+		if depth > 2:
+			return self.random.choice((self.random.randint(0, 10000), self.words(3), True, None, self.random.random()))
+		elif self.random.random() < 0.5:
+			return {self.name():self.data(depth + 1) for _ in range(self.random.randint(2, 6))}
+		else:
+			return [self.data(depth + 1) for _ in range(self.random.randint(2, 6))]
+
+	def blockDocument( self, sections:int ) -> str:
+		"""A standalone document."""
+		lines = ["@title " + self.words(4), "@created 2020-01-{0:02d}".format(self.random.randint(1, 28))]
+		for i in range(sections):
+			lines.append("@h2 " + self.words(3))
+			lines.append("@symbol section section_{0}".format(i))
+			for _ in range(self.random.randint(1, 4)):
+				if self.random.random() < 0.6:
+					lines.append("@p")
+					lines += self.paragraph()
+				else:
+					lines.append("@code")
+					lines += self.code()
+				lines.append("")
+			if self.random.random() < 0.3:
+				lines.append("# " + self.words(5))
+		return "\n".join(lines) + "\n"
+
+	def embeddedDocument( self, functions:int, ext:str ) -> str:
+		"""A source file with embedded blocks, using the comment delimiter
+		for the given extension."""
+		comment = "#" if ext == "py" else "//"
+		lines   = []
+		for i in range(functions):
+			name = self.name()
+			lines.append("{0} @h3 {1}".format(comment, name))
+			lines += ["{0} {1}".format(comment, _.strip()) for _ in self.paragraph()]
+			if self.random.random() < 0.2:
+				lines.append("{0} @hide".format(comment))
+				lines += self.code("")
+				lines.append("{0} @show".format(comment))
+			if ext == "py":
+				lines.append("def {0}( value ):".format(name))
+				lines += ["\t" + _ for _ in self.code("")]
+				lines.append("\treturn value")
+			else:
+				lines.append("function {0}( value ) {{".format(name))
+				lines += ["\t" + _ + ";" for _ in self.code("")]
+				lines.append("\treturn value;")
+				lines.append("}")
+			lines.append("")
+		return "\n".join(lines) + "\n"
+
+	def dataDocument( self, blocks:int, size:int, format:str ) -> str:
+		"""A standalone document with large `json` or `hjson` blocks."""
+		lines = ["@title " + self.words(4)]
+		for i in range(blocks):
+			value = [self.data() for _ in range(size)]
+			lines.append("@" + format)
+			if format == "hjson":
+				# NOTE: JSON is valid HJSON, quoteless keys and values
+				# make sure it exercises the HJSON syntax.
+				lines.append("\t{")
+				lines.append("\t\tname: data_{0}".format(i))
+				lines.append("\t\tdescription: " + self.words(6))
+				lines += ["\t\t" + _ for _ in ("items: " + json.dumps(value, indent=1)).split("\n")]
+				lines.append("\t}")
+			else:
+				lines += ["\t" + _ for _ in json.dumps({"name":"data_{0}".format(i), "items":value}, indent=1).split("\n")]
+		return "\n".join(lines) + "\n"
+
+	def headersDocument( self, headers:int ) -> str:
+		"""A document where most lines are block headers."""
+		lines = []
+		for i in range(headers):
+			r = self.random.random()
+			if r < 0.3:
+				lines.append("@{0}:symbol|strip {1} {2}".format(self.name(), self.random.choice(WORDS), self.name()))
+			elif r < 0.6:
+				lines.append("@anchor {0} {{id={1},weight={2}}}".format(self.name(), self.name(), self.random.randint(0, 9)))
+			elif r < 0.9:
+				lines.append("@h{0} {1}".format(self.random.randint(1, 6), self.words(3)))
+			else:
+				lines.append("@p")
+				lines.append("\t" + self.words(8))
+		return "\n".join(lines) + "\n"
+
+# -----------------------------------------------------------------------------
+#
+# CORPUS
+#
+# -----------------------------------------------------------------------------
+
+def generate( root:str, scale:int=1, seed:int=0 ) -> Dict[str,List[str]]:
+	"""Generates the corpus files in the `root` directory, and returns
+	a map of each kind of file to the corresponding paths. The size of
+	the corpus grows linearly with `scale`."""
+	g = Generator(seed)
+	corpus:Dict[str,List[str]] = {_:[] for _ in ("block", "embedded", "json", "hjson", "headers")}
+	def write( kind:str, name:str, text:str ):
+		path = os.path.join(root, kind, name)
+		if not os.path.exists(os.path.dirname(path)):
+			os.makedirs(os.path.dirname(path))
+		with open(path, "wt") as f:
+			f.write(text)
+		corpus[kind].append(path)
+	for i in range(4 * scale):
+		write("block", "doc-{0:04d}.block".format(i), g.blockDocument(200))
+	for i in range(2 * scale):
+		write("embedded", "src-{0:04d}.py".format(i), g.embeddedDocument(300, "py"))
+		write("embedded", "src-{0:04d}.js".format(i), g.embeddedDocument(300, "js"))
+	for i in range(2 * scale):
+		write("json",  "json-{0:04d}.block".format(i),  g.dataDocument(10, 50, "json"))
+		write("hjson", "hjson-{0:04d}.block".format(i), g.dataDocument(10, 50, "hjson"))
+	for i in range(2 * scale):
+		write("headers", "headers-{0:04d}.block".format(i), g.headersDocument(5000))
+	return corpus
+
+# -----------------------------------------------------------------------------
+#
+# COMMAND-LINE
+#
+# -----------------------------------------------------------------------------
+
+def run( args=None ):
+	oparser = argparse.ArgumentParser(
+		prog="benchmarks/corpus.py",
+		description="Generates a synthetic polyblocks corpus"
+	)
+	oparser.add_argument("output", type=str, help="The directory where the corpus is written")
+	oparser.add_argument("--scale", type=int, default=1, help="Multiplies the number of files")
+	oparser.add_argument("--seed",  type=int, default=0, help="The random seed")
+	args = oparser.parse_args(args)
+	for kind, paths in generate(args.output, args.scale, args.seed).items():
+		print("{0}\t{1} files".format(kind, len(paths)))
+
+if __name__ == "__main__":
+	run()
+
+# EOF - vim: ts=4 sw=4 noet
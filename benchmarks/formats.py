@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+#encoding: UTF-8
+from typing import Any,Callable,Dict,List
+import os, sys, io, gc, time, json, tempfile, argparse
+
+BASE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE, "src", "py"))
+
+from xml.etree import ElementTree
+from polyblocks.parser import EmbeddedParser
+from polyblocks.writer import XMLWriter, JSONWriter, BinaryWriter
+from polyblocks import binary
+import corpus
+
+__doc__ = """
+Compares the output formats on the processed blocks of the synthetic
+corpus: the size of the output, the time to write it and the time to load
+it back, which is:
+
+- `xml`: parsing with `ElementTree` (as the weave passes do),
+- `json`: decoding with `json.loads`,
+- `binary`: loading the `Block` objects with `polyblocks.binary.loads`.
+
+Only the binary format is loaded back as blocks, the others are loaded as
+elements and primitives.
+
+```
+python3 benchmarks/formats.py
+```
+"""
+
+# The writer and loader of each format
+FORMATS:Dict[str,Any] = {
+	"xml"    : (XMLWriter,    ElementTree.fromstring),
+	"json"   : (JSONWriter,   json.loads),
+	"binary" : (BinaryWriter, binary.loads),
+}
+
+def best( function:Callable[[],Any], repeat:int ) -> float:
+	"""Returns the best time of `repeat` calls of the given function."""
+	seconds = None
+	for _ in range(repeat):
+		gc.collect()
+		started = time.perf_counter()
+		function()
+		elapsed = time.perf_counter() - started
+		seconds = elapsed if seconds is None else min(seconds, elapsed)
+	return seconds
+
+def write( writer_class, blocks:List[List[Any]] ) -> List[Any]:
+	result = []
+	for file_blocks in blocks:
+		writer = writer_class()
+		output = io.BytesIO() if writer.BINARY else io.StringIO()
+		writer.write(file_blocks, output)
+		result.append(output.getvalue())
+	return result
+
+def measure( paths:List[str], repeat:int ) -> Dict[str,Any]:
+	"""Returns the size, write and load times of each format for the
+	blocks of the given paths."""
+	parser  = EmbeddedParser(useCache=False)
+	blocks  = [list(parser.iterPath(_)) for _ in paths]
+	results:Dict[str,Any] = {}
+	for name, (writer_class, load) in FORMATS.items():
+		outputs = write(writer_class, blocks)
+		results[name] = {
+			"bytes"        : sum(len(_.encode("utf8") if isinstance(_, str) else _) for _ in outputs),
+			"writeSeconds" : best(lambda:write(writer_class, blocks), repeat),
+			"loadSeconds"  : best(lambda:[load(_) for _ in outputs], repeat),
+		}
+	return results
+
+def run( args=None ) -> int:
+	oparser = argparse.ArgumentParser(
+		prog="benchmarks/formats.py",
+		description="Compares the size, write and load times of the output formats"
+	)
+	oparser.add_argument("--scale",  type=int, default=1, help="Multiplies the size of the corpus")
+	oparser.add_argument("--seed",   type=int, default=0, help="The random seed of the corpus")
+	oparser.add_argument("--repeat", type=int, default=3, help="The number of timed runs")
+	oparser.add_argument("--kind",   action="append", help="Only uses the given kind of files, can be repeated")
+	oparser.add_argument("-o", "--output", type=str, help="Writes the results as JSON to the given file")
+	args = oparser.parse_args(args)
+	results:Dict[str,Any] = {}
+	with tempfile.TemporaryDirectory() as temp:
+		for kind, paths in corpus.generate(temp, args.scale, args.seed).items():
+			if args.kind and kind not in args.kind:
+				continue
+			try:
+				results[kind] = measure(paths, args.repeat)
+				for name, result in results[kind].items():
+					sys.stderr.write("{0:10s} {1:8s} {2:10d} bytes {3:8.3f}s write {4:8.3f}s load\n".format(
+						kind, name, result["bytes"], result["writeSeconds"], result["loadSeconds"]))
+			except Exception as e:
+				results[kind] = {"error":"{0}: {1}".format(e.__class__.__name__, e)}
+				sys.stderr.write("{0:10s} error: {1}\n".format(kind, results[kind]["error"]))
+	text = json.dumps(results, indent=4, sort_keys=True)
+	if args.output:
+		with open(args.output, "wt") as f:
+			f.write(text)
+	else:
+		sys.stdout.write(text + "\n")
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(run())
+
+# EOF - vim: ts=4 sw=4 noet
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+#encoding: UTF-8
+from typing import Any,Dict,List
+import os, sys, gc, json, tempfile, tracemalloc, argparse
+
+BASE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+import corpus
+
+__doc__ = """
+Measures the memory retained by the processed blocks of the synthetic
+corpus, as bytes per block. This is the memory a consumer pays to keep
+all the blocks of a corpus around, as opposed to the peak memory of each
+stage measured by `run.py`.
+
+```
+python3 benchmarks/memory.py
+```
+
+The `--source` option measures the `polyblocks` package of another
+revision (on the same corpus), for instance to compare with the commit
+before the current one:
+
+```
+git worktree add /tmp/polyblocks-before HEAD~1
+python3 benchmarks/memory.py --source /tmp/polyblocks-before/src/py
+```
+"""
+
+def measure( paths:List[str] ) -> Dict[str,Any]:
+	"""Returns the number of blocks and the memory they retain (in bytes)
+	once the given paths are parsed and processed."""
+	from polyblocks.parser import EmbeddedParser
+	parser = EmbeddedParser(useCache=False)
+	# We parse a first time so that anything that is allocated once (like
+	# the parser's memoized headers) is not counted.
+	for path in paths:
+		for _ in parser.iterPath(path):
+			pass
+	gc.collect()
+	tracemalloc.start()
+	before = tracemalloc.get_traced_memory()[0]
+	blocks = [list(parser.iterPath(_)) for _ in paths]
+	gc.collect()
+	retained = tracemalloc.get_traced_memory()[0] - before
+	tracemalloc.stop()
+	count = sum(len(_) for _ in blocks)
+	return {
+		"blocks"        : count,
+		"bytes"         : retained,
+		"bytesPerBlock" : retained / count if count else None,
+	}
+
+def run( args=None ) -> int:
+	oparser = argparse.ArgumentParser(
+		prog="benchmarks/memory.py",
+		description="Measures the memory retained per processed block"
+	)
+	oparser.add_argument("--scale",  type=int, default=1, help="Multiplies the size of the corpus")
+	oparser.add_argument("--seed",   type=int, default=0, help="The random seed of the corpus")
+	oparser.add_argument("--kind",   action="append", help="Only uses the given kind of files, can be repeated")
+	oparser.add_argument("-o", "--output", type=str, help="Writes the results as JSON to the given file")
+	oparser.add_argument("--source", type=str, default=os.path.join(BASE, "src", "py"),
+		help="The directory to import the polyblocks package from (this checkout's `src/py` by default)")
+	args = oparser.parse_args(args)
+	sys.path.insert(0, os.path.abspath(args.source))
+	results:Dict[str,Any] = {}
+	with tempfile.TemporaryDirectory() as temp:
+		for kind, paths in corpus.generate(temp, args.scale, args.seed).items():
+			if args.kind and kind not in args.kind:
+				continue
+			try:
+				results[kind] = measure(paths)
+				sys.stderr.write("{0:10s} {1:8d} blocks {2:8.1f} bytes/block\n".format(kind, results[kind]["blocks"], results[kind]["bytesPerBlock"] or 0))
+			except Exception as e:
+				results[kind] = {"error":"{0}: {1}".format(e.__class__.__name__, e)}
+				sys.stderr.write("{0:10s} error: {1}\n".format(kind, results[kind]["error"]))
+	text = json.dumps(results, indent=4, sort_keys=True)
+	if args.output:
+		with open(args.output, "wt") as f:
+			f.write(text)
+	else:
+		sys.stdout.write(text + "\n")
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(run())
+
+# EOF - vim: ts=4 sw=4 noet
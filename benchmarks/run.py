@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+#encoding: UTF-8
+from typing import Any,Callable,Dict,List,Optional,Tuple
+import os, sys, io, gc, time, json, platform, tempfile, tracemalloc, argparse
+
+# NOTE: We benchmark the polyblocks sources from this tree, not any
+# installed version.
+BASE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE, "src", "py"))
+
+from xml.etree import ElementTree
+from polyblocks.parser import EmbeddedParser
+from polyblocks.writer import XMLWriter, JSONWriter, BinaryWriter
+from polyblocks.weave.input import PolyblockFile
+from polyblocks.weave.transform.index import IndexPass
+import corpus
+
+__doc__ = """
+Measures the throughput (lines/s and blocks/s) and the peak memory of each
+stage of the polyblocks pipeline, on the synthetic corpus generated by
+`corpus.py`:
+
+- `parse`: scanning the files into block inputs,
+- `process`: processing the block inputs into blocks,
+- `xml`, `json` and `binary`: writing the blocks with `XMLWriter`,
+  `JSONWriter` and `BinaryWriter` (see `formats.py` for their load times),
+- `index`: running the weave `IndexPass` on the XML output.
+
+Each stage is measured separately: the preceding stages run before the
+timer (and the memory tracing) starts. The results are written as JSON,
+and can be compared to a previous run given as a baseline, in which case
+the regressions are reported and the exit code is 1.
+
+```
+python3 benchmarks/run.py --output results.json
+python3 benchmarks/run.py --baseline results.json
+```
+"""
+
+# The version of the results format
+VERSION = 1
+
+# -----------------------------------------------------------------------------
+#
+# STAGES
+#
+# -----------------------------------------------------------------------------
+
+#@symbol benchmarks.run.BenchmarkIndexPass
+class BenchmarkIndexPass(IndexPass):
+	"""The index pass only extracts symbols from Texto files, this one
+	does the same for polyblock files."""
+
+	def onPolyblockFile( self, value:PolyblockFile ):
+		self.onTextoFile(value)
+
+def parseInputs( paths:List[str] ) -> List[List[Any]]:
+	parser = EmbeddedParser(useCache=False)
+	return [list(parser.iterPathInputs(_)) for _ in paths]
+
+def processInputs( inputs:List[List[Any]] ) -> List[List[Any]]:
+	return [[_.end() for _ in block_inputs] for block_inputs in inputs]
+
+def writeBlocks( writer, blocks:List[List[Any]] ) -> List[Any]:
+	result = []
+	for file_blocks in blocks:
+		output = io.BytesIO() if writer.BINARY else io.StringIO()
+		writer.write(file_blocks, output)
+		result.append(output.getvalue())
+	return result
+
+def loadFiles( paths:List[str], outputs:List[str] ) -> List[PolyblockFile]:
+	files = []
+	for path, output in zip(paths, outputs):
+		f = PolyblockFile(path)
+		f._value = ElementTree.fromstring(output)
+		files.append(f)
+	return files
+
+def indexFiles( files:List[PolyblockFile] ) -> BenchmarkIndexPass:
+	index = BenchmarkIndexPass()
+	for _ in files:
+		index.walk(_)
+	return index
+
+# Each stage is a `(setup, run)` pair: `setup` creates the input of the
+# stage from the list of paths, and `run` is the measured part.
+STAGES:Dict[str,Tuple[Callable[[List[str]],Any],Callable[[Any],Any]]] = {
+	"parse"   : (lambda paths:paths, parseInputs),
+	"process" : (parseInputs, processInputs),
+	"xml"     : (lambda paths:processInputs(parseInputs(paths)), lambda blocks:writeBlocks(XMLWriter(), blocks)),
+	"json"    : (lambda paths:processInputs(parseInputs(paths)), lambda blocks:writeBlocks(JSONWriter(), blocks)),
+	"binary"  : (lambda paths:processInputs(parseInputs(paths)), lambda blocks:writeBlocks(BinaryWriter(), blocks)),
+	"index"   : (lambda paths:loadFiles(paths, writeBlocks(XMLWriter(), processInputs(parseInputs(paths)))), indexFiles),
+}
+
+# -----------------------------------------------------------------------------
+#
+# MEASURES
+#
+# -----------------------------------------------------------------------------
+
+def countLines( paths:List[str] ) -> int:
+	count = 0
+	for path in paths:
+		with open(path, "rb") as f:
+			count += sum(1 for _ in f)
+	return count
+
+def countBlocks( paths:List[str] ) -> int:
+	return sum(len(_) for _ in parseInputs(paths))
+
+def measure( stage:str, paths:List[str], repeat:int ) -> Dict[str,Any]:
+	"""Measures the given stage on the given paths, returning the best
+	time out of `repeat` runs, and the peak memory allocated by the stage
+	in a separate run (as tracing slows it down)."""
+	setup, run = STAGES[stage]
+	lines   = countLines(paths)
+	blocks  = countBlocks(paths)
+	seconds = None
+	for _ in range(repeat):
+		value = setup(paths)
+		gc.collect()
+		started = time.perf_counter()
+		run(value)
+		elapsed = time.perf_counter() - started
+		seconds = elapsed if seconds is None else min(seconds, elapsed)
+		del value
+	value = setup(paths)
+	gc.collect()
+	tracemalloc.start()
+	run(value)
+	peak = tracemalloc.get_traced_memory()[1]
+	tracemalloc.stop()
+	return {
+		"lines"           : lines,
+		"blocks"          : blocks,
+		"seconds"         : seconds,
+		"linesPerSecond"  : lines / seconds if seconds else None,
+		"blocksPerSecond" : blocks / seconds if seconds else None,
+		"peakMemory"      : peak,
+	}
+
+def benchmark( files:Dict[str,List[str]], stages:List[str], repeat:int, log:Optional[Callable[[str],None]]=None ) -> Dict[str,Any]:
+	"""Runs the given stages on each kind of files, returning the results
+	keyed by `KIND/STAGE`. A stage that fails (for instance because an
+	optional dependency is missing) has an `error` instead of measures."""
+	results:Dict[str,Any] = {}
+	for kind, paths in files.items():
+		for stage in stages:
+			key = "{0}/{1}".format(kind, stage)
+			try:
+				results[key] = measure(stage, paths, repeat)
+			except Exception as e:
+				results[key] = {"error":"{0}: {1}".format(e.__class__.__name__, e)}
+			if log:
+				log(formatResult(key, results[key]))
+	return {
+		"version" : VERSION,
+		"python"  : platform.python_version(),
+		"platform": platform.platform(),
+		"results" : results,
+	}
+
+# -----------------------------------------------------------------------------
+#
+# COMPARISON
+#
+# -----------------------------------------------------------------------------
+
+def compare( current:Dict[str,Any], baseline:Dict[str,Any], threshold:float ) -> List[str]:
+	"""Returns the list of regressions of the `current` results compared
+	to the `baseline`: stages that are slower or use more memory by more
+	than the given `threshold` ratio."""
+	regressions = []
+	for key, base in baseline.get("results", {}).items():
+		value = current["results"].get(key)
+		if not value or "error" in value or "error" in base:
+			continue
+		for field in ("seconds", "peakMemory"):
+			if base.get(field) and value.get(field) and value[field] > base[field] * (1.0 + threshold):
+				regressions.append("{0}: {1} {2:+.1%} ({3} → {4})".format(
+					key, field, value[field] / base[field] - 1.0,
+					formatValue(field, base[field]), formatValue(field, value[field])))
+	return regressions
+
+def formatValue( field:str, value:float ) -> str:
+	if field == "peakMemory":
+		return "{0:.1f}MiB".format(value / (1024 * 1024))
+	else:
+		return "{0:.3f}s".format(value)
+
+def formatResult( key:str, result:Dict[str,Any] ) -> str:
+	if "error" in result:
+		return "{0:20s} error: {1}".format(key, result["error"])
+	else:
+		return "{0:20s} {1:8.3f}s {2:12.0f} lines/s {3:10.0f} blocks/s {4:10s} peak".format(
+			key, result["seconds"], result["linesPerSecond"] or 0,
+			result["blocksPerSecond"] or 0, formatValue("peakMemory", result["peakMemory"]))
+
+# -----------------------------------------------------------------------------
+#
+# COMMAND-LINE
+#
+# -----------------------------------------------------------------------------
+
+def run( args=None ) -> int:
+	oparser = argparse.ArgumentParser(
+		prog="benchmarks/run.py",
+		description="Benchmarks the polyblocks pipeline on a synthetic corpus"
+	)
+	oparser.add_argument("-c", "--corpus", type=str,
+		help="The directory where the corpus is generated (a temporary directory by default)")
+	oparser.add_argument("--scale",  type=int, default=1, help="Multiplies the size of the corpus")
+	oparser.add_argument("--seed",   type=int, default=0, help="The random seed of the corpus")
+	oparser.add_argument("--repeat", type=int, default=3, help="The number of timed runs of each stage")
+	oparser.add_argument("--stage",  action="append", choices=list(STAGES),
+		help="Only runs the given stage, can be repeated")
+	oparser.add_argument("--kind",   action="append",
+		help="Only uses the given kind of files, can be repeated")
+	oparser.add_argument("-o", "--output", type=str,
+		help="Writes the results as JSON to the given file (stdout by default)")
+	oparser.add_argument("-b", "--baseline", type=str,
+		help="Compares the results to the ones in the given file")
+	oparser.add_argument("--threshold", type=float, default=0.15,
+		help="The slowdown (or memory increase) ratio above which a stage is a regression")
+	args = oparser.parse_args(args)
+	log  = lambda _:sys.stderr.write(_ + "\n")
+	with tempfile.TemporaryDirectory() as temp:
+		files = corpus.generate(args.corpus or temp, args.scale, args.seed)
+		if args.kind:
+			files = {k:v for k,v in files.items() if k in args.kind}
+		results = benchmark(files, args.stage or list(STAGES), args.repeat, log)
+	text = json.dumps(results, indent=4, sort_keys=True)
+	if args.output:
+		with open(args.output, "wt") as f:
+			f.write(text)
+	elif not args.baseline:
+		sys.stdout.write(text + "\n")
+	if args.baseline:
+		with open(args.baseline, "rt") as f:
+			regressions = compare(results, json.load(f), args.threshold)
+		for _ in regressions:
+			log("REGRESSION " + _)
+		return 1 if regressions else 0
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(run())
+
+# EOF - vim: ts=4 sw=4 noet
@@ -1,8 +1,32 @@
 #!/usr/bin/env python3
 #encoding: UTF-8
-from .parser import Cache, Parser, EmbeddedParser
-from .writer import XMLWriter, JSONWriter
-import io
+import importlib
+
+# NOTE: The `polyblocks` command is run once per file, so importing the
+# package should not import anything that is not used. The API below is
+# imported from its module on first access.
+LAZY = {
+	"Cache"          : "parser",
+	"Parser"         : "parser",
+	"EmbeddedParser" : "parser",
+	"readBlock"      : "parser",
+	"Selector"       : "parser",
+	"BlockIndex"     : "parser",
+	"XMLWriter"      : "writer",
+	"JSONWriter"     : "writer",
+	"NDJSONWriter"   : "writer",
+	"BinaryWriter"   : "writer",
+}
+
+def __getattr__( name:str ):
+	if name in LAZY:
+		value = getattr(importlib.import_module("." + LAZY[name], __name__), name)
+		globals()[name] = value
+		return value
+	raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def __dir__():
+	return sorted(list(globals()) + list(LAZY))
 
 # -----------------------------------------------------------------------------
 #
@@ -13,10 +37,13 @@ import io
 def process( text, path=None ):
 	"""Processes the given block `text` (which might have been extracted
 	from the given `path`) and returns a string with the result."""
+	from .parser import EmbeddedParser
+	from .writer import XMLWriter
+	import io
 	res = io.StringIO()
 	parser = EmbeddedParser()
 	writer = XMLWriter()
-	parsed = parser.parseText(text, path)
+	parsed = parser.iterText(text, path)
 	writer.write(parsed, res)
 	res.seek(0)
 	res = res.read()
@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+#encoding: UTF-8
+import struct
+from datetime import datetime
+from typing import Any,Dict,Iterator,List,Optional,Tuple,Type
+from .model  import Block,LazyBlock,EMPTY_ATTRIBUTES
+from .       import model
+
+__doc__ = """
+A compact binary serialization of blocks, which (unlike their XML and
+JSON output) can be loaded back as `Block` objects, without parsing text.
+See `benchmarks/formats.py` for its size and load time compared to XML
+and JSON. As it is decoded in Python, it loads slower than `json.loads`
+of the same blocks, so it is not an output format of the command until
+it loads faster.
+
+The output of each `BinaryWriter.write` is a self-contained segment, so
+that segments can be concatenated (eg. when files are processed in
+parallel):
+
+- the `MAGIC` bytes, the `VERSION` byte and the segment's path (a value),
+- a `BLOCK` byte followed by each block: its class (as `module:Class`),
+  name, type, attributes and value, and the values of the slots added
+  by its class (like `Data.source`),
+- an `END` byte.
+
+Loading only creates blocks of registered classes (see `getClass`), and
+never imports the modules named by the data.
+
+Integers are varints (zigzag-encoded when signed) and strings are UTF-8,
+prefixed by their length. Class names, block names and types, and
+dictionary keys are symbols: they are written the first time they
+occur, and then as their index in the segment's table of symbols. Values are prefixed by
+their type, one of `NONE`, `FALSE`, `TRUE`, `INT`, `FLOAT`, `STR`,
+`LIST`, `TUPLE`, `DICT`, `MAP` (a dictionary with keys that are not all
+strings) and `DATETIME`.
+"""
+
+MAGIC   = b"PBLK"
+VERSION = 2
+
+END   = 0
+BLOCK = 1
+
+NONE     = 0
+FALSE    = 1
+TRUE     = 2
+INT      = 3
+FLOAT    = 4
+STR      = 5
+LIST     = 6
+TUPLE    = 7
+DICT     = 8
+DATETIME = 9
+MAP      = 10
+
+DOUBLE = struct.Struct("<d")
+
+# The block classes that can be loaded, by `module:Class` name, see
+# `registerClass`.
+CLASSES:Dict[str,Type[Block]] = {}
+# The slots added to `Block` by each block class
+SLOTS:Dict[Type[Block],Tuple[str,...]] = {}
+# Tells if the block classes of the default `Mapping` are registered
+HAS_MAPPING = False
+
+def getClassName( cls:Type[Block] ) -> str:
+	return f"{cls.__module__}:{cls.__qualname__}"
+
+def registerClass( cls:Type[Block] ) -> Type[Block]:
+	"""Registers the given block class, so that its blocks can be loaded.
+	Returns the class, so that it can be used as a decorator."""
+	if not (isinstance(cls, type) and issubclass(cls, Block)):
+		raise ValueError(f"Not a block class: {cls!r}")
+	CLASSES[getClassName(cls)] = cls
+	return cls
+
+def registerMapping( mapping:'Mapping' ):
+	"""Registers the block classes output by the block inputs of the given
+	mapping (see `BlockInput.OUTPUT`), importing the modules of the block
+	inputs given as `module:Class` references. The block inputs that can't
+	be imported are skipped."""
+	for name in list(mapping.types):
+		try:
+			block_input = mapping.getInputForType(name)
+		except (ImportError, AttributeError):
+			continue
+		output = getattr(block_input, "OUTPUT", None)
+		if isinstance(output, type) and issubclass(output, Block):
+			registerClass(output)
+
+def getClass( name:str ) -> Type[Block]:
+	"""Returns the registered block class with the given `module:Class`
+	name. The classes of `polyblocks.model` are always registered, and the
+	ones of the default `Mapping` (including its entry points) are
+	registered the first time a name is not found. Other names are
+	rejected, so that loading blocks never imports a module that the
+	data names."""
+	global HAS_MAPPING
+	cls = CLASSES.get(name)
+	if cls is None and not HAS_MAPPING:
+		HAS_MAPPING = True
+		from .parser import Mapping
+		mapping = Mapping()
+		mapping.loadEntryPoints()
+		registerMapping(mapping)
+		cls = CLASSES.get(name)
+	if cls is None:
+		raise ValueError(f"Unknown block class: {name}, it needs to be registered with `registerClass`")
+	return cls
+
+def getSlots( cls:Type[Block] ) -> Tuple[str,...]:
+	"""Returns the slots of the given block class that are not in `Block`."""
+	slots = SLOTS.get(cls)
+	if slots is None:
+		slots = tuple(
+			_ for c in reversed(cls.__mro__) if c is not Block and issubclass(c, Block)
+			for _ in c.__dict__.get("__slots__", ())
+		)
+		SLOTS[cls] = slots
+	return slots
+
+for _ in list(vars(model).values()):
+	if isinstance(_, type) and issubclass(_, Block):
+		registerClass(_)
+
+# -----------------------------------------------------------------------------
+#
+# ENCODER
+#
+# -----------------------------------------------------------------------------
+
+#@symbol polyblocks.binary.BinaryEncoder
+class BinaryEncoder:
+	"""Encodes blocks in the binary format, in `data`, which can be taken
+	with `flush` at any time."""
+
+	def __init__( self ):
+		self.data = bytearray()
+		self.symbols:Dict[str,int] = {}
+
+	def flush( self ) -> bytes:
+		"""Returns the encoded data and clears it."""
+		data = bytes(self.data)
+		self.data.clear()
+		return data
+
+	def writeStart( self, path:Optional[str]=None ):
+		"""Starts a new segment, for the blocks of the given path."""
+		self.symbols.clear()
+		self.data += MAGIC
+		self.data.append(VERSION)
+		self.writeValue(path)
+
+	def writeEnd( self ):
+		self.data.append(END)
+
+	def writeBlock( self, block:Block ):
+		if isinstance(block, LazyBlock):
+			block = block.block
+		cls = block.__class__
+		self.data.append(BLOCK)
+		self.writeSymbol(getClassName(cls))
+		self.writeSymbol(block.name)
+		self.writeSymbol(block.type)
+		self.writeValue(block.attributes)
+		self.writeValue(block.value)
+		for _ in getSlots(cls):
+			self.writeValue(getattr(block, _))
+
+	def writeVarint( self, value:int ):
+		data = self.data
+		while value > 0x7F:
+			data.append((value & 0x7F) | 0x80)
+			value >>= 7
+		data.append(value)
+
+	def writeString( self, value:str ):
+		encoded = value.encode("utf8")
+		self.writeVarint(len(encoded))
+		self.data += encoded
+
+	def writeSymbol( self, value:str ):
+		"""Writes the index of the given symbol (from 1), or `0` followed
+		by the symbol when it is new."""
+		index = self.symbols.get(value)
+		if index is None:
+			self.symbols[value] = len(self.symbols) + 1
+			self.data.append(0)
+			self.writeString(value)
+		else:
+			self.writeVarint(index)
+
+	def writeValue( self, value:Any ):
+		"""Writes the given value, prefixed by its type. The dictionaries'
+		string keys are written as symbols, other keys as values."""
+		data = self.data
+		kind = type(value)
+		if kind is str:
+			data.append(STR)
+			self.writeString(value)
+		elif value is None:
+			data.append(NONE)
+		elif kind is bool:
+			data.append(TRUE if value else FALSE)
+		elif kind is int:
+			data.append(INT)
+			self.writeVarint(value << 1 if value >= 0 else ((-value) << 1) - 1)
+		elif kind is float:
+			data.append(FLOAT)
+			data += DOUBLE.pack(value)
+		elif isinstance(value, dict):
+			if all(type(_) is str for _ in value):
+				data.append(DICT)
+				self.writeVarint(len(value))
+				for k, v in value.items():
+					self.writeSymbol(k)
+					self.writeValue(v)
+			else:
+				data.append(MAP)
+				self.writeVarint(len(value))
+				for k, v in value.items():
+					self.writeValue(k)
+					self.writeValue(v)
+		elif isinstance(value, (list, tuple)):
+			data.append(TUPLE if isinstance(value, tuple) else LIST)
+			self.writeVarint(len(value))
+			for _ in value:
+				self.writeValue(_)
+		elif isinstance(value, datetime):
+			data.append(DATETIME)
+			self.writeString(value.isoformat())
+		elif isinstance(value, str):
+			data.append(STR)
+			self.writeString(value)
+		elif isinstance(value, int):
+			self.writeValue(int(value))
+		elif isinstance(value, float):
+			self.writeValue(float(value))
+		else:
+			raise TypeError(f"Value can't be written in binary: {value!r}")
+
+# -----------------------------------------------------------------------------
+#
+# DECODER
+#
+# -----------------------------------------------------------------------------
+
+#@symbol polyblocks.binary.BinaryDecoder
+class BinaryDecoder:
+	"""Decodes the blocks from the given binary data, which may be made of
+	several segments."""
+
+	def __init__( self, data:bytes ):
+		self.data = bytes(data)
+		self.offset = 0
+
+	def iterSegments( self ) -> Iterator[Tuple[Optional[str],List[Block]]]:
+		"""Yields the path and the blocks of each segment."""
+		while self.offset < len(self.data):
+			yield self.readSegment()
+
+	def readSegment( self ) -> Tuple[Optional[str],List[Block]]:
+		"""Reads the segment at the current offset, returning its path and
+		its blocks."""
+		data   = self.data
+		offset = self.offset
+		if data[offset:offset + len(MAGIC)] != MAGIC:
+			raise ValueError(f"Binary blocks expected at offset {offset}")
+		version = data[offset + len(MAGIC)]
+		if version != VERSION:
+			raise ValueError(f"Unsupported binary blocks version: {version}, expected {VERSION}")
+		offset += len(MAGIC) + 1
+		symbols:List[str] = []
+		# NOTE: This is the loader's hot loop, so the readers are closures
+		# sharing the `offset` local, which is faster than an attribute.
+		def readVarint() -> int:
+			nonlocal offset
+			byte = data[offset]
+			offset += 1
+			if byte < 0x80:
+				return byte
+			value = byte & 0x7F
+			shift = 7
+			while True:
+				byte = data[offset]
+				offset += 1
+				value |= (byte & 0x7F) << shift
+				if byte < 0x80:
+					return value
+				shift += 7
+		def readString() -> str:
+			nonlocal offset
+			length = data[offset]
+			if length < 0x80:
+				offset += 1
+			else:
+				length = readVarint()
+			start  = offset
+			offset += length
+			return data[start:offset].decode("utf8")
+		def readSymbol() -> str:
+			nonlocal offset
+			index = data[offset]
+			if index < 0x80:
+				offset += 1
+			else:
+				index = readVarint()
+			if index:
+				return symbols[index - 1]
+			symbol = readString()
+			symbols.append(symbol)
+			return symbol
+		def readValue() -> Any:
+			nonlocal offset
+			kind = data[offset]
+			offset += 1
+			if kind == STR:
+				return readString()
+			elif kind == INT:
+				value = readVarint()
+				return -((value + 1) >> 1) if value & 1 else value >> 1
+			elif kind == DICT:
+				return {readSymbol():readValue() for _ in range(readVarint())}
+			elif kind == LIST:
+				return [readValue() for _ in range(readVarint())]
+			elif kind == NONE:
+				return None
+			elif kind == TRUE:
+				return True
+			elif kind == FALSE:
+				return False
+			elif kind == FLOAT:
+				offset += 8
+				return DOUBLE.unpack_from(data, offset - 8)[0]
+			elif kind == TUPLE:
+				return tuple([readValue() for _ in range(readVarint())])
+			elif kind == DATETIME:
+				return datetime.fromisoformat(readString())
+			elif kind == MAP:
+				return {readValue():readValue() for _ in range(readVarint())}
+			else:
+				raise ValueError(f"Unsupported value type {kind} at offset {offset - 1}")
+		path = readValue()
+		blocks:List[Block] = []
+		# The class and slots of each class symbol
+		classes:Dict[str,Tuple[Type[Block],Tuple[str,...]]] = {}
+		while True:
+			marker = data[offset]
+			offset += 1
+			if marker == END:
+				break
+			elif marker != BLOCK:
+				raise ValueError(f"Unexpected marker {marker} at offset {offset - 1}")
+			# NOTE: We inline the most common cases: known symbols, empty
+			# attributes and short strings.
+			index = data[offset]
+			if 0 < index < 0x80:
+				offset += 1
+				name = symbols[index - 1]
+			else:
+				name = readSymbol()
+			cls_slots = classes.get(name)
+			if cls_slots is None:
+				cls = getClass(name)
+				cls_slots = classes[name] = (cls, getSlots(cls))
+			cls, slots = cls_slots
+			block = cls.__new__(cls)
+			index = data[offset]
+			if 0 < index < 0x80:
+				offset += 1
+				block.name = symbols[index - 1]
+			else:
+				block.name = readSymbol()
+			index = data[offset]
+			if 0 < index < 0x80:
+				offset += 1
+				block.type = symbols[index - 1]
+			else:
+				block.type = readSymbol()
+			if data[offset] == DICT and data[offset + 1] == 0:
+				offset += 2
+				block.attributes = EMPTY_ATTRIBUTES
+			else:
+				block.attributes = readValue() or EMPTY_ATTRIBUTES
+			if data[offset] == STR and data[offset + 1] < 0x80:
+				start  = offset + 2
+				offset = start + data[offset + 1]
+				block.value = data[start:offset].decode("utf8")
+			else:
+				block.value = readValue()
+			for _ in slots:
+				setattr(block, _, readValue())
+			blocks.append(block)
+		self.offset = offset
+		return path, blocks
+
+# -----------------------------------------------------------------------------
+#
+# HIGH LEVEL API
+#
+# -----------------------------------------------------------------------------
+
+def dumps( blocks:List[Block], path:Optional[str]=None ) -> bytes:
+	"""Returns the given blocks in the binary format, as a single segment."""
+	encoder = BinaryEncoder()
+	encoder.writeStart(path)
+	for _ in blocks:
+		encoder.writeBlock(_)
+	encoder.writeEnd()
+	return encoder.flush()
+
+def loads( data:bytes ) -> List[Block]:
+	"""Returns the blocks of all the segments in the given binary data."""
+	return [_ for path, blocks in BinaryDecoder(data).iterSegments() for _ in blocks]
+
+def load( path:str ) -> List[Block]:
+	"""Returns the blocks of all the segments of the given binary file."""
+	with open(path, "rb") as f:
+		return loads(f.read())
+
+# EOF - vim: ts=4 sw=4 noet
@@ -1,18 +1,152 @@
 #!/usr/bin/env python3
 #encoding: UTF-8
-import os, sys, argparse
-from .parser import Cache, Parser, EmbeddedParser
-from .writer import XMLWriter, JSONWriter
+import os, sys, io, argparse
+from typing  import Any,Dict,Iterable,Iterator,List,Optional,Tuple,Union
+from .model  import Block
+from .parser import Cache, Parser, EmbeddedParser, Selector
+from .util   import JSONBackend, iterFiles
+from .writer import Writer, XMLWriter, JSONWriter, NDJSONWriter
 
 # FIXME: This should probably be a canonical URL
 DEFAULT_XSL = "lib/xsl/polyblocks.xsl"
 
+# -----------------------------------------------------------------------------
+#
+# WORKERS
+#
+# -----------------------------------------------------------------------------
+
+# Each worker process creates its parser (and so its mapping) and its writer
+# once, and reuses them for all the paths it is given.
+WORKER:Dict[str,Any] = {}
+
+def createWriter( format:str, pretty:bool=False, stylesheet:Optional[str]=None ) -> Writer:
+	"""Returns a writer for the given output format."""
+	if format == "json":
+		return JSONWriter(pretty=pretty)
+	elif format == "ndjson":
+		return NDJSONWriter()
+	else:
+		return XMLWriter(pretty=pretty, stylesheet=stylesheet)
+
+def iterBlocks( parser:Parser, path:str, selector:Optional[Selector]=None ) -> Iterator[Block]:
+	"""Parses the file at the given path, yielding the blocks that match
+	the given selector, if any."""
+	if selector:
+		return parser.iterSelected(parser.iterPathInputs(path), selector)
+	else:
+		return parser.iterPath(path)
+
+def initWorker( options:Dict[str,Any] ):
+	"""Initializes the current worker process with the given options."""
+	JSONBackend.Use(options["jsonBackend"])
+	WORKER["parser"]   = EmbeddedParser(useCache=options["useCache"])
+	WORKER["writer"]   = createWriter(options["format"], options["pretty"], options["stylesheet"])
+	WORKER["selector"] = Selector.Parse(options["select"]) if options["select"] else None
+	WORKER["tagged"]   = options["tagged"]
+
+def convertPath( parser:Parser, writer:Writer, path:str, selector:Optional[Selector]=None, tagged:bool=False ) -> Union[str,bytes]:
+	"""Parses the file at the given path and returns the output of the
+	writer for its blocks, tagged with the path if `tagged`."""
+	output = io.BytesIO() if writer.BINARY else io.StringIO()
+	writer.write(iterBlocks(parser, path, selector), output, path if tagged else None)
+	return output.getvalue()
+
+def processPath( path:str ) -> Tuple[Union[str,bytes],Dict[str,int]]:
+	"""Parses and writes the file at the given path in the current worker,
+	returning the output and the changes in the cache counters."""
+	parser:Parser = WORKER["parser"]
+	before = parser.cache.stats() if parser.cache else {}
+	output = convertPath(parser, WORKER["writer"], path, WORKER["selector"], WORKER["tagged"])
+	after  = parser.cache.stats() if parser.cache else {}
+	return output, dict((k, v - before.get(k, 0)) for k,v in after.items())
+
+def createExecutor( jobs:int, pool:str, jsonBackend:str ) -> Any:
+	"""Returns a `concurrent.futures` executor with `jobs` workers (all the
+	cores if 0) of the given kind (`thread` or `process`), in which the
+	parser can process the expensive blocks."""
+	import concurrent.futures
+	if pool == "thread":
+		return concurrent.futures.ThreadPoolExecutor(jobs or os.cpu_count())
+	else:
+		return concurrent.futures.ProcessPoolExecutor(jobs or os.cpu_count(), initializer=JSONBackend.Use, initargs=(jsonBackend,))
+
+def iterOutputs( paths:Iterable[str], options:Dict[str,Any], jobs:int ) -> Iterator[Tuple[Union[str,bytes],Dict[str,int]]]:
+	"""Processes the given paths using a pool of `jobs` worker processes,
+	yielding the outputs in the same order as the paths."""
+	import multiprocessing
+	with multiprocessing.Pool(jobs, initializer=initWorker, initargs=(options,)) as pool:
+		yield from pool.imap(processPath, paths)
+
+# -----------------------------------------------------------------------------
+#
+# OUTPUT FILES
+#
+# -----------------------------------------------------------------------------
+
+# The default suffix of the output files, for each format
+SUFFIXES = {
+	"xml"    : ".xml",
+	"json"   : ".json",
+	"ndjson" : ".ndjson",
+}
+
+def getBase( paths:Iterable[str] ) -> str:
+	"""Returns the deepest directory that contains all the given paths."""
+	return os.path.commonpath([os.path.abspath(_ if os.path.isdir(_) else os.path.dirname(_) or ".") for _ in paths])
+
+def getOutputPath( path:str, outputDir:str, base:str, suffix:str ) -> str:
+	"""Returns the path of the output file for the given input `path`, which
+	is its path relative to `base` within `outputDir`, with its extension
+	replaced by `suffix`."""
+	relpath = os.path.relpath(os.path.abspath(path), os.path.abspath(base))
+	if relpath == os.pardir or relpath.startswith(os.pardir + os.sep):
+		raise ValueError(f"Input path is not within the base directory {base}: {path}")
+	return os.path.join(outputDir, os.path.splitext(relpath)[0] + suffix)
+
+def writeOutput( path:str, output:Union[str,bytes] ) -> bool:
+	"""Writes the given output to the file at the given path, atomically,
+	unless the file already has this content. Returns `True` when the file
+	was written."""
+	data = output.encode("utf8") if isinstance(output, str) else output
+	try:
+		if os.path.getsize(path) == len(data):
+			with open(path, "rb") as f:
+				if f.read() == data:
+					return False
+	except OSError:
+		pass
+	parent = os.path.dirname(path)
+	if parent:
+		os.makedirs(parent, exist_ok=True)
+	# NOTE: The file is renamed in place, so readers (and other processes
+	# writing the same output) never see a partial file.
+	temp = f"{path}.{os.getpid()}.tmp"
+	try:
+		with open(temp, "wb") as f:
+			f.write(data)
+		os.replace(temp, path)
+	finally:
+		if os.path.exists(temp):
+			os.unlink(temp)
+	return True
+
 # -----------------------------------------------------------------------------
 #
 # COMMAND-LINE
 #
 # -----------------------------------------------------------------------------
 
+def writeCacheStats( stats:Dict[str,int] ):
+	"""Writes the given cache counters on stderr, as `key=value` pairs."""
+	sys.stderr.write(" ".join(f"{k}={v}" for k,v in stats.items()) + "\n")
+
+def writeError( path:str, error:Exception ):
+	"""Writes the given error, which occurred processing the given path, on
+	stderr."""
+	sys.stderr.write(f"{path}: {error.__class__.__name__}: {error}\n")
+	sys.stderr.flush()
+
 # @symbol polyblocks.command
 # @embed|shell polyblocks --help
 def run( args, name="polyblocks" ):
@@ -26,34 +160,146 @@ def run( args, name="polyblocks" ):
 	# TODO: Rework command lines arguments, we want something that follows
 	# common usage patterns.
 	oparser.add_argument("files", metavar="FILE", type=str, nargs='*',
-		help='The .block files to process')
+		help='The files to process, directories being expanded to the files they contain with a known extension')
 	oparser.add_argument("--list", action="store_true",
 		help='List the available block types')
-	oparser.add_argument("-O", "--output-format", choices=("xml","json"), default="xml",
-		help='Defines the output format')
+	oparser.add_argument("-O", "--output-format", choices=("xml","json","ndjson"), default="xml",
+		help='Defines the output format, ndjson writing one JSON block per line (with its path when there are multiple files)')
 	oparser.add_argument("-p", "--pretty", action="store_true",
 		help='Pretty prints the XML output')
-	oparser.add_argument("-s", "--stylesheet", action="store", default=DEFAULT_XSL,
-		help='Specifies the stylesheet URL, can be empty')
+	oparser.add_argument("-s", "--stylesheet", action="store", default=None,
+		help=f'Adds an xml-stylesheet processing instruction for the given XSL stylesheet URL (eg. {DEFAULT_XSL})')
 	oparser.add_argument("-cc", "--clean-cache", action="store_true",
 		help='Cleans the cache')
+	oparser.add_argument("-j", "--jobs", type=int, default=1,
+		help='Processes the files using the given number of worker processes, 0 using all the cores (not with --block-jobs)')
+	oparser.add_argument("-J", "--block-jobs", type=int, default=1,
+		help='Processes the expensive blocks (like JSON data) of each file using the given number of workers, 0 using all the cores (not with --jobs)')
+	oparser.add_argument("--block-pool", choices=("process","thread"), default="process",
+		help='The kind of workers used by --block-jobs')
+	oparser.add_argument("--select", action="append", metavar="KEY=VALUE",
+		help='Only outputs the blocks with the given type, name or attribute (eg. type=code, name=title, lang=js), can be repeated. Values for the same key are alternatives.')
+	oparser.add_argument("--output-dir", metavar="DIR",
+		help='Writes the output of each file to its own file in the given directory (see --base and --suffix), only when it changed')
+	oparser.add_argument("--base", metavar="DIR",
+		help='The directory of the files given to --output-dir, from which their paths are relative (the common directory of the files by default)')
+	oparser.add_argument("--suffix", metavar="SUFFIX",
+		help='The suffix that replaces the extension of the files written to --output-dir (eg. .xml, the format by default)')
+	oparser.add_argument("-w", "--watch", action="store_true",
+		help='Watches the files (and directories) and re-processes them when they change')
+	oparser.add_argument("--interval", type=float, default=0.5,
+		help='The interval in seconds at which watched files are polled')
+	oparser.add_argument("--no-cache", action="store_true",
+		help='Does not use the cache of processed blocks')
+	oparser.add_argument("--cache-stats", action="store_true",
+		help='Outputs the cache hit/miss counters on stderr')
+	oparser.add_argument("--json-backend", choices=("auto",) + JSONBackend.BACKENDS, default="auto",
+		help='The library used to parse and write JSON, auto picking the fastest available')
 	# We create the parse and register the options
 	args = oparser.parse_args(args=args)
 	out  = sys.stdout
+	for option, value in (("--jobs", args.jobs), ("--block-jobs", args.block_jobs)):
+		if value < 0:
+			oparser.error(f"{option} must be 0 (all the cores) or more, got {value}")
+	if args.jobs != 1 and args.block_jobs != 1:
+		# NOTE: The file workers process their blocks inline, as a pool of
+		# block workers in each of them would oversubscribe the cores.
+		oparser.error("--jobs and --block-jobs cannot be used together")
+	selector = Selector.Parse(args.select) if args.select else None
+	# The output of each file is tagged with its path when there might be
+	# more than one (only in the formats that support it, see `Writer.path`)
+	tagged   = not args.output_dir and (len(args.files) > 1 or any(os.path.isdir(_) for _ in args.files))
+	base     = args.base or (getBase(args.files) if args.files else ".")
+	suffix   = SUFFIXES[args.output_format] if args.suffix is None else args.suffix
+	# Directories are expanded to the files they contain, like the watcher
+	# does, so that each file is processed (and written) on its own.
+	files    = args.files
+	if not args.watch and any(os.path.isdir(_) for _ in files):
+		files = list(iterFiles(files, EmbeddedParser(useCache=False).getExtensions()))
+	def output_path( path:str ) -> str:
+		try:
+			return getOutputPath(path, args.output_dir, base, suffix)
+		except ValueError as e:
+			oparser.error(str(e))
+	if args.output_dir:
+		# We fail before processing anything if a file is outside the base
+		for p in files:
+			if not os.path.isdir(p):
+				output_path(p)
+	if args.json_backend != "auto":
+		try:
+			JSONBackend.Use(args.json_backend)
+		except ImportError:
+			oparser.error(f"JSON backend is not installed: {args.json_backend}")
 	if args.clean_cache:
 		Cache.Ensure().clean(full=True)
 	# if args.list:
 	# 	for key in sorted(Parser.BLOCKS):
 	# 		out.write("@{0:10s} {1}\n".format(key, Parser.BLOCKS[key].description))
-	elif args.files:
-		parser = EmbeddedParser()
-		writer = None
-		if args.output_format == "xml":
-			writer = XMLWriter(pretty=args.pretty)
-		elif args.output_format == "json":
-			writer = JSONWriter(pretty=args.pretty)
-		for p in args.files:
-			writer.write(parser.parsePath(p), sys.stdout)
+	elif args.files and args.watch:
+		from .watch import Watcher
+		executor = createExecutor(args.block_jobs, args.block_pool, args.json_backend) if args.block_jobs != 1 else None
+		# NOTE: The watched files are being edited, so they are read rather
+		# than memory-mapped, see `Parser.mapFiles`.
+		parser = EmbeddedParser(useCache=not args.no_cache, executor=executor, mapFiles=False)
+		writer = createWriter(args.output_format, args.pretty, args.stylesheet)
+		def on_change( paths:List[str] ):
+			for p in paths:
+				# NOTE: A file might be invalid (or gone) while it is being
+				# edited. Its output is only written once complete, and the
+				# error is reported without stopping to watch.
+				try:
+					output = convertPath(parser, writer, p, selector, tagged)
+					if args.output_dir:
+						writeOutput(output_path(p), output)
+					else:
+						out.write(output)
+				except Exception as e:
+					writeError(p, e)
+			out.flush()
+			if args.cache_stats and parser.cache:
+				writeCacheStats(parser.cache.stats())
+		try:
+			Watcher(args.files, parser.getExtensions()).watch(on_change, args.interval)
+		finally:
+			if executor:
+				executor.shutdown()
+	elif files and args.jobs != 1:
+		options = dict(
+			useCache = not args.no_cache,
+			format   = args.output_format,
+			pretty   = args.pretty,
+			jsonBackend = args.json_backend,
+			select   = args.select,
+			stylesheet = args.stylesheet,
+			tagged   = tagged,
+		)
+		stats:Dict[str,int] = {}
+		for p, (output, delta) in zip(files, iterOutputs(files, options, args.jobs or os.cpu_count())):
+			if args.output_dir:
+				writeOutput(output_path(p), output)
+			else:
+				out.write(output)
+				out.flush()
+			for k,v in delta.items():
+				stats[k] = stats.get(k, 0) + v
+		if args.cache_stats and stats:
+			writeCacheStats(stats)
+	elif files:
+		executor = createExecutor(args.block_jobs, args.block_pool, args.json_backend) if args.block_jobs != 1 else None
+		parser = EmbeddedParser(useCache=not args.no_cache, executor=executor)
+		writer = createWriter(args.output_format, args.pretty, args.stylesheet)
+		try:
+			for p in files:
+				if args.output_dir:
+					writeOutput(output_path(p), convertPath(parser, writer, p, selector))
+				else:
+					writer.write(iterBlocks(parser, p, selector), out, p if tagged else None)
+		finally:
+			if executor:
+				executor.shutdown()
+		if args.cache_stats and parser.cache:
+			writeCacheStats(parser.cache.stats())
 
 # -----------------------------------------------------------------------------
 #
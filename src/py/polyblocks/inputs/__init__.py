@@ -1,9 +1,9 @@
 #!/usr/bin/env python3
-from typing import Dict,List,Any,Optional,Union,TypeVar,Generic,NamedTuple,cast
-from ..model import Date,Text,Line,Heading,Meta,Symbol,Anchor,Block,Data,BlockHeader
-from xml.dom import Node
+from typing import Dict,List,Any,Optional,Union,TypeVar,Generic,NamedTuple,Tuple,Type,cast
+from ..model import Date,Text,Line,Heading,Meta,Symbol,Anchor,Block,Data,BlockHeader,BlockPosition
 from enum import Enum
-import dateutil.parser, collections, json
+from datetime import datetime
+import re
 
 T = TypeVar('T')
 
@@ -20,6 +20,43 @@ class InputStatus(Enum):
 	FAILURE  = 0
 	EMPTY    = -1
 
+# -----------------------------------------------------------------------------
+#
+# SPAN
+#
+# -----------------------------------------------------------------------------
+
+class Span:
+	"""A run of consecutive lines, from `start` to `end` in the `source`
+	text, that is only copied when its text is needed. An indented span
+	is made of block content lines, which lose their leading tab."""
+
+	__slots__ = ("source", "start", "end", "indented")
+
+	def __init__( self, source:str, start:int, end:int, indented:bool=False ):
+		self.source   = source
+		self.start    = start
+		self.end      = end
+		self.indented = indented
+
+	def getText( self, newline:bool=False ) -> str:
+		"""Returns the text of the span, preceded by a newline if
+		`newline` is set."""
+		start = self.start
+		# NOTE: When the source has the newline, we save a copy
+		prefixed = newline and start > 0 and self.source[start - 1] == "\n"
+		if prefixed:
+			start -= 1
+		text = self.source[start:self.end]
+		if self.indented:
+			text = text.replace("\n\t", "\n")
+			if not prefixed and text[:1] == "\t":
+				text = text[1:]
+		return "\n" + text if newline and not prefixed else text
+
+	def __str__( self ) -> str:
+		return self.getText()
+
 # -----------------------------------------------------------------------------
 #
 # BLOCK INPUT
@@ -37,14 +74,40 @@ class BlockInput(Generic[T]):
 
 	TAG:str                  = ""
 	DESCRIPTION:str          = ""
+	# The class of the block produced by `process`. When it is known, the
+	# block's name and type are known before processing, and the parser
+	# can defer the processing (see `Parser.lazy`).
+	OUTPUT:Optional[Type[Block]] = None
+	# Expensive inputs can be processed in parallel by the parser (see
+	# `Parser.executor`), in which case they are processed in another
+	# thread or process from their header and text, see `ProcessText`.
+	EXPENSIVE:bool               = False
+
+	@classmethod
+	def ProcessText( cls, header:BlockHeader, text:str ) -> T:
+		"""Creates an input of this class for the given header and input
+		text, and processes it into a block. The input's lines are not fed
+		one by one, so `onStart` and `onLine` are not called."""
+		block_input = cls()
+		block_input.header     = header
+		block_input.inputLines = [text]
+		return block_input.end()
 
 	def __init__( self ):
 		self.init()
-		self.inputLines:List[str] = []
+		self.inputLines:List[Union[str,Span]] = []
 		self.header:Optional[BlockHeader] = None
+		# The source line at which the block starts, as set by the parser
+		self.line:int = 0
+		# The start and end offsets of the block's source, from its header
+		# line, when set by the parser (see `getPosition`).
+		self.offsets:Optional[Tuple[int,int]] = None
 
 	def init( self ):
 		self.inputLines = []
+		# The input lines joined, along with the number of joined lines
+		self.inputText:Optional[str] = None
+		self.inputCount = 0
 		self.header = None
 
 	def start( self, header:BlockHeader ):
@@ -58,6 +121,15 @@ class BlockInput(Generic[T]):
 		self.onLine(line)
 		self.inputLines.append(line)
 
+	def feedText( self, text:Union[str,Span] ):
+		"""Feeds the given `text`, which might span multiple lines, as a
+		single chunk. The lines are only split when `onLine` is overridden,
+		and a span is only copied then or when the input is needed."""
+		if self.__class__.onLine is not BlockInput.onLine:
+			for line in str(text).split("\n"):
+				self.onLine(line)
+		self.inputLines.append(text)
+
 	def onStart( self, line:str ):
 		pass
 
@@ -67,8 +139,30 @@ class BlockInput(Generic[T]):
 	def onEnd( self ):
 		pass
 
+	def getPosition( self ) -> Optional[BlockPosition]:
+		"""Returns the position of the block in its source, if known."""
+		if self.header is None or self.offsets is None:
+			return None
+		return BlockPosition(self.header.name, self.header.type, self.line, self.offsets[0], self.offsets[1])
+
 	def getInputAsString( self ) -> str:
-		return "\n".join(self.inputLines)
+		"""Returns the input lines as a single text, which is memoized
+		until more lines are fed."""
+		lines = self.inputLines
+		if self.inputText is None or self.inputCount != len(lines):
+			self.inputCount = len(lines)
+			try:
+				self.inputText = "\n".join(lines)
+			except TypeError:
+				# Some of the lines are spans, which are only used for
+				# long runs of lines.
+				if len(lines) == 2 and not lines[0]:
+					# That's the most common case: a header with no text
+					# followed by content, which we get without a copy.
+					self.inputText = lines[1].getText(newline=True)
+				else:
+					self.inputText = "\n".join(str(_) for _ in lines)
+		return self.inputText
 
 	def end( self ) -> T:
 		self.onEnd()
@@ -81,7 +175,9 @@ class BlockInput(Generic[T]):
 		assert self.header
 		if self.header.name:
 			cast(Block,block).name = self.header.name
-		cast(Block,block).setAttributes(self.header.attributes)
+		# NOTE: Headers are shared between blocks, so are their attributes
+		if self.header.attributes:
+			cast(Block,block).setAttributes(dict(self.header.attributes))
 		# TODO: Set attributes
 		return block
 
@@ -93,6 +189,8 @@ class BlockInput(Generic[T]):
 
 class LineInput(BlockInput[T]):
 
+	OUTPUT = Line
+
 	def process( self ) -> T:
 		return Line(self.getInputAsString())
 
@@ -104,6 +202,8 @@ class LineInput(BlockInput[T]):
 
 class HeadingInput(LineInput[Heading]):
 
+	OUTPUT = Heading
+
 	def process( self ) -> Heading:
 		return Heading(self.getInputAsString())
 
@@ -115,6 +215,8 @@ class HeadingInput(LineInput[Heading]):
 
 class MetaInput(LineInput[Meta]):
 
+	OUTPUT = Meta
+
 	def process( self ) -> Meta:
 		return Meta(self.getInputAsString())
 
@@ -125,9 +227,80 @@ class MetaInput(LineInput[Meta]):
 # -----------------------------------------------------------------------------
 
 class DateInput(LineInput[Date]):
+	"""Parses a date. ISO-8601 dates, the formats in `FORMATS` and dates
+	with an English month name are parsed directly, anything else is
+	given to `dateutil`, which is only imported when needed."""
+
+	OUTPUT  = Date
+
+	RE_ISO  = re.compile(r"\d{4}-\d{2}-\d{2}([T ]\d{2}:\d{2}(:\d{2}(\.\d{1,6})?)?)?(Z|[+-]\d{2}:\d{2})?$")
+	# These formats are interpreted the same way by `dateutil` (which
+	# defaults to month first). They only have numbers, as the month
+	# names of `%B` depend on the locale.
+	FORMATS = (
+		"%Y/%m/%d",
+		"%m/%d/%Y",
+	)
+	# Dates with an English month name (like `dateutil`, whatever the
+	# locale), as in `February 29, 2020` and `29 February 2020`.
+	RE_MONTH_DAY_YEAR = re.compile(r"([A-Za-z]+)\s+(\d{1,2}),\s*(\d{4})$")
+	RE_DAY_MONTH_YEAR = re.compile(r"(\d{1,2})\s+([A-Za-z]+)\s+(\d{4})$")
+	MONTHS  = {_:i for i, _ in enumerate((
+		"january", "february", "march", "april", "may", "june", "july",
+		"august", "september", "october", "november", "december",
+	), 1)}
+	# Documents tend to repeat the same dates, so parsed dates are
+	# memoized, up to `CAPACITY` distinct values.
+	CAPACITY = 4096
+	PARSED:Dict[str,datetime] = {}
+
+	@classmethod
+	def ParseDate( cls, text:str ) -> datetime:
+		"""Parses the given date text, memoizing the result."""
+		parsed = cls.PARSED.get(text)
+		if parsed is None:
+			parsed = cls.ParseFixedDate(text.strip()) or cls.ParseAnyDate(text)
+			if len(cls.PARSED) >= cls.CAPACITY:
+				cls.PARSED.clear()
+			cls.PARSED[text] = parsed
+		return parsed
+
+	@classmethod
+	def ParseFixedDate( cls, text:str ) -> Optional[datetime]:
+		"""Parses the given date if it is in ISO-8601 or one of the
+		`FORMATS`, returning `None` otherwise."""
+		if cls.RE_ISO.match(text):
+			try:
+				return datetime.fromisoformat(text)
+			except ValueError:
+				return None
+		for _ in cls.FORMATS:
+			try:
+				return datetime.strptime(text, _)
+			except ValueError:
+				pass
+		match = cls.RE_MONTH_DAY_YEAR.match(text)
+		if match:
+			month, day, year = match.groups()
+		else:
+			match = cls.RE_DAY_MONTH_YEAR.match(text)
+			if not match:
+				return None
+			day, month, year = match.groups()
+		month_index = cls.MONTHS.get(month.lower())
+		try:
+			return datetime(int(year), month_index, int(day)) if month_index else None
+		except ValueError:
+			return None
+
+	@classmethod
+	def ParseAnyDate( cls, text:str ) -> datetime:
+		"""Parses the given date using `dateutil`."""
+		import dateutil.parser
+		return dateutil.parser.parse(text)
 
 	def process( self ) -> Date:
-		return Date(dateutil.parser.parse(self.getInputAsString()))
+		return Date(self.ParseDate(self.getInputAsString()))
 
 # -----------------------------------------------------------------------------
 #
@@ -137,6 +310,8 @@ class DateInput(LineInput[Date]):
 
 class SymbolInput(LineInput[Symbol]):
 
+	OUTPUT = Symbol
+
 	def process( self ) -> Symbol:
 		type_name = [_.strip() for _ in self.getInputAsString().strip().split(" ",2)]
 		type:Optional[str] = None
@@ -156,6 +331,8 @@ class SymbolInput(LineInput[Symbol]):
 
 class AnchorInput(LineInput[Anchor]):
 
+	OUTPUT = Anchor
+
 	def process( self ) -> Anchor:
 		type_name = [_.strip() for _ in self.getInputAsString().strip().split(" ",2)]
 		if len(type_name) == 1:
@@ -173,6 +350,9 @@ class AnchorInput(LineInput[Anchor]):
 
 class ListInput(LineInput[List[str]]):
 
+	# NOTE: The result is not a block, so it can't be deferred
+	OUTPUT = None
+
 	def process( self ) -> List[str]:
 		return [_ for _ in (_.strip() for _ in text.split(",")) if _]
 
@@ -184,6 +364,8 @@ class ListInput(LineInput[List[str]]):
 
 class TextInput(BlockInput[Text]):
 
+	OUTPUT = Text
+
 	def process( self ) -> Text:
 		return Text(self.getInputAsString())
 
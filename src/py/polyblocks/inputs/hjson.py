@@ -1,22 +1,19 @@
 from ..inputs import BlockInput
 from ..model  import Data
 
-try:
-	import hjson
-except ImportError as e:
-	hjson = None
-
 class HJSONInput( BlockInput[Data] ):
 
 	TAG         = "hjson"
 	DESCRIPTION = "Parses HJSON content"
 	OUTPUT      = Data
+	EXPENSIVE   = True
 
 	def init( self ):
 		super().init()
 
 	def process( self ) -> Data:
 		# TODO: Error handling
+		import hjson
 		src  = self.getInputAsString()
 		data = hjson.loads(src)
 		return Data(data, src)
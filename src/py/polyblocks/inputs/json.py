@@ -1,6 +1,6 @@
 from ..inputs import BlockInput
 from ..model  import Data
-import json
+from ..util   import JSONBackend
 
 # -----------------------------------------------------------------------------
 #
@@ -8,18 +8,19 @@ import json
 #
 # -----------------------------------------------------------------------------
 
-class JSONInput( BlockInput ):
+class JSONInput( BlockInput[Data] ):
 
 	TAG         = "json"
 	DESCRIPTION = "Parses JSON content"
 	OUTPUT      = Data
+	EXPENSIVE   = True
 
 	def init( self ):
 		super().init()
 
-	def onEnd( self ):
+	def process( self ) -> Data:
 		# TODO: Error handling
-		data = json.loads(self.getInputAsString())
+		data = JSONBackend.Get().loads(self.getInputAsString())
 		return Data(data)
 
 # EOF - vim: ts=4 sw=4 noet
@@ -1,18 +1,18 @@
 from ..inputs import BlockInput
 from ..model  import Code
 
-try:
-	import paml
-except ImportError as e:
-	paml = None
-
 class PamlInput( BlockInput ):
 
 	TAG         = "paml"
 	DESCRIPTION = "Parses PAML content"
+	EXPENSIVE   = True
 
 	def init( self ):
 		super().init()
+		try:
+			import paml
+		except ImportError as e:
+			paml = None
 		self._parser       = paml.engine.Parser() if paml else None
 
 	def onEnd( self ):
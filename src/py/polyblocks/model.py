@@ -1,8 +1,8 @@
 #!/usr/bin/env python3
 #encoding: UTF-8
-import collections
-from typing import Dict,List,Any,Optional,Union,TypeVar,Generic,NamedTuple
-from .util import xml
+import collections, sys
+from typing import Callable,Dict,List,Any,Optional,Union,TypeVar,Generic,NamedTuple
+from .util import xml, XMLStream
 
 __doc__ = """
 Defines the content elements for blocks. These elements can be exported
@@ -12,33 +12,79 @@ to XML or to JSON-encodable primitives.
 T = TypeVar('T')
 BlockAttributes = Dict[str,Any]
 BlockHeader:NamedTuple = collections.namedtuple('Header', 'name type processors attributes text')
+# NOTE: Headers are pickled when blocks are processed in worker processes,
+# which requires their qualified name to be found in this module.
+BlockHeader.__qualname__ = "BlockHeader"
+# The position of a block in its source: the name and type from its header,
+# the line of its header, and the offsets of its source in the parsed buffer
+# (bytes for a file, characters for a text).
+BlockPosition:NamedTuple = collections.namedtuple('BlockPosition', 'name type line start end')
 
+class EmptyAttributes(dict):
+	"""The attributes of a block that has none. There is only one instance,
+	`EMPTY_ATTRIBUTES`, which is read-only and shared by all the blocks."""
+
+	__slots__ = ()
+
+	def _readonly( self, *args, **kwargs ):
+		raise TypeError("Empty attributes are read-only, use `Block.setAttributes` instead")
+
+	__setitem__ = __delitem__ = __ior__ = _readonly
+	setdefault  = pop = popitem = clear = update = _readonly
+
+	def __reduce__( self ):
+		# NOTE: This pickles as a reference to the shared instance
+		return "EMPTY_ATTRIBUTES"
+
+EMPTY_ATTRIBUTES = EmptyAttributes()
+
+# NOTE: There can be millions of blocks, so they have no `__dict__`. The
+# subclasses need to declare their `__slots__` as well.
 class Block(Generic[T]):
 
+	__slots__ = ("name", "type", "value", "attributes")
+
 	NAME = "block"
+	# The default type is the lowercase class name, see `__init_subclass__`
+	TYPE = "block"
+
+	def __init_subclass__( cls, **kwargs ):
+		super().__init_subclass__(**kwargs)
+		# NOTE: The type is interned once, so that blocks share it
+		if "TYPE" not in cls.__dict__:
+			cls.TYPE = sys.intern(cls.__name__.rsplit(".",1)[-1].lower())
 
 	def __init__( self, value:T ):
 		self.name:str = self.NAME
-		self.type:str = self.__class__.__name__.rsplit(".",1)[-1].lower()
+		self.type:str = self.TYPE
 		self.value    = value
-		self.attributes:BlockAttributes = {}
+		self.attributes:BlockAttributes = EMPTY_ATTRIBUTES
 
 	def setAttributes( self, attributes:BlockAttributes ):
-		self.attributes = attributes
+		self.attributes = attributes or EMPTY_ATTRIBUTES
 		return self
 
 	def toXML( self, document:Any ):
 		pass
 
+	def writeXML( self, stream:XMLStream ):
+		"""Writes the block to the given XML stream, which by default
+		writes the node created by `toXML`."""
+		node = self.toXML(stream.document)
+		assert node, f"Block did not produce any XML output: {self}"
+		stream.writeNode(node)
+
 	def toPrimitive( self ):
 		pass
 
 class Document(Block):
 
+	__slots__ = ()
 	NAME = "document"
 
 class Date(Block):
 
+	__slots__ = ()
 	NAME = "date"
 
 	def toXML( self, document ):
@@ -52,6 +98,18 @@ class Date(Block):
 			second = d.second,
 		))
 
+	def writeXML( self, stream:XMLStream ):
+		d = self.value
+		stream.startElement(self.name, (
+			("year",   str(d.year)),
+			("month",  str(d.month)),
+			("day",    str(d.day)),
+			("hour",   str(d.hour)),
+			("minute", str(d.minute)),
+			("second", str(d.second)),
+		))
+		stream.endElement()
+
 	def toPrimitive( self ):
 		# TODO: Add time zone information
 		d = self.value
@@ -62,6 +120,7 @@ class Date(Block):
 
 class Symbol(Block):
 
+	__slots__ = ()
 	NAME = "symbol"
 
 	def __init__( self, name:str, type:Optional[str]=None ):
@@ -74,6 +133,14 @@ class Symbol(Block):
 			type   = d["type"],
 		))
 
+	def writeXML( self, stream:XMLStream ):
+		d = self.value
+		stream.startElement(self.name, (
+			("name", str(d["name"])),
+			("type", str(d["type"])),
+		))
+		stream.endElement()
+
 	def toPrimitive( self ):
 		res = {}
 		res.update(self.attributes)
@@ -82,23 +149,32 @@ class Symbol(Block):
 
 class Anchor(Symbol):
 
+	__slots__ = ()
 	NAME = "anchor"
 
 class Meta(Block):
 
+	__slots__ = ()
 	NAME = "meta"
 
 	def toXML( self, document ):
 		# TODO: Implement
 		return xml(document, self.name, self.attributes)
 
+	def writeXML( self, stream:XMLStream ):
+		stream.element(self.name, self.attributes)
+
 class Text(Block):
 
+	__slots__ = ()
 	NAME = "text"
 
 	def toXML( self, document ):
 		return xml(document, self.name, self.attributes, self.value)
 
+	def writeXML( self, stream:XMLStream ):
+		stream.element(self.name, self.attributes, self.value)
+
 	def toPrimitive( self ):
 		res = {}
 		res.update(self.attributes)
@@ -107,18 +183,22 @@ class Text(Block):
 
 class Line(Text):
 
+	__slots__ = ()
 	NAME = "line"
 
 class Heading(Text):
 
+	__slots__ = ()
 	NAME = "heading"
 
 class Code(Text):
 
+	__slots__ = ()
 	NAME = "code"
 
 class Data(Block[Any]):
 
+	__slots__ = ("source",)
 	NAME = "data"
 
 	def __init__( self, value:Any, source:Optional[str]=None ):
@@ -131,6 +211,16 @@ class Data(Block[Any]):
 		val = xml(document, "data", self.value)
 		return xml(document, self.name or self.NAME, self.attributes, src, val)
 
+	def writeXML( self, stream:XMLStream ):
+		# NOTE: This is the same as `toXML`, where the source and data
+		# are children of the element, after its attributes' elements.
+		stream.startElement(self.name or self.NAME, stream.getAttributes((self.attributes,)))
+		stream.content(self.attributes)
+		if self.source:
+			stream.element("source", self.source)
+		stream.element("data", self.value)
+		stream.endElement()
+
 	def toPrimitive( self ):
 		res = {}
 		res.update(self.attributes)
@@ -139,13 +229,75 @@ class Data(Block[Any]):
 		res["data"]   = self.value
 		return res
 
+class LazyBlock(Block):
+	"""Stands for a block that is not processed yet. Its name, type and
+	attributes are known from the block header, while its value (and
+	the actual block) are only computed when first accessed."""
+
+	__slots__ = ("header", "_compute", "_block")
+
+	def __init__( self, header:BlockHeader, output:type, compute:Callable[[],Block] ):
+		# NOTE: We don't call the super constructor as `value` is a property
+		self.name:str = header.name or output.NAME
+		self.type:str = output.TYPE
+		self.attributes:BlockAttributes = dict(header.attributes) if header.attributes else EMPTY_ATTRIBUTES
+		self.header   = header
+		self._compute:Optional[Callable[[],Block]] = compute
+		self._block:Optional[Block] = None
+
+	@property
+	def isEvaluated( self ) -> bool:
+		return self._block is not None
+
+	@property
+	def block( self ) -> Block:
+		"""Returns the actual block, processing it on first access."""
+		if self._block is None:
+			assert self._compute
+			block = self._compute()
+			# NOTE: The handle's name and attributes might have been
+			# changed before the block was processed.
+			block.name       = self.name
+			block.attributes = self.attributes
+			self._block   = block
+			self._compute = None
+		return self._block
+
+	@property
+	def value( self ) -> Any:
+		return self.block.value
+
+	def setAttributes( self, attributes:BlockAttributes ):
+		self.attributes = attributes or EMPTY_ATTRIBUTES
+		if self._block is not None:
+			self._block.attributes = self.attributes
+		return self
+
+	def toXML( self, document:Any ):
+		return self.block.toXML(document)
+
+	def writeXML( self, stream:XMLStream ):
+		self.block.writeXML(stream)
+
+	def toPrimitive( self ):
+		return self.block.toPrimitive()
+
+	def __getattr__( self, name:str ):
+		# Any other attribute (eg. `Data.source`) comes from the block
+		if name.startswith("_"):
+			raise AttributeError(name)
+		return getattr(self.block, name)
+
+# NOTE: `XMLTree` and `Collection` used to have a `name` class attribute,
+# which their instances' `name` shadowed, so their blocks are named `block`.
+# A `name` class attribute would now conflict with the `name` slot.
 class XMLTree(Block):
 
-	name = "xml"
+	__slots__ = ()
 
 class Collection(Block):
 
-	name = "collection"
+	__slots__ = ()
 
 	# TODO: Can be used to store code and its transpiled versions, we might
 	# want to name this differently.
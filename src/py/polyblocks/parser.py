@@ -1,18 +1,18 @@
 #!/usr/bin/env python3
 #encoding: UTF-8
-from .model  import Block
-from .inputs import BlockHeader,BlockInput,DateInput,ListInput,TextInput,CodeInput,HeadingInput,MetaInput,SymbolInput,AnchorInput
-from .inputs.paml  import PamlInput
-from .inputs.hjson import HJSONInput
-from .inputs.json  import JSONInput
+from .model  import Block,LazyBlock,EMPTY_ATTRIBUTES
+from .inputs import Span,BlockHeader,BlockInput,DateInput,ListInput,TextInput,CodeInput,HeadingInput,MetaInput,SymbolInput,AnchorInput
 from .util   import Cache
-from typing  import Optional,List,Iterable,Dict,NamedTuple,Any,Type
-import re,collections
+from typing  import Deque,FrozenSet,Set,Optional,List,Iterable,Iterator,Dict,Tuple,NamedTuple,Any,Type,Union,Callable
+import os,re,sys,time,mmap,collections,bisect,itertools,functools,importlib,hashlib
 
 __doc__ = """
 Defines the Polyblocks parser classes.
 """
 
+# The parsers can scan either text or the (memory-mapped) bytes of a file
+Buffer = Union[str,bytes,mmap.mmap]
+
 # -----------------------------------------------------------------------------
 #
 # MAPPING
@@ -21,8 +21,24 @@ Defines the Polyblocks parser classes.
 
 #@symbol polyblocks.parser.Mapping
 class Mapping:
+	"""Maps the block header names (tags) and types to their block input
+	class. Other packages can register their block types and tags using
+	the `polyblocks.types` and `polyblocks.tags` entry point groups, for
+	instance:
+
+	```
+	[project.entry-points."polyblocks.types"]
+	markdown = "polyblocks_markdown:MarkdownInput"
+	[project.entry-points."polyblocks.tags"]
+	md       = "markdown"
+	```
+
+	The entry points are only read when a header is not resolved by the
+	built-in types and tags, and the modules of the block input classes
+	are only imported when a header uses them."""
 
-	TAGS = {
+	# Maps the tags to their type
+	TAGS:Dict[str,str] = {
 		"title"    : "heading",
 		"subtitle" : "heading",
 		"date"     : "date",
@@ -46,7 +62,9 @@ class Mapping:
 		"anchor"   : "meta",
 	}
 
-	TYPES = {
+	# Maps the types to their block input class, which can be given as a
+	# `module:Class` reference so that the module is imported on first use.
+	TYPES:Dict[str,Union[Type[BlockInput],str]] = {
 		"date"      : DateInput,
 		"list"      : ListInput,
 		"text"      : TextInput,
@@ -56,9 +74,9 @@ class Mapping:
 		"anchor"    : AnchorInput,
 		# --
 		"texto"     : CodeInput,
-		"hjson"     : HJSONInput,
-		"json"      : JSONInput,
-		# "paml"      : PamlInput,
+		"hjson"     : "polyblocks.inputs.hjson:HJSONInput",
+		"json"      : "polyblocks.inputs.json:JSONInput",
+		# "paml"      : "polyblocks.inputs.paml:PamlInput",
 		# "pcss"      : PCSSInput,
 		# "texto"     : TextoInput,
 		# "sugar"     : SugarInput,
@@ -67,21 +85,237 @@ class Mapping:
 		# "xml"       : XMLInput,
 	}
 
+	# The entry point groups for the types and tags of other packages
+	ENTRY_POINTS_TYPES = "polyblocks.types"
+	ENTRY_POINTS_TAGS  = "polyblocks.tags"
+
 	def __init__( self ):
-		pass
+		self.tags:Dict[str,str] = dict(self.TAGS)
+		self.types:Dict[str,Union[Type[BlockInput],str]] = dict(self.TYPES)
+		# Maps `(name, type)` header pairs to their block input class,
+		# as they are resolved.
+		self.resolved:Dict[Tuple[Optional[str],str],Optional[Type[BlockInput]]] = {}
+		self.hasEntryPoints = False
+
+	def register( self, type:str, inputClass:Union[Type[BlockInput],str], tags:Iterable[str]=() ):
+		"""Registers the given block input class (or `module:Class`
+		reference) for the given type, and the given tags for the type."""
+		self.types[type] = inputClass
+		for _ in tags:
+			self.tags[_] = type
+		self.resolved.clear()
+
+	def loadEntryPoints( self ):
+		"""Registers the types and tags declared by the entry points of the
+		installed packages, unless they are already defined. This is only
+		done once."""
+		if self.hasEntryPoints:
+			return
+		self.hasEntryPoints = True
+		from importlib.metadata import entry_points
+		for group, registry in ((self.ENTRY_POINTS_TYPES, self.types), (self.ENTRY_POINTS_TAGS, self.tags)):
+			try:
+				points = entry_points(group=group)
+			except TypeError:
+				# NOTE: Before Python 3.10, entry points are grouped in a dict
+				points = entry_points().get(group, ())
+			for _ in points:
+				registry.setdefault(_.name, _.value)
+		self.resolved.clear()
+
+	def resolve( self, name:Optional[str], type:str ) -> Optional[Type[BlockInput]]:
+		"""Returns the block input class for the given header `name` and
+		`type`, taking into account that some headers have an implicit
+		type (eg, `@title` which means `@title:heading`)."""
+		key = (name, type)
+		if key not in self.resolved:
+			block_input = None
+			if not name and not self.getInputForType(type):
+				block_input = self.getInputForName(type)
+			block_input = block_input or self.getInputForName(name) or self.getInputForType(type)
+			if not block_input and not self.hasEntryPoints:
+				self.loadEntryPoints()
+				return self.resolve(name, type)
+			self.resolved[key] = block_input
+		return self.resolved[key]
 
 	def getInputForType( self, name:str ) -> Optional[Type[BlockInput]]:
-		return self.TYPES.get(name)
+		block_input = self.types.get(name)
+		if isinstance(block_input, str):
+			# The block input is given as a `module:Class` reference, which
+			# we import on first use.
+			module, _, symbol = block_input.partition(":")
+			value:Any = importlib.import_module(module)
+			for _ in symbol.split("."):
+				value = getattr(value, _)
+			block_input = self.types[name] = value
+		return block_input
 
 	def getInputForName( self, name:str ) -> Optional[Type[BlockInput]]:
-		if name in self.TAGS:
-			return self.getInputForType(self.TAGS[name])
+		if name in self.tags:
+			return self.getInputForType(self.tags[name])
 		else:
-			self.TYPES.get(name)
+			self.types.get(name)
 
 	def getInputForHeader( self, header:'BlockHeader' ) -> Optional[Type[BlockInput]]:
 		return self.getInputForName(header.name) or self.getInputForType(header.type)
 
+	def getHeaderNameAndType( self, header:'BlockHeader' ) -> Tuple[Optional[str],str]:
+		"""Returns the name and type of the given header, taking into account
+		the implicit types like in `resolve` (eg, `@title` is named `title`
+		and has the `heading` type)."""
+		if header.name or header.type in self.types:
+			return header.name, header.type
+		else:
+			return header.type, self.tags.get(header.type, header.type)
+
+# -----------------------------------------------------------------------------
+#
+# PARSE RESULT
+#
+# -----------------------------------------------------------------------------
+
+#@symbol polyblocks.parser.ParseResult
+class ParseResult:
+	"""The result of `Parser.parseDocument`, which keeps the source lines
+	along with the blocks and the range of source lines each block was
+	parsed from, so that the document can be reparsed incrementally
+	with `Parser.reparse`."""
+
+	def __init__( self, path:Optional[str], lines:List[str] ):
+		self.path = path
+		self.lines:List[str]  = lines
+		self.blocks:List[Block] = []
+		# The `(start, end)` source lines of each block, `end` excluded.
+		self.ranges:List[Tuple[int,int]] = []
+
+	@property
+	def starts( self ) -> List[int]:
+		return [_[0] for _ in self.ranges]
+
+	def __len__( self ):
+		return len(self.blocks)
+
+	def __iter__( self ):
+		return iter(self.blocks)
+
+	def __getitem__( self, index:int ) -> Block:
+		return self.blocks[index]
+
+# -----------------------------------------------------------------------------
+#
+# SELECTION
+#
+# -----------------------------------------------------------------------------
+
+#@symbol polyblocks.parser.Selector
+class Selector:
+	"""Selects blocks by `type`, `name` and attributes. Each criterion
+	is a value or a collection of values, one of which must match, or
+	`True` for any value. All the criteria must match. The name and
+	type match either the block's or its header's, so that `@title`
+	blocks match `name=title` even though their block is a heading."""
+
+	def __init__( self, **criteria:Any ):
+		# Maps each criterion to its set of values, `None` matching any
+		self.criteria:Dict[str,Optional[FrozenSet[str]]] = {}
+		for key, value in criteria.items():
+			if value is True or value is None:
+				self.criteria[key] = None
+			else:
+				self.criteria[key] = frozenset((value,) if isinstance(value, str) else value)
+
+	@classmethod
+	def Parse( cls, expressions:Iterable[str] ) -> 'Selector':
+		"""Returns the selector for the given `KEY=VALUE` or `KEY`
+		expressions (as given to `--select`). Values for the same key
+		are alternatives."""
+		criteria:Dict[str,Any] = {}
+		for expression in expressions:
+			key, sep, value = expression.partition("=")
+			key = key.strip()
+			if not sep or criteria.get(key, ()) is True:
+				criteria[key] = True
+			else:
+				criteria[key] = criteria.get(key, ()) + (value.strip(),)
+		return cls(**criteria)
+
+	def match( self, names:Iterable[Optional[str]], types:Iterable[str], attributes:Dict[str,Any] ) -> bool:
+		"""Tells if a block with any of the given names and types and with
+		the given attributes matches."""
+		for key, values in self.criteria.items():
+			if key == "name" or key == "type":
+				if values is not None and values.isdisjoint(names if key == "name" else types):
+					return False
+			elif key not in attributes:
+				return False
+			elif values is not None and str(attributes[key]) not in values:
+				return False
+		return True
+
+	def __repr__( self ) -> str:
+		return f"Selector({self.criteria!r})"
+
+#@symbol polyblocks.parser.BlockIndex
+class BlockIndex:
+	"""A list of blocks indexed by type, name and attribute, as they are
+	added, so that they can be selected without going through all of
+	them. See `Parser.indexPath`."""
+
+	def __init__( self, path:Optional[str]=None ):
+		self.path = path
+		self.blocks:List[Block] = []
+		# The names and types of each block, see `Selector.match`
+		self.keys:List[Tuple[Tuple[str,...],Tuple[str,...]]] = []
+		# Each index maps a name, type or attribute name to the indices of
+		# the blocks that have it.
+		self.byName:Dict[str,List[int]]            = {}
+		self.byType:Dict[str,List[int]]            = {}
+		self.byAttribute:Dict[str,List[int]]       = {}
+
+	def add( self, block:Block, names:Iterable[Optional[str]]=(), types:Iterable[str]=() ) -> Block:
+		"""Adds the given block, which can also be found by the given names
+		and types (typically the ones of its header)."""
+		i     = len(self.blocks)
+		names = tuple(set(_ for _ in itertools.chain((block.name,), names) if _))
+		types = tuple(set(_ for _ in itertools.chain((block.type,), types) if _))
+		self.blocks.append(block)
+		self.keys.append((names, types))
+		for _ in names:
+			self.byName.setdefault(_, []).append(i)
+		for _ in types:
+			self.byType.setdefault(_, []).append(i)
+		for _ in block.attributes:
+			self.byAttribute.setdefault(_, []).append(i)
+		return block
+
+	def select( self, selector:Optional[Selector]=None, **criteria:Any ) -> List[Block]:
+		"""Returns the blocks that match the given selector, or the selector
+		for the given criteria (see `Selector`), in order."""
+		selector = selector or Selector(**criteria)
+		# We start from the smallest list of candidates given by the indexes
+		candidates:Optional[Set[int]] = None
+		for key, values in selector.criteria.items():
+			if key == "name" or key == "type":
+				if values is None:
+					continue
+				index = self.byName if key == "name" else self.byType
+				found = set(i for _ in values for i in index.get(_, ()))
+			else:
+				found = set(self.byAttribute.get(key, ()))
+			candidates = found if candidates is None or len(found) < len(candidates) else candidates
+		indices = range(len(self.blocks)) if candidates is None else sorted(candidates)
+		return [self.blocks[i] for i in indices if selector.match(self.keys[i][0], self.keys[i][1], self.blocks[i].attributes)]
+
+	def __len__( self ):
+		return len(self.blocks)
+
+	def __iter__( self ):
+		return iter(self.blocks)
+
+	def __getitem__( self, index:int ) -> Block:
+		return self.blocks[index]
+
 # -----------------------------------------------------------------------------
 #
 # PARSER
@@ -98,11 +332,46 @@ class Parser:
 	RE_HEADER   = re.compile("^@(\w+)(:(\w+))?(\|[\w\-_]+(,[\w\-_]+)?)?(\s+(.*))?\s*$")
 	RE_CONTENT  = re.compile("^(\t(.*)|\s*)$")
 	RE_COMMENT  = re.compile("^#(.*)$")
+	# When scanning a whole buffer, headers and comments are the only lines
+	# starting with `@` or `#`, the lines in between form content runs. Both
+	# expressions start with a newline, which makes the search much faster.
+	RE_BOUNDARY  = re.compile("\n[@#][^\n]*")
+	RE_BOUNDARY_BYTES = re.compile(b"\n[@#][^\n]*")
+	# Matches a line of a content run that is neither tab-indented nor
+	# empty, in which case the run can't be unindented in one go.
+	RE_RUN_OTHER = re.compile("\n[^\t\n]")
+	# Runs shorter than this are copied right away, as this is cheaper than
+	# keeping them as spans.
+	SPAN_MIN     = 4096
 
-	def __init__( self ):
-		# We keep a list of block inputs as well as a current
-		# block input. Lines will be fed to the block inputs
-		# and then the blocks will be created from the contents.
+	# Block inputs that are not expensive are only memoized in the cache
+	# when their text is at least that long, as the cache key, pickle and
+	# disk entry cost more than processing a short text again.
+	CACHE_MIN       = 16384
+
+	# Expensive block inputs with a text shorter than this are processed
+	# inline, as they are not worth sending to the executor.
+	PARALLEL_MIN    = 16384
+	# The maximum number of blocks waiting for their predecessors to be
+	# processed, which bounds the memory used by parallel processing.
+	PARALLEL_WINDOW = 256
+
+	# The encoding of the files given to `parsePath`
+	ENCODING = "utf8"
+
+	# The index of a file is only found by its modification time once the
+	# file is older than that (in seconds), see `readBlock`.
+	INDEX_DELAY = 2.0
+
+	# The number of distinct header lines for which the parsed header
+	# and its block input class are memoized.
+	HEADERS_CAPACITY = 4096
+
+	def __init__( self, useCache:bool=True, lazy:bool=False, executor:Optional[Any]=None, mapFiles:bool=True ):
+		# We keep the current block input as well as the list of block
+		# inputs that are complete but have not produced their block yet.
+		# Lines will be fed to the block inputs and then the blocks
+		# will be created from the contents.
 		self.blockInput:Optional[BlockInput] = None
 		self.blockInputs:List[BlockInput] = []
 		# That's the path currently being parsed
@@ -111,9 +380,23 @@ class Parser:
 		self.line                  = 0
 		# The cache prevents from having to process the same input
 		# twice.
-		self.cache                 = Cache.Ensure()
+		self.cache:Optional[Cache] = Cache.Ensure() if useCache else None
+		# When lazy, the blocks are processed only when their value
+		# is accessed, see `LazyBlock`.
+		self.lazy                  = lazy
+		# The executor (a `concurrent.futures` thread or process pool) in
+		# which the expensive block inputs are processed, see
+		# `BlockInput.EXPENSIVE`. This has no effect when lazy.
+		self.executor              = executor
+		# Files are memory-mapped unless they might be truncated while
+		# they are parsed (like the files being edited in watch mode), as
+		# reading a truncated mapping raises SIGBUS, see `_mapPath`.
+		self.mapFiles              = mapFiles
 		# The mapping defines the available block names and types
 		self.mapping               = Mapping()
+		# Documents tend to repeat the same headers over and over (especially
+		# the `@embed` headers in embedded mode), so we memoize them.
+		self.resolveHeaderLine     = functools.lru_cache(maxsize=self.HEADERS_CAPACITY)(self._resolveHeaderLine)
 
 		# TODO: Is this used at all?
 		self.lines:List[str]       = []
@@ -122,20 +405,316 @@ class Parser:
 	def parseText( self, text:str, path:Optional[str]=None ) -> List[Block]:
 		"""Parses the given `text`, loaded from the given `path` (optional).
 		The text is going to be split into lines and fed to  `parseLines`."""
-		return self.parseLines(text.split("\n"), path)
+		return list(self.iterText(text, path))
 
 	def parsePath( self, path:str ) -> List[Block]:
 		"""Parses the text at the given `path`."""
-		with open(path, "rt") as f:
-			return self.parseLines(f.readlines(), path)
+		return list(self.iterPath(path))
 
 	def parseLines( self, lines:Iterable[str], path:Optional[str] ) -> List[Block]:
 		"""Parses the given `lines`, coming from a file at the given
 		`path`."""
+		return list(self.iterLines(lines, path))
+
+	def iterText( self, text:str, path:Optional[str]=None ) -> Iterator[Block]:
+		"""Like `parseText`, but yields the blocks as they are parsed.
+
+		Instead of dispatching each line, the whole text is scanned for
+		header and comment lines, and the content runs in between are
+		given to the current block as a single slice. This produces
+		the same blocks as `iterLines(text.split("\\n"))`."""
+		return self._iterBlocks(self.iterTextInputs(text, path))
+
+	def iterPath( self, path:str ) -> Iterator[Block]:
+		"""Like `parsePath`, but yields the blocks as they are parsed.
+
+		The file is memory-mapped and scanned like in `iterText`, only
+		the header, comment and content slices are decoded."""
+		return self._iterBlocks(self.iterPathInputs(path))
+
+	def iterTextInputs( self, text:str, path:Optional[str]=None ) -> Iterator[BlockInput]:
+		"""Like `iterText`, but yields the block inputs as soon as they
+		are complete, before they produce their block."""
+		return self._iterScan(text, len(text), path)
+
+	def iterPathInputs( self, path:str ) -> Iterator[BlockInput]:
+		"""Like `iterPath`, but yields the block inputs as soon as they
+		are complete, before they produce their block."""
+		buffer = self._mapPath(path)
+		if buffer is None:
+			with open(path, "rt", encoding=self.ENCODING) as f:
+				text = f.read()
+			buffer = text
+		return self._iterBufferInputs(buffer, path)
+
+	def iterLines( self, lines:Iterable[str], path:Optional[str] ) -> Iterator[Block]:
+		"""Like `parseLines`, but yields each block as soon as the next
+		block header is encountered. Block inputs are released once their
+		block is produced, so that memory is proportional to the largest
+		block rather than to the whole input."""
+		return self._iterBlocks(self.iterInputs(lines, path))
+
+	def iterInputs( self, lines:Iterable[str], path:Optional[str], line:int=0 ) -> Iterator[BlockInput]:
+		"""Yields the block inputs for the given `lines` as soon as they
+		are complete, before they produce their block. The lines are
+		numbered starting at `line`."""
 		self.onStart(path)
+		self.line = line
 		for line in lines:
 			self.onLine(line)
-		return self.onEnd()
+			yield from self._iterCompleteInputs()
+		self.onEnd()
+		yield from self._iterCompleteInputs()
+
+	# =========================================================================
+	# SELECTION
+	# =========================================================================
+
+	def indexPath( self, path:str, selector:Optional[Selector]=None ) -> BlockIndex:
+		"""Parses the file at the given path into an index of its blocks,
+		only keeping (and processing) the blocks that match the given
+		selector, if any."""
+		return self.indexInputs(self.iterPathInputs(path), path, selector)
+
+	def indexText( self, text:str, path:Optional[str]=None, selector:Optional[Selector]=None ) -> BlockIndex:
+		"""Like `indexPath`, for the given text."""
+		return self.indexInputs(self.iterTextInputs(text, path), path, selector)
+
+	def indexInputs( self, inputs:Iterable[BlockInput], path:Optional[str]=None, selector:Optional[Selector]=None ) -> BlockIndex:
+		"""Returns the index of the blocks produced by the given inputs,
+		see `indexPath`."""
+		index = BlockIndex(path)
+		for block, header in self._iterSelected(inputs, selector or Selector()):
+			if header:
+				name, type = self.mapping.getHeaderNameAndType(header)
+				index.add(block, (name,), (type,))
+			else:
+				index.add(block)
+		return index
+
+	def iterSelected( self, inputs:Iterable[BlockInput], selector:Selector ) -> Iterator[Block]:
+		"""Yields the blocks produced by the given inputs that match the
+		given selector. Inputs that can't match given their header and
+		output (see `BlockInput.OUTPUT`) are not even processed."""
+		for block, _ in self._iterSelected(inputs, selector):
+			yield block
+
+	def _iterSelected( self, inputs:Iterable[BlockInput], selector:Selector ) -> Iterator[Tuple[Block,Optional[BlockHeader]]]:
+		"""Yields the blocks that match the selector along with their
+		header, see `iterSelected`."""
+		# The header of each candidate input, and whether it matches (or
+		# `None` if it is only known once the block is processed). Blocks
+		# are produced in the same order as their inputs.
+		candidates:Deque[Tuple[Optional[BlockHeader],Optional[bool]]] = collections.deque()
+		def iter_candidates() -> Iterator[BlockInput]:
+			for block_input in inputs:
+				matched = self._matchInput(block_input, selector)
+				if matched is not False:
+					candidates.append((block_input.header, matched))
+					yield block_input
+		for block in self._iterBlocks(iter_candidates()):
+			header, matched = candidates.popleft()
+			if matched is None:
+				name, type = self.mapping.getHeaderNameAndType(header) if header else (None, None)
+				matched = selector.match((name, block.name), (type, block.type), block.attributes)
+			if matched:
+				yield block, header
+
+	def _matchInput( self, blockInput:BlockInput, selector:Selector ) -> Optional[bool]:
+		"""Tells if the block of the given input matches the selector, or
+		`None` if this is only known once the block is processed."""
+		header = blockInput.header
+		output = blockInput.OUTPUT
+		if not selector.criteria:
+			return True
+		elif not header:
+			return None
+		name, type = self.mapping.getHeaderNameAndType(header)
+		if output:
+			# NOTE: Like in `LazyBlock`, the name and type of the block
+			# are known from its header and output.
+			return selector.match((name, header.name or output.NAME), (type, output.TYPE), header.attributes)
+		else:
+			return True if selector.match((name,), (type,), header.attributes) else None
+
+	# =========================================================================
+	# RANDOM ACCESS
+	# =========================================================================
+
+	def readBlock( self, path:str, name:str ) -> Optional[Block]:
+		"""Returns the first block with the given name (as in `@NAME:TYPE`)
+		in the file at the given path, or `None`. When the parser has a
+		cache, the positions of the blocks are indexed in the cache, so
+		that once the index exists, only the source of the block is decoded
+		and parsed. The index maps the name of each named block to its
+		`(line, start, end)` position. It is found by the file's path,
+		modification time and size, and otherwise by the file's hash, so
+		that a file is only hashed when it is new, changed or touched."""
+		stat   = os.stat(path) if self.cache else None
+		buffer = self._mapPath(path) if self.cache else None
+		if not isinstance(buffer, mmap.mmap):
+			for block_input in self.iterPathInputs(path):
+				if block_input.header and block_input.header.name == name:
+					return self.onBlockEnd(block_input)
+			return None
+		# NOTE: The block is processed (even if the parser is lazy) before
+		# the buffer is closed, as its input might refer to the buffer.
+		try:
+			found = self._readBufferInput(path, name, buffer, stat)
+			return self.processInput(found) if found else None
+		finally:
+			buffer.close()
+
+	def _readBufferInput( self, path:str, name:str, buffer:Buffer, stat:os.stat_result ) -> Optional[BlockInput]:
+		"""Returns the input of the first block with the given name in the
+		given buffer, which holds the file at the given path, using (or
+		creating) its index, see `readBlock`."""
+		assert self.cache
+		context = ("index", self.__class__.__name__)
+		# NOTE: The index is only found by the modification time once the
+		# file is old enough, as an edit made within the same clock tick
+		# would not change it.
+		stat_key:Optional[str] = None
+		if time.time() - stat.st_mtime >= self.INDEX_DELAY:
+			stat_key = self.cache.key("", *context, os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+			index    = self.cache.get(stat_key)
+			if index is not None:
+				is_valid, found = self._readIndexedInput(path, name, buffer, index)
+				if is_valid:
+					return found
+		# NOTE: The file is hashed rather than parsed, which is much faster
+		hash_key = self.cache.key("", *context, hashlib.sha256(buffer).hexdigest())
+		index    = self.cache.get(hash_key)
+		if index is None:
+			return self._indexBufferInputs(path, name, buffer, (stat_key, hash_key))
+		# The file was touched (or is too recent), but has the same content
+		if stat_key:
+			self.cache.set(stat_key, index)
+		return self._readIndexedInput(path, name, buffer, index)[1]
+
+	def _readIndexedInput( self, path:str, name:str, buffer:Buffer, index:Dict[str,Tuple[int,int,int]] ) -> Tuple[bool,Optional[BlockInput]]:
+		"""Returns whether the given index matches the buffer, along with the
+		input of the block with the given name at its indexed position. The
+		index does not match when there is no block with that name there,
+		which happens when the file changed without changing its size nor
+		its modification time."""
+		if name not in index:
+			return True, None
+		line, start, end = index[name]
+		try:
+			text = str(buffer[start:end], self.ENCODING)
+		except UnicodeDecodeError:
+			return False, None
+		for block_input in self.iterTextInputs(text, path):
+			if not (block_input.header and block_input.header.name == name):
+				break
+			block_input.line    = line
+			block_input.offsets = (start, end)
+			return True, block_input
+		return False, None
+
+	def _indexBufferInputs( self, path:str, name:str, buffer:Buffer, keys:Iterable[Optional[str]] ) -> Optional[BlockInput]:
+		"""Like `_readBufferInput`, but scans the whole buffer and saves the
+		index of its block positions in the cache with the given keys."""
+		assert self.cache
+		found:Optional[BlockInput] = None
+		index:Optional[Dict[str,Tuple[int,int,int]]] = {}
+		for block_input in self._iterBufferInputs(buffer, path):
+			position = block_input.getPosition()
+			if position is None:
+				# NOTE: The positions are only known when the buffer is
+				# scanned, rather than rewritten line by line.
+				index = None
+			elif index is not None and position.name and position.name not in index:
+				index[position.name] = (position.line, position.start, position.end)
+			if not found and block_input.header and block_input.header.name == name:
+				found = block_input
+		if index is not None:
+			for key in keys:
+				if key:
+					self.cache.set(key, index)
+		return found
+
+	# =========================================================================
+	# INCREMENTAL PARSING
+	# =========================================================================
+
+	def parseDocument( self, text:str, path:Optional[str]=None ) -> ParseResult:
+		"""Parses the given `text` like `parseText`, but returns a parse
+		result that keeps track of the source lines of each block, so that
+		it can be given to `reparse`."""
+		result = ParseResult(path, text.split("\n"))
+		for block, block_range in self._parseRegion(result.lines, 0, len(result.lines), path):
+			result.blocks.append(block)
+			result.ranges.append(block_range)
+		return result
+
+	def reparse( self, previous:ParseResult, start:int, end:int, lines:List[str] ) -> Tuple[ParseResult,List[int]]:
+		"""Reparses the `previous` result after its source lines from `start`
+		to `end` (excluded) have been replaced by the given `lines`. Only
+		the blocks affected by the edit are processed again, the others are
+		reused as-is. Returns the new result along with the indices of
+		the blocks that changed. An edit that empties the document leaves
+		a single empty line, like `parseDocument("")`."""
+		# NOTE: The region then ends after all the blocks, so `delta` is
+		# not used on the empty source.
+		source = previous.lines[:start] + lines + previous.lines[end:] or [""]
+		delta  = len(lines) - (end - start)
+		starts = previous.starts
+		# The edit might add content lines to the block that contains
+		# the line before it, so that's where the region to reparse starts.
+		first  = bisect.bisect_right(starts, start - 1) - 1
+		if first < 0:
+			first, region_start = 0, 0
+		else:
+			region_start = starts[first]
+		# The region ends at the next block that starts after the edit,
+		# provided that block would be parsed the same way.
+		last   = bisect.bisect_left(starts, end)
+		while True:
+			region_end = starts[last] + delta if last < len(starts) else len(source)
+			region     = list(self._parseRegion(source, region_start, region_end, previous.path))
+			if last >= len(starts) or self._isStableBoundary(source, region_end):
+				break
+			last += 1
+		result = ParseResult(previous.path, source)
+		result.blocks = previous.blocks[:first]
+		result.ranges = previous.ranges[:first]
+		changed:List[int] = []
+		for i, (block, block_range) in enumerate(region):
+			# Blocks that have the exact same source lines as before are reused
+			j = first + i
+			if j < last and block_range[1] - block_range[0] == previous.ranges[j][1] - previous.ranges[j][0] \
+			and source[block_range[0]:block_range[1]] == previous.lines[previous.ranges[j][0]:previous.ranges[j][1]]:
+				block = previous.blocks[j]
+			else:
+				changed.append(j)
+			result.blocks.append(block)
+			result.ranges.append(block_range)
+		result.blocks += previous.blocks[last:]
+		result.ranges += [(s + delta, e + delta) for s,e in previous.ranges[last:]]
+		return result, changed
+
+	def _parseRegion( self, source:List[str], start:int, end:int, path:Optional[str] ) -> Iterator[Tuple[Block,Tuple[int,int]]]:
+		"""Parses the source lines from `start` to `end` (excluded), which
+		must start at a block boundary, yielding each block along with its
+		range of source lines."""
+		previous:Optional[Tuple[BlockInput,Block]] = None
+		for block_input in self._iterRegionInputs(source, start, end, path):
+			if previous:
+				yield previous[1], (previous[0].line, block_input.line)
+			previous = (block_input, self.onBlockEnd(block_input))
+		if previous:
+			yield previous[1], (previous[0].line, end)
+
+	def _iterRegionInputs( self, source:List[str], start:int, end:int, path:Optional[str] ) -> Iterator[BlockInput]:
+		return self.iterInputs(itertools.islice(source, start, end), path, start)
+
+	def _isStableBoundary( self, source:List[str], line:int ) -> bool:
+		"""Tells if the block starting at the given source line is parsed
+		the same way regardless of what comes before it. This is always
+		the case in standalone mode, as blocks start with a header."""
+		return True
 
 	# =========================================================================
 	# HEADER PARSING
@@ -147,18 +726,19 @@ class Parser:
 		match      = self.RE_HEADER.match(line)
 		# NOTE: This should probably raise a parsing error
 		if not match: return None
+		# NOTE: Names and types are interned as they end up in every block
 		if match.group(3):
-			name       = match.group(1)
-			type       = match.group(3)
+			name       = sys.intern(match.group(1))
+			type       = sys.intern(match.group(3))
 		else:
 			name       = None
-			type       = match.group(1)
+			type       = sys.intern(match.group(1))
 		processors = [_.strip() for _ in match.group(4)[1:].split(",")] if match.group(4) else []
 		rest       = match.group(7) or ""
 		# NOTE: The line is always stripped, but that might now be what
 		# we always want to do.
 		line       = rest
-		attributes:Dict[str,Any] = {}
+		attributes:Dict[str,Any] = EMPTY_ATTRIBUTES
 		i = line.find("{")
 		j = line.rfind("{")
 		if i >= 0 and i < j:
@@ -222,20 +802,22 @@ class Parser:
 		# --- BLOCK LINE
 		# If the line starts with `@` then it's a block declaration
 		if line.startswith("@"):
-			# We parse the header line, 
-			header = self.parseHeaderLine(line)
-			if not header:
+			# We parse the header line and resolve its block input
+			resolved = self.resolveHeaderLine(line)
+			if not resolved:
 				# TODO: We have a potentially malformed line, we should
 				# surface it to the user.
 				pass
 			else:
 				# We create a block from the header
-				block_input  = self._createBlockInputFromHeader(header)
-				# We notify that a new block is starting, which by default
-				# flushes all parsed lines and assigns them to the current block
-				# The new block becomes the current block
+				header, input_class = resolved
+				block_input  = input_class()
+				block_input.line = self.getSourceLine()
+				# We notify that a new block is starting, the current block
+				# is then complete. The new block becomes the current block
+				if self.blockInput:
+					self.blockInputs.append(self.blockInput)
 				self.blockInput = block_input
-				self.blockInputs.append(block_input)
 				self.onBlockStart(header)
 				self.line += 1
 				return True
@@ -255,29 +837,82 @@ class Parser:
 			self.line += 1
 			return False
 
-	def onEnd( self ) -> Iterable[Block]:
-		"""Called when the input is finished."""
-		# TODO: Should extract the result from the blocks
-		return (_.end() for _ in self.blockInputs)
+	def onEnd( self ):
+		"""Called when the input is finished, the current block input
+		is then complete."""
+		if self.blockInput:
+			self.blockInputs.append(self.blockInput)
+			self.blockInput = None
 
 	def onBlockStart( self, header:BlockHeader ):
 		if self.blockInput:
 			self.blockInput.start(header)
-			# text = u"\n".join(self.lines)
-			# if self.cache.has(text, self.block):
-			# 	i = self.blocks.index(self.block)
-			# 	b = self.cache.get(text, self.block)
-			# 	self.blocks[i] = b
-			# else:
-			# 	self.block.parseLines(self.lines)
-			# 	if text:
-			# 		self.cache.set(text, self.block, self.block)
-			# self.lines = []
-			# self.block = None
+
+	def onBlockEnd( self, blockInput:BlockInput ) -> Block:
+		"""Called when the given block input has received all its lines,
+		returns the corresponding block. When the parser is lazy, this
+		returns a `LazyBlock` for the inputs that declare their output,
+		so that the block is only processed if its value is used."""
+		if self.lazy and blockInput.OUTPUT and blockInput.header:
+			return LazyBlock(blockInput.header, blockInput.OUTPUT, functools.partial(self.processInput, blockInput))
+		else:
+			return self.processInput(blockInput)
+
+	def processInput( self, blockInput:BlockInput ) -> Block:
+		"""Processes the given block input into its block. Expensive or
+		long blocks are memoized in the cache by their text, input class
+		and header, so that only the blocks that have changed are
+		processed again, see `CACHE_MIN`."""
+		if not (self.cache and self.isCached(blockInput)):
+			return blockInput.end()
+		key   = self.getCacheKey(blockInput)
+		block = self.cache.get(key)
+		if block is None:
+			block = self.cache.set(key, blockInput.end())
+		return block
+
+	def isCached( self, blockInput:BlockInput ) -> bool:
+		"""Tells if the block of the given block input is memoized in the
+		cache, which is the case of expensive or long inputs."""
+		return blockInput.EXPENSIVE or len(blockInput.getInputAsString()) >= self.CACHE_MIN
+
+	def getCacheKey( self, blockInput:BlockInput ) -> str:
+		"""Returns the key of the given block input in the cache."""
+		assert self.cache
+		input_class = blockInput.__class__
+		return self.cache.key(
+			blockInput.getInputAsString(),
+			f"{input_class.__module__}.{input_class.__qualname__}",
+			blockInput.header,
+		)
+
+	def onContentRun( self, text:str, start:int=0, end:Optional[int]=None ):
+		"""Called when scanning a whole buffer with the consecutive lines
+		between two header or comment lines, from `start` to `end` in the
+		given `text`. The lines are given to the block input as a span of
+		the text, so that they are not copied until needed."""
+		end   = len(text) if end is None else end
+		first = text[start:start + 1] if start < end else ""
+		if not self.blockInput:
+			self.line += text.count("\n", start, end) + 1
+		elif first not in ("", "\t", "\n") or self.RE_RUN_OTHER.search(text, start, end):
+			# The run contains lines that are not content or blank lines
+			# with spaces, so we fall back to processing it line by line.
+			for line in text[start:end].split("\n"):
+				self.onLine(line)
+		elif end - start < self.SPAN_MIN:
+			text = text[start:end].replace("\n\t", "\n")
+			self.blockInput.feedText(text[1:] if first == "\t" else text)
+			self.line += text.count("\n") + 1
+		else:
+			self.blockInput.feedText(Span(text, start, end, True))
+			self.line += text.count("\n", start, end) + 1
 
 	def onBlockContent( self, line:str ):
-		# FIXME
-		self.blockInput.feed(line)
+		# NOTE: Content that comes before the first block (for instance
+		# a shebang line in embedded mode) does not belong to any block.
+		if self.blockInput:
+			self.blockInput.feed(line)
 
 	def onComment( self, content:str, line:str ):
 		pass
@@ -286,18 +921,174 @@ class Parser:
 	# HELPERS
 	# =========================================================================
 
-	def _createBlockInputFromHeader( self, header:BlockHeader ) -> BlockInput:
-		if not header.name and not self.mapping.getInputForType(header.type):
-			# We might have a header with an implicit type (eg, `@title`
-			# which means `@title:heading`), so we correct it.
-			possible_type = self.mapping.getInputForName(header.type)
-			if possible_type:
-				header = BlockHeader(header.type, possible_type, *header[2:])
-		block_input = self.mapping.getInputForHeader(header)
-		if not block_input:
-			raise ValueError(f"No block defined for tag: {header} at line {self.line} in {self.path}")
+	def getSourceLine( self ) -> int:
+		"""Returns the index of the source line being parsed."""
+		return self.line
+
+	def _iterBlocks( self, inputs:Iterable[BlockInput] ) -> Iterator[Block]:
+		"""Yields the block produced by each of the given inputs."""
+		if self.executor and not self.lazy:
+			yield from self._iterParallelBlocks(inputs)
 		else:
-			return block_input()
+			for block_input in inputs:
+				yield self.onBlockEnd(block_input)
+
+	def _iterParallelBlocks( self, inputs:Iterable[BlockInput] ) -> Iterator[Block]:
+		"""Like `_iterBlocks`, but the expensive inputs are processed in
+		the executor while the following inputs are parsed. The blocks are
+		yielded in the same order as the inputs."""
+		# Each pending block is either `(block, None, None)` when it is
+		# processed, or `(None, future, key)` when it is being processed,
+		# with its cache key if any.
+		pending:Deque[Tuple[Optional[Block],Any,Optional[str]]] = collections.deque()
+		window = self.PARALLEL_WINDOW
+		for block_input in inputs:
+			pending.append(self._submitInput(block_input))
+			while pending and (pending[0][0] is not None or pending[0][1].done() or len(pending) > window):
+				yield self._resolveBlock(pending.popleft())
+		while pending:
+			yield self._resolveBlock(pending.popleft())
+
+	def _submitInput( self, blockInput:BlockInput ) -> Tuple[Optional[Block],Any,Optional[str]]:
+		"""Processes the given input inline, or submits it to the executor
+		if it is expensive and large enough, see `_iterParallelBlocks`."""
+		if not (blockInput.EXPENSIVE and blockInput.header):
+			return (self.onBlockEnd(blockInput), None, None)
+		text = blockInput.getInputAsString()
+		if len(text) < self.PARALLEL_MIN:
+			return (self.onBlockEnd(blockInput), None, None)
+		key = None
+		if self.cache:
+			key   = self.getCacheKey(blockInput)
+			block = self.cache.get(key)
+			if block is not None:
+				return (block, None, None)
+		# NOTE: We only send the header and text, as the input might hold
+		# spans of the whole source.
+		return (None, self.executor.submit(blockInput.__class__.ProcessText, blockInput.header, text), key)
+
+	def _resolveBlock( self, pending:Tuple[Optional[Block],Any,Optional[str]] ) -> Block:
+		"""Returns the block for the given pending block, waiting for it
+		to be processed, see `_iterParallelBlocks`."""
+		block, future, key = pending
+		if block is None:
+			block = future.result()
+			if key is not None and self.cache:
+				self.cache.set(key, block)
+		return block
+
+	def _iterCompleteInputs( self ) -> Iterator[BlockInput]:
+		"""Yields the block inputs that are complete, removing them from
+		the parser."""
+		while self.blockInputs:
+			yield self.blockInputs.pop(0)
+
+	def _iterScan( self, buffer:Buffer, end:int, path:Optional[str] ) -> Iterator[BlockInput]:
+		"""Scans the given buffer up to `end`, see `iterText`."""
+		decode = self._getDecoder(buffer)
+		span   = self._getSpanner(buffer)
+		self.onStart(path)
+		offset = 0
+		# The offset of the current block input's header line
+		block_offset = 0
+		for start, stop in self._iterBoundaries(buffer, end):
+			if start > offset:
+				# We exclude the newline that precedes the boundary
+				self.onContentRun(*span(offset, start - 1))
+			block_input = self.blockInput
+			self.onLine(decode(start, stop))
+			if self.blockInput is not block_input:
+				# The line is a header, which ends the previous block
+				if block_input:
+					block_input.offsets = (block_offset, start - 1)
+				block_offset = start
+			offset = stop + 1
+			yield from self._iterCompleteInputs()
+		# NOTE: When the text does not end with a boundary line, what follows
+		# the last newline is a (possibly empty) last line.
+		if offset <= end:
+			self.onContentRun(*span(offset, end))
+		if self.blockInput:
+			self.blockInput.offsets = (block_offset, end)
+		self.onEnd()
+		yield from self._iterCompleteInputs()
+
+	def _iterBufferInputs( self, buffer:Buffer, path:str ) -> Iterator[BlockInput]:
+		"""Yields the block inputs of the given buffer, which holds the
+		contents of the file at the given path, see `iterPathInputs`."""
+		# NOTE: Like `readlines()`, we don't want a trailing newline to
+		# produce an extra empty line.
+		end = len(buffer) - 1 if buffer[-1:] in ("\n", b"\n") else len(buffer)
+		return self._iterScan(buffer, end, path)
+
+	def _iterBoundaries( self, buffer:Buffer, end:int ) -> Iterator[Tuple[int,int]]:
+		"""Yields the `(start, end)` offsets of the header and comment
+		lines in the given buffer."""
+		is_text = isinstance(buffer, str)
+		if buffer[:1] in (("@", "#") if is_text else (b"@", b"#")):
+			stop = buffer.find("\n" if is_text else b"\n", 0, end)
+			yield (0, end if stop < 0 else stop)
+		for match in (self.RE_BOUNDARY if is_text else self.RE_BOUNDARY_BYTES).finditer(buffer, 0, end):
+			yield (match.start() + 1, match.end())
+
+	def _mapPath( self, path:str ) -> Optional[Buffer]:
+		"""Memory-maps the file at the given path, or reads its bytes
+		when `mapFiles` is off. This returns `None` when the file can't be
+		mapped or contains carriage returns, in which case it should be
+		read in text mode to get universal newlines."""
+		try:
+			with open(path, "rb") as f:
+				if not self.mapFiles:
+					buffer:Buffer = f.read()
+				elif os.fstat(f.fileno()).st_size == 0:
+					return b""
+				else:
+					buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		except (OSError, ValueError):
+			return None
+		if buffer.find(b"\r") >= 0:
+			if isinstance(buffer, mmap.mmap):
+				buffer.close()
+			return None
+		return buffer
+
+	def _getDecoder( self, buffer:Buffer ) -> Callable[[int,int],str]:
+		"""Returns a function that returns the text between two offsets of
+		the given buffer, decoding it if it is not already text."""
+		if isinstance(buffer, str):
+			return lambda start, end: buffer[start:end]
+		else:
+			view     = memoryview(buffer)
+			encoding = self.ENCODING
+			return lambda start, end: str(view[start:end], encoding)
+
+	def _getSpanner( self, buffer:Buffer ) -> Callable[[int,int],Tuple[str,int,int]]:
+		"""Like `_getDecoder`, but returns the text between two offsets as
+		a `(text, start, end)` span. Text buffers are not copied, while
+		bytes are decoded along with the preceding newline, so that the
+		span can be turned into a newline-prefixed string without copy."""
+		if isinstance(buffer, str):
+			return lambda start, end: (buffer, start, end)
+		else:
+			view     = memoryview(buffer)
+			encoding = self.ENCODING
+			def span( start:int, end:int ) -> Tuple[str,int,int]:
+				prefix = 1 if start > 0 else 0
+				text   = str(view[start - prefix:end], encoding)
+				return (text, prefix, len(text))
+			return span
+
+	def _resolveHeaderLine( self, line:str ) -> Optional[Tuple[BlockHeader,Type[BlockInput]]]:
+		"""Parses the given header line and returns the header along with
+		its block input class, or `None` if the line is not a header. This
+		is memoized as `resolveHeaderLine`."""
+		header = self.parseHeaderLine(line)
+		if not header:
+			return None
+		input_class = self.mapping.resolve(header.name, header.type)
+		if not input_class:
+			raise ValueError(f"No block defined for tag: {header} at line {self.line} in {self.path}")
+		return header, input_class
 
 # -----------------------------------------------------------------------------
 #
@@ -326,71 +1117,241 @@ class EmbeddedParser(Parser):
 	LINE_BLOCK_CONTENT   = 't'
 	LINE_RAW_CONTENT     = 'T'
 
-	def __init__( self ):
-		super().__init__()
+	# The delimiter matchers for each extension, see `_getDelimiterMatchers`
+	MATCHERS:Dict[Tuple[str,bool],Tuple[Any,Any]] = {}
+
+	def __init__( self, useCache:bool=True, lazy:bool=False, executor:Optional[Any]=None, mapFiles:bool=True ):
+		super().__init__(useCache, lazy, executor, mapFiles)
+		# When rewriting, that's the index of the source line that
+		# corresponds to the current parsed line.
+		self.sourceLine:Optional[int] = None
+		# That's the kind of the last line processed by `_rewriteLines`
+		self.rewriteState:Optional[str] = None
 
-	def parseText( self, text, path ):
-		return self.parseLines(self._rewriteLines(text.split("\n"), path), path)
+	def iterTextInputs( self, text:str, path:Optional[str]=None ) -> Iterator[BlockInput]:
+		assert path, "The embedded parser needs a path to determine the extension"
+		if self.isPolyblockPath(path):
+			return super().iterTextInputs(text, path)
+		else:
+			return self._iterEmbeddedScan(text, len(text), path)
+
+	def iterPathInputs( self, path:str ) -> Iterator[BlockInput]:
+		if self.isPolyblockPath(path):
+			return super().iterPathInputs(path)
+		buffer = self._mapPath(path)
+		if buffer is None:
+			return self._iterRewrittenPath(path)
+		else:
+			return self._iterBufferInputs(buffer, path)
+
+	def _iterBufferInputs( self, buffer:Buffer, path:str ) -> Iterator[BlockInput]:
+		if self.isPolyblockPath(path):
+			return super()._iterBufferInputs(buffer, path)
+		elif not len(buffer):
+			# NOTE: Like with `readlines()`, an empty file has no lines at
+			# all, and so no `@embed` block.
+			return self._iterEmbeddedScan(buffer, -1, path)
+		else:
+			end = len(buffer) - 1 if buffer[-1:] == b"\n" else len(buffer)
+			return self._iterEmbeddedScan(buffer, end, path)
+
+	def onStart( self, path:Optional[str]=None ):
+		super().onStart(path)
+		self.sourceLine   = None
+		self.rewriteState = None
+
+	def getSourceLine( self ) -> int:
+		return self.line if self.sourceLine is None else self.sourceLine
+
+	def isPolyblockPath( self, path:Optional[str] ) -> bool:
+		"""Tells if the given path is a file in standalone polyblock
+		syntax, based on its extension."""
+		return bool(path) and path.rsplit(".",1)[-1] in self.POLYBLOCK_EXTENSION
 
-	def parsePath( self, path ):
+	def _iterRewrittenPath( self, path:str ) -> Iterator[BlockInput]:
 		with open(path, "rt") as f:
-			return self.parseLines(self._rewriteLines(f.readlines(), path), path)
+			yield from self.iterInputs(self._rewriteLines(f, path), path)
 
-	def _rewriteLines( self, iterator:Iterable[str], path:str ):
+	def _iterRegionInputs( self, source:List[str], start:int, end:int, path:Optional[str] ) -> Iterator[BlockInput]:
+		if self.isPolyblockPath(path):
+			return super()._iterRegionInputs(source, start, end, path)
+		else:
+			lines = itertools.islice(source, start, end)
+			return self.iterInputs(self._rewriteLines(lines, path, start), path)
+
+	def _isStableBoundary( self, source:List[str], line:int ) -> bool:
+		# A block made of host code is only parsed the same way if the
+		# preceding lines are neither host code (it would be merged with it)
+		# nor hidden.
+		if self.isPolyblockPath(self.path) or line >= len(source):
+			return True
+		elif self._getBlockLine(source[line], self.path):
+			return True
+		else:
+			return self.rewriteState not in (self.LINE_DIRECTIVE_HIDE, self.LINE_RAW_CONTENT)
+
+	def _iterEmbeddedScan( self, buffer:Buffer, end:int, path:str ) -> Iterator[BlockInput]:
+		"""Scans the given buffer up to `end` for the lines that start with
+		a delimiter, and produces the same blocks as `_rewriteLines`. Runs of
+		host code are given to their `@embed` block as a single slice, and
+		are not even decoded when they are hidden."""
+		decode     = self._getDecoder(buffer)
+		span       = self._getSpanner(buffer)
+		first, nth = self._getDelimiterMatchers(path, isinstance(buffer, str))
+		embed      = "@embed {0}".format(path.rsplit(".",1)[-1])
+		state:Optional[str] = None
+		# The offset of the current block input's first source line
+		block_offset = 0
+		def on_line( start:int, line:str ):
+			nonlocal block_offset
+			block_input = self.blockInput
+			self.onLine(line)
+			if self.blockInput is not block_input:
+				# The line is a header, which ends the previous block
+				if block_input:
+					block_input.offsets = (block_offset, start - 1)
+				block_offset = start
+		def on_raw( start:int, stop:int, state:Optional[str] ) -> Optional[str]:
+			if state == self.LINE_DIRECTIVE_HIDE:
+				# We ignore the lines as we're in a hide directive
+				return state
+			if state != self.LINE_RAW_CONTENT:
+				on_line(start, embed)
+			self.onRawContent(*span(start, stop))
+			return self.LINE_RAW_CONTENT
+		self.onStart(path)
+		offset  = 0
+		matches = itertools.chain(
+			[m for m in (first.match(buffer, 0, end),) if m],
+			nth.finditer(buffer, 0, end),
+		)
+		for match in matches:
+			start = match.start(1)
+			stop  = match.end()
+			if start > offset:
+				state = on_raw(offset, start - 1, state)
+			block_line = decode(match.end(1), stop).strip()
+			if not block_line:
+				# A delimiter with no content is host code
+				state = on_raw(start, stop, state)
+			else:
+				state, line = self._rewriteBlockLine(block_line, state)
+				if line is not None:
+					on_line(start, line)
+			offset = stop + 1
+			yield from self._iterCompleteInputs()
+		if offset <= end:
+			state = on_raw(offset, end, state)
+		if self.blockInput:
+			self.blockInput.offsets = (block_offset, end)
+		self.rewriteState = state
+		self.onEnd()
+		yield from self._iterCompleteInputs()
+
+	def onRawContent( self, text:str, start:int=0, end:Optional[int]=None ):
+		"""Called when scanning with consecutive lines of host code, from
+		`start` to `end` in the given `text`, which go as-is to the current
+		`@embed` block."""
+		end = len(text) if end is None else end
+		self.blockInput.feedText(text[start:end] if end - start < self.SPAN_MIN else Span(text, start, end))
+		self.line += text.count("\n", start, end) + 1
+
+	def _getDelimiterMatchers( self, path:str, isText:bool ) -> Tuple[Any,Any]:
+		"""Returns the expressions that match the lines starting with one of
+		the delimiters for the given path, the first one for the first line
+		of a buffer and the second one for the lines that follow a newline.
+		The first group of each match is the line's delimiter."""
+		key = (path.rsplit(".",1)[-1], isText)
+		if key not in self.MATCHERS:
+			delimiters = "|".join(re.escape(_) for _ in self._getDelimiters(path))
+			pattern    = f"({delimiters})[^\n]*"
+			if isText:
+				self.MATCHERS[key] = (re.compile(pattern), re.compile("\n" + pattern))
+			else:
+				self.MATCHERS[key] = (re.compile(pattern.encode()), re.compile(("\n" + pattern).encode()))
+		return self.MATCHERS[key]
+
+	def _rewriteBlockLine( self, line:str, state:Optional[str] ) -> Tuple[Optional[str],Optional[str]]:
+		"""Rewrites the given (stripped, non-empty) block line that follows
+		a line of the given kind, returning the kind of the line along with
+		the corresponding polyblock line, if any."""
+		if line.startswith("@hidden") or line.startswith("@hide"):
+			# A hidden directive means we're not showing the rest
+			return self.LINE_DIRECTIVE_HIDE, None
+		elif line.startswith("@show"):
+			# A show directive means we'll be showing the rest
+			return self.LINE_DIRECTIVE_SHOW, None
+		elif self.RE_HEADER.match(line):
+			# Is it a block header? If so we pass it as-is
+			return self.LINE_BLOCK_HEADER, line
+		elif line.startswith("#"):
+			# Is it a block comment? If so we pass it as-is
+			return self.LINE_BLOCK_COMMENT, line
+		elif state != self.LINE_DIRECTIVE_HIDE:
+			# If the previous line is not a hide directive, then
+			# we yield it indented
+			return self.LINE_BLOCK_CONTENT, "\t" + line
+		else:
+			# FIXME: Do we ignore the line here
+			return state, None
+
+	def _getDelimiters( self, path:str ) -> List[str]:
+		# NOTE: We might want to warn when using default delimiters
+		return self.getDelimitersForExt(path.rsplit(".",1)[-1]) or self.DEFAULT_DELIMITERS
+
+	def _getBlockLine( self, line:str, path:str ) -> Optional[str]:
+		"""Returns the polyblock content of the given source line if it
+		starts with one of the delimiters for the given path."""
+		match = self._getDelimiterMatchers(path, True)[0].match(line)
+		# NOTE: We strip the line, which means that the block
+		# content NEEDS TO BE TAB-INDENTED. We might want
+		# to loosen that constraint. Also, we're stripping the
+		# end spaces, which is not always ideal.
+		# TODO: We might keep the indentation level and use
+		# it to strip the content.
+		return line[match.end(1):].strip() if match else None
+
+	def _rewriteLines( self, iterator:Iterable[str], path:str, offset:int=0 ):
+		"""Rewrites the given source lines as polyblock lines. Runs of host
+		code don't go through the parser's `onLine`: once their `@embed`
+		header is yielded, they are directly given to the block."""
 		assert path, "The embedded parser needs a path to determine the extension"
-		ext = path.rsplit(".",1)[-1]
-		if ext in self.POLYBLOCK_EXTENSION:
+		if self.isPolyblockPath(path):
 			yield from iterator
-		else:
-			delimiters = self.getDelimitersForExt(ext) or self.DEFAULT_DELIMITERS
-			# NOTE: We might want to warn when using default delimiters
-			previous_line = None
-			for line in iterator:
-				# We look for the delimiters and see if we have a match
-				block_line:Optional[str] = None
-				for delim in delimiters:
-					if line.startswith(delim):
-						# NOTE: We strip the line, which means that the block
-						# content NEEDS TO BE TAB-INDENTED. We might want
-						# to loosen that constraint. Also, we're stripping the
-						# end spaces, which is not always ideal.
-						block_line = line[len(delim):].strip()
-						# TODO: We might keep the indentation level and use
-						# it to strip the content.
-						break
-				if block_line:
-					# We have a line that may belong to a block
-					if block_line.startswith("@hidden") or block_line.startswith("@hide"):
-						# A hidden directive means we're not showing the rest
-						previous_line = self.LINE_DIRECTIVE_HIDE
-					elif block_line.startswith("@show"):
-						# A show directive means we'll be showing the rest
-						previous_line = self.LINE_DIRECTIVE_SHOW
-					elif self.RE_HEADER.match(block_line):
-						# Is it a block header? If so we pass it as-is
-						previous_line = self.LINE_BLOCK_HEADER
-						yield block_line
-					elif block_line.startswith("#"):
-						# Is it a block comment? If so we pass it as-is
-						previous_line = self.LINE_BLOCK_COMMENT
-						yield block_line
-					else:
-						# If the previous line is not a block header, then
-						# we yield it indented
-						if previous_line != "H":
-							previous_line = self.LINE_BLOCK_CONTENT
-							yield "\t" + block_line
-						else:
-							# FIXME: Do we ignore the line here
-							pass
-				elif previous_line == self.LINE_DIRECTIVE_HIDE:
-					# We ignore the line as we're in a hide directive
-					pass
-				else:
-					if previous_line != self.LINE_RAW_CONTENT:
-						yield "@embed {0}".format(ext)
-					previous_line = self.LINE_RAW_CONTENT
-					yield "\t" + line
+			return
+		match_delimiter = self._getDelimiterMatchers(path, True)[0].match
+		embed           = "@embed {0}".format(path.rsplit(".",1)[-1])
+		previous_line:Optional[str] = None
+		run:List[str]   = []
+		for i, line in enumerate(iterator, offset):
+			self.sourceLine = i
+			# We look for the delimiters and see if we have a match
+			match      = match_delimiter(line)
+			block_line = line[match.end(1):].strip() if match else None
+			if block_line:
+				# We have a line that may belong to a block
+				if run:
+					self.onRawContent("\n".join(run))
+					run = []
+				previous_line, block_line = self._rewriteBlockLine(block_line, previous_line)
+				if block_line is not None:
+					yield block_line
+			elif previous_line == self.LINE_DIRECTIVE_HIDE:
+				# We ignore the line as we're in a hide directive
+				pass
+			else:
+				if previous_line != self.LINE_RAW_CONTENT:
+					yield embed
+				previous_line = self.LINE_RAW_CONTENT
+				run.append(line[:-1] if line.endswith("\n") else line)
+		if run:
+			self.onRawContent("\n".join(run))
+		self.rewriteState = previous_line
+
+	def getExtensions( self ) -> List[str]:
+		"""Returns the list of file extensions that this parser knows
+		about."""
+		return self.POLYBLOCK_EXTENSION + [ext for exts,_ in self.DELIMITERS for ext in exts]
 
 	def getDelimitersForExt( self, ext:str ) -> List[str]:
 		"""Returns the list of delimiters that are defined for the
@@ -400,4 +1361,15 @@ class EmbeddedParser(Parser):
 				return seps
 		return []
 
+# -----------------------------------------------------------------------------
+#
+# HIGH-LEVEL API
+#
+# -----------------------------------------------------------------------------
+
+def readBlock( path:str, name:str, useCache:bool=True ) -> Optional[Block]:
+	"""Returns the first block with the given name in the file at the given
+	path, using the index of its blocks when possible. See `Parser.readBlock`."""
+	return EmbeddedParser(useCache=useCache).readBlock(path, name)
+
 # EOF - vim: ts=4 sw=4 noet
@@ -1,7 +1,7 @@
-import pickle, os
-from   typing import Any,Dict,Optional,Union,Iterable
-# NOTE: Document is not defined there
-from   xml.dom import Node,getDOMImplementation
+import pickle, os, re, time, stat, hashlib, importlib
+from   typing import Any,Dict,List,Optional,Union,Iterable,Iterator,Tuple
+# NOTE: `xml.dom` is only imported when XML is produced, so `Node` and
+# `Document` are only used as annotations.
 from   collections import OrderedDict
 
 class XMLFactory:
@@ -16,12 +16,13 @@ class XMLFactory:
 		return cls.INSTANCE
 
 	def __init__( self ):
+		from xml.dom import getDOMImplementation
 		self.dom      = getDOMImplementation()
 
 	def isAttributeValue( self, value:Any ) -> bool:
 		return isinstance(value,str) or isinstance(value,int) or isinstance(value,float) or isinstance(value,bool) or value is None
 
-	def attrs( self, document:'Document', node:Node, attributes:Optional[Union[Dict[str,str],Iterable[str]]]=None ):
+	def attrs( self, document:'Document', node:'Node', attributes:Optional[Union[Dict[str,str],Iterable[str]]]=None ):
 		attrs = attributes.items() if isinstance(attributes, dict) or isinstance(attributes, OrderedDict) else enumerate(attributes)
 		for name, value in attrs:
 			if self.isAttributeValue(value):
@@ -30,8 +31,8 @@ class XMLFactory:
 				node.appendChild(self.node( document, name, value ))
 		return node
 
-	def add( self, document, node:Node, child:Node ) -> Node:
-		if node.nodeType == Node.TEXT_NODE:
+	def add( self, document, node:'Node', child:'Node' ) -> 'Node':
+		if node.nodeType == node.TEXT_NODE:
 			return node
 		elif isinstance(child, dict) or isinstance(child, OrderedDict):
 			for k,v in child.items():
@@ -44,11 +45,14 @@ class XMLFactory:
 		elif isinstance(child, list) or isinstance(child, tuple):
 			for i,v in enumerate(child):
 				node.appendChild(self.node( document, "item", {"index":i}, v))
+		elif child is not None and self.isAttributeValue(child):
+			# Numbers and booleans (typically from data blocks) are text
+			node.appendChild(document.createTextNode(str(child)))
 		elif child:
 			node.appendChild(child)
 		return node
 
-	def node( self, document:'Document', name:str, *children ) -> Node:
+	def node( self, document:'Document', name:str, *children ) -> 'Node':
 		if name == "#text":
 			return document.createTextNode("".join(_ for _ in children))
 		else:
@@ -63,6 +67,309 @@ class XMLFactory:
 	def __call__( self, document:'Document', name, *children ):
 		return self.node(document, name, *children)
 
+# -----------------------------------------------------------------------------
+#
+# XML STREAM
+#
+# -----------------------------------------------------------------------------
+
+# The types of the values that `XMLFactory` (and `XMLStream`) write as
+# attributes, along with `None`.
+ATTRIBUTE_TYPES = (str, int, float, bool)
+
+#@symbol polyblocks.util.XMLStream
+class XMLStream:
+	"""Writes XML to an output as it is given SAX-like events (`startElement`,
+	`characters`, `endElement`), formatted exactly like `xml.dom.minidom`
+	does with `toxml()`, or `toprettyxml(indent)` when an `indent` is
+	given. As minidom only writes `/>` for elements with no children and
+	does not indent a single text child, the end of a start tag and the
+	first text child are only written once the next event is known.
+	Primitive values (eg. data blocks) are written with `element`."""
+
+	def __init__( self, output:Any, indent:Optional[str]=None ):
+		self.write   = output.write
+		self.indent  = indent or ""
+		self.newline = "\n" if indent is not None else ""
+		# The name and number of children of each open element
+		self.elements:List[List[Any]] = []
+		# The first child of the current element, when it is a text
+		self.text:Optional[str] = None
+		self._document:Optional['Document'] = None
+
+	@property
+	def document( self ) -> 'Document':
+		"""An `xml.dom` document, only created for the blocks that are
+		written as nodes (see `Block.writeXML`)."""
+		if self._document is None:
+			from xml.dom import getDOMImplementation
+			self._document = getDOMImplementation().createDocument(None, None, None)
+		return self._document
+
+	def startDocument( self ):
+		self.write('<?xml version="1.0" ?>' + self.newline)
+
+	def processingInstruction( self, target:str, data:str ):
+		self._onChild()
+		self.write(f"{self.indent * len(self.elements)}<?{target} {data}?>{self.newline}")
+
+	def startElement( self, name:str, attributes:Optional[Iterable[Tuple[str,str]]]=None ):
+		self._onChild()
+		write = self.write
+		write(self.indent * len(self.elements) + "<" + name)
+		if attributes:
+			for key, value in attributes:
+				write(' ' + key + '="' + self.escape(value) + '"')
+		self.elements.append([name, 0])
+
+	def characters( self, text:str ):
+		if self._onChild(text):
+			self.write(self.indent * len(self.elements) + self.escape(text) + self.newline)
+
+	def endElement( self ):
+		name, children = self.elements.pop()
+		if not children:
+			self.write("/>" + self.newline)
+		elif self.text is not None:
+			# The only child is a text, which is not indented
+			self.write(self.escape(self.text) + "</" + name + ">" + self.newline)
+			self.text = None
+		else:
+			self.write(self.indent * len(self.elements) + "</" + name + ">" + self.newline)
+
+	def endDocument( self ):
+		assert not self.elements, f"Elements are not closed: {self.elements}"
+
+	def element( self, name:str, *children:Any ):
+		"""Writes an element with the given children, like `XMLFactory.node`
+		creates it, but without creating any node: the scalar values of
+		dictionaries are attributes and their other values are elements,
+		the items of lists and tuples are `item` elements, strings and
+		other scalars are text."""
+		if name == "#text":
+			self.characters("".join(_ for _ in children))
+			return
+		self.startElement(name, self.getAttributes(children))
+		for child in children:
+			self.content(child)
+		self.endElement()
+
+	def getAttributes( self, children:Iterable[Any] ) -> Optional[Iterable[Tuple[str,str]]]:
+		"""Returns the attributes of an element with the given children,
+		which are the scalar values of its dictionaries."""
+		attributes:Optional[Dict[str,str]] = None
+		for child in children:
+			if isinstance(child, dict):
+				for key, value in child.items():
+					if value is None or isinstance(value, ATTRIBUTE_TYPES):
+						if attributes is None:
+							attributes = {}
+						attributes[key] = value if type(value) is str else str(value)
+		return attributes.items() if attributes else None
+
+	def content( self, value:Any ):
+		"""Writes the given value as content of the current element, see
+		`element`. The values are dispatched on their exact type first, as
+		that's what JSON and HJSON data is made of."""
+		kind = type(value)
+		if kind is str:
+			self.characters(value)
+		elif kind is dict or isinstance(value, dict):
+			for key, child in value.items():
+				if not (child is None or isinstance(child, ATTRIBUTE_TYPES)):
+					self.element(key, child)
+		elif kind is list or kind is tuple or isinstance(value, (list, tuple)):
+			for i, item in enumerate(value):
+				if isinstance(item, dict):
+					self.element("item", {"index":i}, item)
+				else:
+					self.startElement("item", (("index", str(i)),))
+					self.content(item)
+					self.endElement()
+		elif value is None:
+			pass
+		elif isinstance(value, ATTRIBUTE_TYPES):
+			# Numbers and booleans (typically from data blocks) are text
+			self.characters(str(value))
+		elif value:
+			self.writeNode(value)
+
+	def writeNode( self, node:'Node' ):
+		"""Writes the given `xml.dom` node, like `node.writexml` would."""
+		if node.nodeType == node.TEXT_NODE:
+			self.characters(node.data)
+		elif node.nodeType == node.ELEMENT_NODE:
+			self.startElement(node.tagName, node.attributes.items())
+			for child in node.childNodes:
+				self.writeNode(child)
+			self.endElement()
+		elif node.nodeType == node.PROCESSING_INSTRUCTION_NODE:
+			self.processingInstruction(node.target, node.data)
+		else:
+			raise ValueError(f"Unsupported XML node: {node}")
+
+	def escape( self, text:str ) -> str:
+		return text.replace("&", "&amp;").replace("<", "&lt;").replace("\"", "&quot;").replace(">", "&gt;")
+
+	def _onChild( self, text:Optional[str]=None ) -> bool:
+		"""Updates the current element as it gets a child, which is a text
+		if `text` is given. Returns `False` when the text child is kept
+		until we know if it's the only child."""
+		if not self.elements:
+			return True
+		element = self.elements[-1]
+		element[1] += 1
+		if element[1] == 1:
+			self.write(">")
+			if text is not None:
+				self.text = text
+				return False
+			self.write(self.newline)
+		elif self.text is not None:
+			# The element has more than one child, so its first text child
+			# is written like the others.
+			self.write(self.newline + self.indent * len(self.elements) + self.escape(self.text) + self.newline)
+			self.text = None
+		return True
+
+# -----------------------------------------------------------------------------
+#
+# JSON
+#
+# -----------------------------------------------------------------------------
+
+# Integers with that many digits might not fit in 64 bits
+LONG_DIGITS = "0" * 19
+DIGITS      = str.maketrans("123456789", "000000000")
+
+def hasLongDigits( text:str ) -> bool:
+	"""Tells if the given text has a run of (at least) `LONG_DIGITS`
+	digits, which is (much) faster to find with `str.translate` than
+	with a regular expression."""
+	return LONG_DIGITS in text.translate(DIGITS)
+
+def hasNonFiniteFloat( value:Any ) -> bool:
+	"""Tells if the given value has a NaN or infinite float, in any of its
+	(nested) lists, tuples or dictionaries (including their keys)."""
+	stack = [value]
+	pop   = stack.pop
+	push  = stack.extend
+	while stack:
+		value = pop()
+		kind  = type(value)
+		if kind is float:
+			# NOTE: That is `NaN` for both NaN and infinite values
+			if value - value != 0:
+				return True
+		elif kind is dict:
+			push(value.values())
+			push(value)
+		elif kind is list or kind is tuple:
+			push(value)
+	return False
+
+#@symbol polyblocks.util.JSONBackend
+class JSONBackend:
+	"""Encodes and decodes JSON using the fastest available library among
+	`BACKENDS`. All the backends produce the same values and text, the
+	text being compact and with non-ASCII characters as is (which is the
+	only form `orjson` writes): when a backend fails on a value, or would
+	differ from the standard `json` module (eg. `orjson` with integers
+	larger than 64 bits, non-finite floats or exponents), the `json`
+	module is used instead. Pretty output always uses the `json` module,
+	so that it is the same whatever the backend."""
+
+	BACKENDS = ("orjson", "ujson", "rapidjson", "json")
+	# The options of the standard `json` module for the canonical text
+	OPTIONS  = dict(ensure_ascii=False, separators=(",", ":"))
+	# Matches the exponent of a number, which `orjson` and `ujson` write
+	# as `1e-7` or `1e16`, where the `json` module writes `1e-07` and
+	# `1e+16`. This might match a string too, which is only slower.
+	RE_EXPONENT = re.compile("[0-9]e[-0-9]")
+	INSTANCES:Dict[str,'JSONBackend'] = {}
+	# The name of the backend used by default, see `Use`
+	DEFAULT:Optional[str] = None
+
+	@classmethod
+	def Available( cls ) -> Iterator[str]:
+		"""Yields the names of the backends that can be imported, from
+		the fastest."""
+		for name in cls.BACKENDS:
+			try:
+				importlib.import_module(name)
+			except ImportError:
+				continue
+			yield name
+
+	@classmethod
+	def Get( cls, name:Optional[str]=None ) -> 'JSONBackend':
+		"""Returns the backend with the given name, or the default one.
+		The default backend is the first available in `BACKENDS`, unless
+		it was set with `Use`."""
+		if not name or name == "auto":
+			if not cls.DEFAULT:
+				cls.DEFAULT = next(cls.Available())
+			name = cls.DEFAULT
+		if name not in cls.INSTANCES:
+			cls.INSTANCES[name] = JSONBackend(name)
+		return cls.INSTANCES[name]
+
+	@classmethod
+	def Use( cls, name:Optional[str] ) -> 'JSONBackend':
+		"""Sets the backend used by default, `None` or `auto` meaning the
+		fastest available."""
+		cls.DEFAULT = None
+		backend = cls.Get(name)
+		cls.DEFAULT = backend.name
+		return backend
+
+	def __init__( self, name:str ):
+		if name not in self.BACKENDS:
+			raise ValueError(f"Unsupported JSON backend: {name}, pick one of {', '.join(self.BACKENDS)}")
+		self.name = name
+		self.json = importlib.import_module("json")
+		self.module = importlib.import_module(name)
+		self._loads = self.module.loads
+		if name == "orjson":
+			option = self.module.OPT_NON_STR_KEYS
+			self._dumps = lambda value:self.module.dumps(value, option=option).decode("utf8")
+		elif name == "ujson":
+			self._dumps = lambda value:self.module.dumps(value, ensure_ascii=False, escape_forward_slashes=False)
+		elif name == "rapidjson":
+			self._dumps = lambda value:self.module.dumps(value, ensure_ascii=False)
+		else:
+			self._dumps = None
+
+	def loads( self, text:str ) -> Any:
+		"""Decodes the given JSON text."""
+		# NOTE: `orjson` silently decodes the integers that don't fit in 64
+		# bits as floats, so the texts that might have some (see
+		# `hasLongDigits`) are decoded by the standard library.
+		if self._loads is not self.json.loads and not hasLongDigits(text):
+			try:
+				return self._loads(text)
+			except Exception:
+				# NOTE: We let the standard library fail (or succeed), so
+				# that the errors are the same whatever the backend.
+				pass
+		return self.json.loads(text)
+
+	def dumps( self, value:Any, pretty:bool=False ) -> str:
+		"""Encodes the given value as JSON, indented when pretty."""
+		if pretty:
+			return self.json.dumps(value, indent=4)
+		if self._dumps:
+			try:
+				text = self._dumps(value)
+			except Exception:
+				text = None
+			# NOTE: `orjson` writes NaN and infinite floats as `null`, where
+			# the standard library writes `NaN` and `Infinity`, so we look
+			# for them when there is a `null` in the output.
+			if text is not None and not ("null" in text and hasNonFiniteFloat(value)) and not self.RE_EXPONENT.search(text):
+				return text
+		return self.json.dumps(value, **self.OPTIONS)
+
 # -----------------------------------------------------------------------------
 #
 # CACHE
@@ -71,72 +378,140 @@ class XMLFactory:
 
 #@symbol cache
 class Cache:
-	"""A simple self-cleaning cache."""
+	"""A simple self-cleaning cache, with an in-memory LRU tier in front
+	of an on-disk tier. Entries are stored pickled in both tiers, so that
+	each hit returns a fresh copy of the cached value."""
 
 	CACHE = None
 	PATH  = os.path.expanduser("~/.cache/polyblocks")
+	# The version is part of every key, it needs to be bumped whenever
+	# the pickled representation of the model changes.
+	VERSION  = "3"
+	# The maximum number of entries kept in the in-memory tier
+	CAPACITY = 4096
 
 	@classmethod
 	def Ensure(cls) -> 'Cache':
 		"""Ensures that there is an instance of the cache configured
 		at the default `Cache.PATH`."""
 		if not cls.CACHE:
-			return Cache(path=cls.PATH)
-		else:
-			return cls.CACHE
+			cls.CACHE = Cache(path=cls.PATH)
+		return cls.CACHE
 
-	def __init__( self, path:str ):
+	def __init__( self, path:str, capacity:Optional[int]=None ):
 		"""Creates the cache at the given location."""
 		self.root = os.path.abspath(os.path.normpath(os.path.expanduser(path)))
 		assert path
-		if not os.path.exists(path):
-			os.makedirs(path)
+		if not os.path.exists(self.root):
+			os.makedirs(self.root)
+		self.capacity = self.CAPACITY if capacity is None else capacity
+		self.memory:'OrderedDict[str,bytes]' = OrderedDict()
+		self.isClean   = False
+		self.hits      = 0
+		self.misses    = 0
+		self.memoryHits = 0
+		self.diskHits  = 0
+
+	def key( self, text:str, *context:Any ) -> str:
+		"""Returns the key for the given text as processed in the given
+		context (typically the block input class and the block header)."""
+		h = hashlib.sha256(self.VERSION.encode("utf8"))
+		for _ in context:
+			h.update(repr(_).encode("utf8"))
+			h.update(b"\0")
+		h.update(text.encode("utf8"))
+		return h.hexdigest()
+
+	def has( self, key:str ) -> bool:
+		"""Tells if there is a cache entry for the given key."""
+		return key in self.memory or os.path.exists(self._path(key))
+
+	def get( self, key:str ) -> Optional[Any]:
+		"""Returns the cache entry for the given key, or `None` if there
+		is no (valid) entry for it."""
+		data = self.memory.get(key)
+		if data is not None:
+			self.memory.move_to_end(key)
+			value = self._load(data)
+			if value is not None:
+				self.hits       += 1
+				self.memoryHits += 1
+				return value
+		else:
+			try:
+				with open(self._path(key), "rb") as f:
+					data = f.read()
+			except OSError:
+				data = None
+			value = self._load(data) if data else None
+			if value is not None:
+				self._remember(key, data)
+				self.hits     += 1
+				self.diskHits += 1
+				return value
+		self.misses += 1
+		return None
+
+	def set( self, key:str, value:Any ) -> Any:
+		"""Saves the given `value` for the given key. Values that cannot
+		be pickled are simply not cached."""
+		try:
+			data = pickle.dumps(value)
+		except (pickle.PicklingError, TypeError, AttributeError):
+			return value
+		self._remember(key, data)
+		if not self.isClean:
+			self.clean()
+		# We write atomically, as several processes might share the cache.
+		path = self._path(key)
+		temp = f"{path}.{os.getpid()}.tmp"
+		try:
+			with open(temp, "wb") as f:
+				f.write(data)
+			os.replace(temp, path)
+		except OSError:
+			pass
+		return value
+
+	def stats( self ) -> Dict[str,int]:
+		"""Returns the hit/miss counters of the cache."""
+		return dict(
+			hits       = self.hits,
+			misses     = self.misses,
+			memoryHits = self.memoryHits,
+			diskHits   = self.diskHits,
+			entries    = len(self.memory),
+		)
 
-#	# FIXME: Why is there a block here?
-#	def key( self, text:str, block:Block ) -> str:
-#		"""Gets the key for the given text as processed by the given block."""
-#		return self.hash(text) + self.hash(block.key())
-#
-#	def hash( self, text ):
-#		"""Returns the SHA-256 hex digest of the given text."""
-#		return hashlib.sha256(text.encode("utf8")).hexdigest()
-#
-#	def has( self, text:str, block:Block ) -> bool:
-#		"""Tells if there is a cache entry for the given text and block."""
-#		if not text: return False
-#		key = self.key(text, block)
-#		return key and os.path.exists(self._path(key))
-#
-#	def get( self, text:str, block:Block ) -> Block:
-#		"""Returns the cache entry for the given text and block."""
-#		if not text: return None
-#		key = self.key(text, block)
-#		if self.has(text, block):
-#			with open(self._path(key), "rb") as f:
-#				try:
-#					return pickle.load(f)
-#				except ValueError as e:
-#					# We might get an unsupported pickle protocol: 3
-#					return
-#		return None
-#
-#	def set( self, text:str, block:Block, value:Any ) -> Any:
-#		"""Saves the given `value` for the `(text,block)` entry."""
-#		if not text: return text
-#		self.clean()
-#		key = self.key(text, block)
-#		with open(self._path(key), "wb") as f:
-#			pickle.dump(value, f)
-#		return value
-#
 	def clean( self, full=False, timeout=60*60*24 ):
 		"""Cleans the cache, removing any entry older than timeout (1 day)."""
 		now = time.time()
+		if full:
+			self.memory.clear()
 		for _ in list(os.listdir(self.root)):
 			p = os.path.join(self.root, _)
-			s = os.stat(p)[stat.ST_MTIME]
-			if full or (now - s > timeout):
-				os.unlink(p)
+			try:
+				s = os.stat(p)[stat.ST_MTIME]
+				if full or (now - s > timeout):
+					os.unlink(p)
+			except OSError:
+				pass
+		self.isClean = True
+
+	def _remember( self, key:str, data:bytes ):
+		"""Stores the given pickled data in the in-memory LRU tier."""
+		self.memory[key] = data
+		self.memory.move_to_end(key)
+		while len(self.memory) > self.capacity:
+			self.memory.popitem(last=False)
+
+	def _load( self, data:bytes ) -> Optional[Any]:
+		try:
+			return pickle.loads(data)
+		# We might get an unsupported pickle protocol or a stale
+		# class definition.
+		except Exception:
+			return None
 
 	def _path( self, key:str ) -> str:
 		"""Returns the path for the given key"""
@@ -149,8 +524,23 @@ class Cache:
 #
 # -----------------------------------------------------------------------------
 
-def xml( document:'Document', name:str, *children ) -> Node:
+def xml( document:'Document', name:str, *children ) -> 'Node':
 	"""Wraps `XMLFactory.node` into a simple function."""
-	return XMLFactory().Get().node(document, name, *children)
+	return XMLFactory.Get().node(document, name, *children)
+
+def iterFiles( paths:Iterable[str], extensions:Optional[Iterable[str]]=None ) -> Iterator[str]:
+	"""Yields the given paths, with the directories replaced by the files
+	they contain (recursively, in sorted order) that have one of the given
+	extensions, if any."""
+	suffixes = tuple("." + _ for _ in extensions) if extensions else None
+	for path in paths:
+		if os.path.isdir(path):
+			for parent, dirs, files in os.walk(path):
+				dirs.sort()
+				for name in sorted(files):
+					if not suffixes or name.endswith(suffixes):
+						yield os.path.join(parent, name)
+		else:
+			yield path
 
 # EOF - vim: ts=4 sw=4 noet
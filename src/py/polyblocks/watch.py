@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+#encoding: UTF-8
+from typing import Callable,Dict,Iterable,Iterator,List,Optional,Tuple
+import os, time, hashlib
+from .util import iterFiles
+
+__doc__ = """
+Detects changes in files and directories, so that a long-running process
+can re-process only the files that actually changed.
+"""
+
+# -----------------------------------------------------------------------------
+#
+# WATCHER
+#
+# -----------------------------------------------------------------------------
+
+#@symbol polyblocks.watch.Watcher
+class Watcher:
+	"""Polls a list of files and directories for changes. A file is
+	considered as changed when its modification time or size differ,
+	and its content hash confirms it."""
+
+	def __init__( self, paths:Iterable[str], extensions:Optional[Iterable[str]]=None ):
+		self.paths = list(paths)
+		# Directories are walked for files with one of these extensions
+		self.extensions:Optional[List[str]] = list(extensions) if extensions else None
+		# Maps each known file to its `(mtime, size, digest)`
+		self.state:Dict[str,Tuple[int,int,str]] = {}
+
+	def iterFiles( self ) -> Iterator[str]:
+		"""Yields the files that are currently watched, see `iterFiles`."""
+		for path in iterFiles(self.paths, self.extensions):
+			if os.path.exists(path):
+				yield path
+
+	def poll( self ) -> List[str]:
+		"""Returns the list of files that changed (or appeared) since the
+		last poll. The first poll returns all the files."""
+		changed:List[str] = []
+		files = set()
+		for path in self.iterFiles():
+			files.add(path)
+			try:
+				s = os.stat(path)
+			except OSError:
+				continue
+			previous = self.state.get(path)
+			if previous and previous[0] == s.st_mtime_ns and previous[1] == s.st_size:
+				continue
+			digest = self.digest(path)
+			if digest is None:
+				# The file was removed (or renamed) since we listed it
+				continue
+			self.state[path] = (s.st_mtime_ns, s.st_size, digest)
+			# The file might have been touched without its content changing
+			if not previous or previous[2] != digest:
+				changed.append(path)
+		for path in list(self.state):
+			if path not in files:
+				del self.state[path]
+		return changed
+
+	def watch( self, callback:Callable[[List[str]],None], interval:float=0.5 ):
+		"""Polls the files every `interval` seconds, invoking the callback
+		with the files that changed, until interrupted."""
+		try:
+			while True:
+				changed = self.poll()
+				if changed:
+					callback(changed)
+				time.sleep(interval)
+		except KeyboardInterrupt:
+			pass
+
+	def digest( self, path:str ) -> Optional[str]:
+		"""Returns the SHA-256 hex digest of the file at the given path, or
+		`None` if it can't be read."""
+		h = hashlib.sha256()
+		try:
+			with open(path, "rb") as f:
+				for chunk in iter(lambda:f.read(1 << 16), b""):
+					h.update(chunk)
+		except OSError:
+			return None
+		return h.hexdigest()
+
+# EOF - vim: ts=4 sw=4 noet
@@ -1,19 +1,24 @@
 #!/usr/bin/env python3
-from typing import Iterable
+from typing import Iterable,List,Optional
 from .model import Block
-import xml.dom
-import json
+from .util  import JSONBackend,XMLStream
 
 class Writer:
 
+	# Binary writers need a binary output (eg. `sys.stdout.buffer`)
+	BINARY = False
+
 	def __init__( self, **options ):
 		self.options = options
+		# The path of the file the blocks being written come from, if given
+		self.path:Optional[str] = None
 
 	@property
 	def hasPretty( self ) -> bool:
 		return bool(self.options.get("pretty"))
 
-	def write( self, blocks:Iterable[Block], output ):
+	def write( self, blocks:Iterable[Block], output, path:Optional[str]=None ):
+		self.path = path
 		self.onStart(blocks, output)
 		for i,block in enumerate(blocks):
 			self.onBlock(block, i, output)
@@ -23,22 +28,122 @@ class Writer:
 		raise NotImplementedError
 
 class JSONWriter(Writer):
+	"""Writes the blocks as a JSON array. The `backend` option selects
+	the JSON library (see `JSONBackend`)."""
+
+	def __init__( self, **options ):
+		super().__init__(**options)
+		self.json:Optional[JSONBackend] = None
 
 	def onStart( self, block:Block, output ):
+		self.json = JSONBackend.Get(self.options.get("backend"))
 		output.write("[")
 
 	def onBlock( self, block:Block, index:int, output ):
 		if index > 0:
 			output.write(",")
-		output.write(json.dumps(block.toPrimitive(), indent=4 if self.hasPretty else None))
+		output.write(self.json.dumps(block.toPrimitive(), self.hasPretty))
 
 	def onEnd( self, block:Block, output ):
 		output.write("]")
 
+class NDJSONWriter(Writer):
+	"""Writes the blocks as newline-delimited JSON, one block per line, so
+	that the output can be consumed line by line while it is written. The
+	lines are written (and the output flushed) in chunks of `BUFFER`
+	characters. When `write` is given a `path`, each line is an object
+	with the `path` and the `block`."""
+
+	BUFFER = 256 * 1024
+
+	def __init__( self, **options ):
+		super().__init__(**options)
+		self.json:Optional[JSONBackend] = None
+		self.lines:List[str] = []
+		self.size = 0
+
+	def onStart( self, block:Block, output ):
+		self.json  = JSONBackend.Get(self.options.get("backend"))
+		self.lines = []
+		self.size  = 0
+
+	def onBlock( self, block:Block, index:int, output ):
+		value = block.toPrimitive()
+		line  = self.json.dumps({"path":self.path, "block":value} if self.path else value)
+		self.lines.append(line)
+		self.size += len(line) + 1
+		if self.size >= self.BUFFER:
+			self.flush(output)
+
+	def onEnd( self, block:Block, output ):
+		self.flush(output)
+
+	def flush( self, output ):
+		"""Writes the pending lines to the output and flushes it."""
+		if self.lines:
+			self.lines.append("")
+			output.write("\n".join(self.lines))
+			output.flush()
+			self.lines = []
+			self.size  = 0
+
+class BinaryWriter(Writer):
+	"""Writes the blocks in the binary format of `polyblocks.binary`, which
+	can be loaded back as blocks, to a binary output. Each `write` is a
+	segment, with the `path` given to `write`, if any."""
+
+	BINARY = True
+	BUFFER = 256 * 1024
+
+	def __init__( self, **options ):
+		super().__init__(**options)
+		# NOTE: The binary format is only imported when it is written
+		from .binary import BinaryEncoder
+		self.encoder = BinaryEncoder()
+
+	def onStart( self, block:Block, output ):
+		self.encoder.writeStart(self.path)
+
+	def onBlock( self, block:Block, index:int, output ):
+		self.encoder.writeBlock(block)
+		if len(self.encoder.data) >= self.BUFFER:
+			output.write(self.encoder.flush())
+
+	def onEnd( self, block:Block, output ):
+		self.encoder.writeEnd()
+		output.write(self.encoder.flush())
+
 class XMLWriter(Writer):
+	"""Writes the blocks as XML as they come, without keeping them in a
+	document nor creating nodes (see `Block.writeXML`). The output is the
+	same as `XMLDOMWriter`'s. The `stylesheet` option adds an
+	`xml-stylesheet` processing instruction."""
 
 	def __init__( self, **options ):
 		super().__init__(**options)
+		self.stream:Optional[XMLStream] = None
+
+	def onStart( self, block:Block, output ):
+		self.stream = XMLStream(output, "\t" if self.hasPretty else None)
+		self.stream.startDocument()
+		if self.options.get("stylesheet"):
+			self.stream.processingInstruction("xml-stylesheet", getStylesheetData(self.options["stylesheet"]))
+		self.stream.startElement("block")
+
+	def onBlock( self, block:Block, index:int, output ):
+		block.writeXML(self.stream)
+
+	def onEnd( self, block:Block, output ):
+		self.stream.endElement()
+		self.stream.endDocument()
+
+class XMLDOMWriter(Writer):
+	"""Writes the blocks as XML by building an `xml.dom` document with all
+	the blocks and serializing it at the end."""
+
+	def __init__( self, **options ):
+		super().__init__(**options)
+		import xml.dom
 		self.dom      = xml.dom.getDOMImplementation()
 		self.docuemnt = None
 		self.root     = None
@@ -49,9 +154,8 @@ class XMLWriter(Writer):
 		self.root     = self.document.createElementNS(None, "block")
 		#self.meta     = self.document.createElementNS(None, "Meta")
 		#self.root.appendChild(self.meta)
-		# if self.xsl:
-		# 	self.xslPI = self.document.createProcessingInstruction("xml-stylesheet", 'type="text/xsl" media="screen" href="{0}"'.format(self.xsl))
-		# 	self.document.appendChild(self.xslPI)
+		if self.options.get("stylesheet"):
+			self.document.appendChild(self.document.createProcessingInstruction("xml-stylesheet", getStylesheetData(self.options["stylesheet"])))
 		self.document.appendChild(self.root)
 
 	def onBlock( self, block:Block, index:int, output ):
@@ -65,4 +169,9 @@ class XMLWriter(Writer):
 		result = self.document.toprettyxml("\t") if self.hasPretty else self.document.toxml()
 		output.write(result)
 
+def getStylesheetData( url:str ) -> str:
+	"""Returns the data of the `xml-stylesheet` processing instruction for
+	the XSL stylesheet at the given URL."""
+	return 'type="text/xsl" media="screen" href="{0}"'.format(url)
+
 # EOF - vim: ts=4 sw=4 noet
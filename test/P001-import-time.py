@@ -0,0 +1,80 @@
+import os, sys, time, subprocess
+
+__doc__ = """
+Ensures that importing `polyblocks` and its command stays fast, as the
+command is run once per file: the optional and heavy dependencies must
+not be imported until they are used, and running `import
+polyblocks.command` must not take more than `RATIO` times running an
+empty script (`python -c pass`), so that the check does not depend on
+the speed of the host. An absolute budget (in ms, for the import itself
+as measured by `-X importtime`) can be given as argument.
+"""
+
+BASE   = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "py")
+# The optional budget, in milliseconds, for importing `polyblocks.command`
+BUDGET = float(sys.argv[1]) if len(sys.argv) > 1 else None
+# The maximum ratio between running the import and an empty script, which
+# is about 3.5 on a typical host.
+RATIO  = 5.0
+# These modules are only imported when they are actually used
+LAZY   = (
+	"xml.dom", "json", "dateutil", "hjson", "paml", "multiprocessing", "concurrent.futures",
+	"importlib.metadata", "polyblocks.watch", "polyblocks.inputs.json", "polyblocks.inputs.hjson",
+	"polyblocks.inputs.paml", "polyblocks.binary",
+)
+RUNS   = 10
+
+def environment() -> dict:
+	env = dict(os.environ)
+	env["PYTHONPATH"] = os.pathsep.join((BASE, env.get("PYTHONPATH", "")))
+	# We want to measure the import, not the compilation of the sources
+	env.pop("PYTHONDONTWRITEBYTECODE", None)
+	return env
+
+def importTime( module:str ):
+	"""Imports the given module in a new interpreter, returning the
+	cumulative import time of each module (in ms)."""
+	res = subprocess.run(
+		[sys.executable, "-X", "importtime", "-c", f"import {module}"],
+		env=environment(), stderr=subprocess.PIPE, universal_newlines=True, check=True,
+	)
+	times = {}
+	for line in res.stderr.split("\n"):
+		if line.startswith("import time:") and "|" in line:
+			_, cumulative, name = line.split("|")
+			if cumulative.strip().isdigit():
+				times[name.strip()] = int(cumulative) / 1000.0
+	return times
+
+def runTime( code:str ) -> float:
+	"""Returns the time (in ms) it takes to run the given code in a new
+	interpreter."""
+	started = time.perf_counter()
+	subprocess.run([sys.executable, "-c", code], env=environment(), check=True)
+	return (time.perf_counter() - started) * 1000.0
+
+# The package itself should not import anything
+package = importTime("polyblocks")
+assert "polyblocks.parser" not in package, "Importing polyblocks should not import the parser"
+
+# The first run might have to compile the sources
+imported = set(importTime("polyblocks.command"))
+for module in LAZY:
+	assert module not in imported, f"Importing polyblocks.command should not import {module}"
+
+# We alternate the runs, so that both are measured in the same conditions
+empty   = []
+command = []
+for _ in range(RUNS):
+	empty.append(runTime("pass"))
+	command.append(runTime("import polyblocks.command"))
+ratio = min(command) / min(empty)
+print(f"polyblocks.command runs in {min(command):.1f}ms, {ratio:.1f}x an empty script (max {RATIO:.1f}x)")
+assert ratio <= RATIO, f"Importing polyblocks.command takes {ratio:.1f}x running an empty script, max is {RATIO:.1f}x"
+
+if BUDGET is not None:
+	elapsed = min(importTime("polyblocks.command")["polyblocks.command"] for _ in range(RUNS))
+	print(f"polyblocks.command imported in {elapsed:.1f}ms (budget {BUDGET:.1f}ms)")
+	assert elapsed <= BUDGET, f"Importing polyblocks.command took {elapsed:.1f}ms, budget is {BUDGET:.1f}ms"
+
+# EOF - vim: ts=4 sw=4 noet
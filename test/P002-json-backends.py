@@ -0,0 +1,87 @@
+from polyblocks.util   import JSONBackend, hasLongDigits, hasNonFiniteFloat
+from polyblocks.parser import Parser
+from polyblocks.writer import JSONWriter
+import io, json
+
+__doc__ = """
+Ensures that all the available JSON backends decode values like the
+standard `json` module and encode them as the same canonical text, both
+directly and when parsing `@json` blocks and writing blocks as JSON.
+Non-finite floats (which `orjson` writes as `null`), exponents (which
+`orjson` writes differently) and integers larger than 64 bits (which
+`orjson` reads as floats) are checked separately.
+"""
+
+# The canonical text of a value, as written by all the backends
+def canonical( value ) -> str:
+	return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+VALUES = [
+	None, True, False, 0, -1, 2**70, 1.5, 1e-7, 1e16, -2.5e-300, 1e22, "", "text", "àéî ☃ \U0001F600",
+	"quotes \" and \\ slashes / and\ncontrol\t\x01", "1e5 in a string",
+	[1, [2, [3, []]], {}], (1, 2), {"a":{"b":[None, 1.0]}}, {1:"one", 2.5:"two"},
+]
+
+NON_FINITE = [
+	float("nan"), float("inf"), -float("inf"), [None, 1.0, float("nan")],
+	{"a":[None, {"b":float("inf")}]}, {"a":None, "b":-float("inf")},
+]
+
+TEXTS = [
+	'{"a": [1, 2.0, -3e2, true, false, null], "b": {"c": "\\u00e9\\n"}}',
+	'"\\ud83d\\ude00"',
+	'1234567890123456789',
+]
+
+BIG_INTS = [
+	'[123456789012345678901234567890]', '18446744073709551616',
+	'-9223372036854775809', '{"a": [1.5, 99999999999999999999]}',
+]
+
+NON_FINITE_TEXTS = ['NaN', '[Infinity, -Infinity]', '[1e400, -1e400, null]']
+
+DOCUMENT = """\
+@title JSON
+@json
+	{"name": "data", "items": [1, 2, {"nested": [true, null, "é"]}]}
+@p
+	Some text
+@json
+	18446744073709551616
+@json
+	[1e400, -1e400, null]
+@json
+	{"a": NaN, "b": [Infinity, null]}
+"""
+
+def writeJSON( blocks, **options ):
+	output = io.StringIO()
+	JSONWriter(**options).write(blocks, output)
+	return output.getvalue()
+
+# The helpers used to fall back on the `json` module
+assert all(hasLongDigits(_) for _ in BIG_INTS)
+assert not any(hasLongDigits(_) for _ in NON_FINITE_TEXTS + TEXTS[:2])
+assert all(hasNonFiniteFloat(_) for _ in NON_FINITE)
+assert not any(hasNonFiniteFloat(_) for _ in VALUES)
+
+backends = list(JSONBackend.Available())
+assert "json" in backends
+expected_blocks = writeJSON(Parser(useCache=False).parseText(DOCUMENT), backend="json")
+expected_pretty = writeJSON(Parser(useCache=False).parseText(DOCUMENT), backend="json", pretty=True)
+assert expected_blocks == "[" + ",".join(canonical(_.toPrimitive()) for _ in Parser(useCache=False).parseText(DOCUMENT)) + "]"
+for name in backends:
+	backend = JSONBackend(name)
+	for value in VALUES + NON_FINITE:
+		assert backend.dumps(value) == canonical(value), f"{name}: dumps({value!r})"
+		assert backend.dumps(value, pretty=True) == json.dumps(value, indent=4), f"{name}: pretty dumps({value!r})"
+	for text in TEXTS + BIG_INTS + NON_FINITE_TEXTS:
+		assert repr(backend.loads(text)) == repr(json.loads(text)), f"{name}: loads({text!r})"
+	JSONBackend.Use(name)
+	blocks = Parser(useCache=False).parseText(DOCUMENT)
+	assert writeJSON(blocks, backend=name) == expected_blocks, f"{name}: JSONWriter"
+	assert writeJSON(blocks, backend=name, pretty=True) == expected_pretty, f"{name}: pretty JSONWriter"
+	print(f"{name}: OK")
+JSONBackend.Use(None)
+
+# EOF - vim: ts=4 sw=4 noet
@@ -0,0 +1,58 @@
+from polyblocks.parser import Parser
+from polyblocks.inputs.json import JSONInput
+import concurrent.futures, json
+
+__doc__ = """
+Ensures that processing the expensive blocks in a thread or process pool
+produces the same blocks, in the same order, as processing them inline,
+and that only the expensive blocks that are long enough are submitted to
+the pool (so not the paragraphs and dates).
+"""
+
+def document( count:int ) -> str:
+	lines = []
+	for i in range(count):
+		data = json.dumps({"index":i, "values":list(range(i * 500))}, indent=1)
+		lines.append(f"@p\n\tParagraph {i}")
+		lines.append("@json:json|a\n" + "\n".join("\t" + _ for _ in data.split("\n")))
+		lines.append(f"@date\n\t2020-01-{i % 28 + 1:02d}")
+	return "\n".join(lines)
+
+def recorded( executor ):
+	"""Wraps the `submit` method of the given executor to record the
+	input class and header of each submitted block."""
+	submit = executor.submit
+	def wrapper( function, header, text ):
+		wrapper.submitted.append((function.__self__, header.name, header.type))
+		return submit(function, header, text)
+	wrapper.submitted = []
+	executor.submit   = wrapper
+	return wrapper
+
+def primitives( blocks ):
+	return [(_.name, _.type, _.toPrimitive()) for _ in blocks]
+
+def dispatched( minimum:int ):
+	"""Returns the blocks that are expected to be submitted when their
+	text is at least `minimum` long, which are the JSON blocks."""
+	return [(JSONInput, _.header.name, _.header.type) for _ in Parser(useCache=False).iterTextInputs(DOCUMENT) if isinstance(_, JSONInput) and len(_.getInputAsString()) >= minimum]
+
+DOCUMENT = document(20)
+expected = primitives(Parser(useCache=False).iterText(DOCUMENT))
+# The first JSON block is too short for 1024, and with 0, all the JSON
+# blocks are submitted, but still not the dates.
+assert len(dispatched(1024)) == 19 and len(dispatched(0)) == 20
+for name, executor_class in (("thread", concurrent.futures.ThreadPoolExecutor), ("process", concurrent.futures.ProcessPoolExecutor)):
+	for minimum in (1024, 0):
+		with executor_class(2) as executor:
+			submit = recorded(executor)
+			parser = Parser(useCache=False, executor=executor)
+			# We make sure that blocks go through the executor and wait in
+			# the window for the preceding ones.
+			parser.PARALLEL_MIN    = minimum
+			parser.PARALLEL_WINDOW = 4
+			assert primitives(parser.iterText(DOCUMENT)) == expected, f"{name}: blocks differ"
+			assert submit.submitted == dispatched(minimum), f"{name}: submitted blocks differ"
+	print(f"{name}: OK")
+
+# EOF - vim: ts=4 sw=4 noet
@@ -0,0 +1,116 @@
+from polyblocks.parser import EmbeddedParser, readBlock
+from polyblocks.util   import Cache
+import polyblocks.parser
+import os, time, types, hashlib, tempfile
+
+__doc__ = """
+Ensures that `readBlock` returns the same blocks as a full parse, both
+when it creates the index of the file and when it uses it, for polyblock
+and embedded files. The index is found by the file's modification time
+and size without hashing the file, by the file's hash when it is touched,
+and is not used when it is stale.
+"""
+
+DOCUMENT = """\
+# A comment before the first block
+@title Random access
+@intro:text
+	Some text, with non-ASCII characters: àéî ☃
+# A comment within a block
+	and more text
+@data:json
+	{"items": [1, 2, 3]}
+@p
+	An unnamed paragraph
+@intro:text
+	Another block with the same name
+"""
+
+EMBEDDED = """\
+# @title Embedded
+# @intro:text
+#	Some text, with non-ASCII characters: àéî ☃
+import os
+# @hide
+hidden = True
+# @data:json
+#	{"items": [1, 2, 3]}
+def f():
+	return 1
+# @show
+# @intro:text
+#	Another block with the same name
+"""
+
+# Same size as `EMBEDDED`, but the `intro` block is not where it was
+MOVED = EMBEDDED.replace("# @title Embedded\n", "# @title Embedde\n").replace("import os\n", "import os \n")
+
+def counted( function ):
+	"""Wraps the given function (or method) to count its calls."""
+	def wrapper( *args, **kwargs ):
+		wrapper.count += 1
+		return function(*args, **kwargs)
+	wrapper.count = 0
+	return wrapper
+
+def primitive( block ):
+	return None if block is None else (block.name, block.type, block.toPrimitive())
+
+def write( path:str, text:str, mtime:float ):
+	with open(path, "wt") as f:
+		f.write(text)
+	# NOTE: Recent files are not indexed by their modification time
+	os.utime(path, (mtime, mtime))
+
+def parse( path:str ):
+	"""Returns the primitive of the first block of each name."""
+	expected = {}
+	parser   = EmbeddedParser(useCache=False)
+	for block_input in parser.iterPathInputs(path):
+		name = block_input.header.name
+		if name and name not in expected:
+			expected[name] = primitive(parser.onBlockEnd(block_input))
+	return expected
+
+def check( path:str, expected ):
+	for name in ("intro", "data", "missing"):
+		assert primitive(readBlock(path, name)) == expected.get(name), f"readBlock({path!r}, {name!r}) differs"
+
+# NOTE: The cache hashes its keys with its own `hashlib`
+sha256 = counted(hashlib.sha256)
+polyblocks.parser.hashlib = types.SimpleNamespace(sha256=sha256)
+scans  = EmbeddedParser._indexBufferInputs = counted(EmbeddedParser._indexBufferInputs)
+mtime  = time.time() - 60
+with tempfile.TemporaryDirectory() as temp:
+	Cache.CACHE = Cache(os.path.join(temp, "cache"))
+	for filename, text in (("document.block", DOCUMENT), ("document.py", EMBEDDED)):
+		path = os.path.join(temp, filename)
+		write(path, text, mtime)
+		expected = parse(path)
+		assert set(expected) == {"intro", "data"}
+		# The first pass creates the index, the second one uses it,
+		# without hashing the file.
+		check(path, expected)
+		assert scans.count == 1, f"{filename}: the file should be indexed once"
+		hashes = sha256.count
+		check(path, expected)
+		assert scans.count == 1 and sha256.count == hashes, f"{filename}: the index should be found by the file's stat"
+		# A touched file is hashed, and its index reused
+		write(path, text, mtime + 1)
+		check(path, expected)
+		assert scans.count == 1 and sha256.count > hashes, f"{filename}: the index should be found by the file's hash"
+		scans.count = 0
+		print(f"{filename}: OK")
+	# A file that changes without changing its size nor its modification
+	# time has a stale index, which is detected and replaced.
+	assert len(MOVED) == len(EMBEDDED)
+	write(path, MOVED, mtime + 1)
+	expected = parse(path)
+	check(path, expected)
+	assert scans.count == 1, "The stale index should be replaced"
+	check(path, expected)
+	assert scans.count == 1
+	print("Stale: OK")
+	Cache.CACHE = None
+
+# EOF - vim: ts=4 sw=4 noet
@@ -0,0 +1,53 @@
+from polyblocks.parser import Parser, Selector
+from polyblocks.inputs import TextInput
+
+__doc__ = """
+Ensures that the blocks selected from a `BlockIndex` or with
+`Parser.iterSelected` are the same as the ones filtered from a full
+parse, and that the blocks that can't match are not processed.
+"""
+
+DOCUMENT = """\
+@title Selection
+@p
+	A paragraph
+@example:code
+	print("example")
+@code {lang=js}{}
+	console.log("code")
+@json
+	[1, 2, 3]
+@date
+	2020-01-01
+"""
+
+SELECTIONS = {
+	"type=code"             : ["example", "text"],
+	"name=title"            : ["heading"],
+	"name=p"                : ["text"],
+	"type=data,type=date"   : ["data", "date"],
+	"type=code,lang=js"     : ["text"],
+	"lang"                  : ["text"],
+	"name=missing"          : [],
+}
+
+parser = Parser(useCache=False)
+index  = parser.indexText(DOCUMENT)
+assert len(index) == 6
+for expressions, names in SELECTIONS.items():
+	selector = Selector.Parse(expressions.split(","))
+	assert [_.name for _ in index.select(selector)] == names, f"BlockIndex.select({expressions})"
+	selected = parser.iterSelected(parser.iterTextInputs(DOCUMENT), selector)
+	assert [_.name for _ in selected] == names, f"Parser.iterSelected({expressions})"
+assert [_.name for _ in index.select(type=("data", "date"))] == ["data", "date"]
+
+# The text blocks are not processed when only dates are selected
+processed = []
+process   = TextInput.process
+TextInput.process = lambda self:processed.append(self) or process(self)
+assert [_.name for _ in parser.iterSelected(parser.iterTextInputs(DOCUMENT), Selector(type="date"))] == ["date"]
+TextInput.process = process
+assert not processed, "Text blocks should not be processed"
+print("OK")
+
+# EOF - vim: ts=4 sw=4 noet
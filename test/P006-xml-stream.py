@@ -0,0 +1,95 @@
+from polyblocks.parser import Parser
+from polyblocks.writer import XMLWriter, XMLDOMWriter
+from polyblocks.util   import XMLStream, xml
+from xml.dom import minidom
+import io, random
+
+__doc__ = """
+Ensures that the streaming `XMLWriter` produces byte-identical output to
+`XMLDOMWriter` (ie. minidom's `toxml()` and `toprettyxml("\\t")`), and that
+`XMLStream` writes any tree like minidom does, and any value like `xml()`
+converts it.
+"""
+
+DOCUMENTS = [
+	"",
+	"@title Only a title",
+	"""\
+@title Escaping & <markup> "quotes"
+@p
+	Some text with <tags>, & ampersands and "quotes"
+@p
+
+@code
+	if (a < b && c > d) { return "x"; }
+@json
+	{"list": [1, [], [[]], {}, "", "a\\"b", true, null], "empty": {}, "nested": {"a": {"b": [1.5, -2]}}}
+@json
+	[]
+@date
+	2020-02-29T12:30:00
+@symbol name
+@p {lang=fr,title="Un \\"titre\\""}{}
+	Bonjour
+@ex:code
+	multiple
+	lines
+""",
+]
+
+def write( writer_class, blocks, **options ) -> str:
+	output = io.StringIO()
+	writer_class(**options).write(blocks, output)
+	return output.getvalue()
+
+for document in DOCUMENTS:
+	blocks = Parser(useCache=False).parseText(document)
+	for options in ({}, {"pretty":True}, {"stylesheet":"lib/xsl/polyblocks.xsl"}, {"pretty":True, "stylesheet":"style.xsl"}):
+		expected = write(XMLDOMWriter, blocks, **options)
+		assert write(XMLWriter, blocks, **options) == expected, f"XMLWriter output differs with {options} for:\n{document}"
+print("XMLWriter: OK")
+
+# We compare random trees, with text children in any position
+random.seed(0)
+def randomNode( document, depth:int ):
+	if depth > 3 or random.random() < 0.3:
+		return document.createTextNode(random.choice(("", "text", " & <b> \"q\"", "\n\tline")))
+	node = document.createElement(random.choice(("a", "b", "item")))
+	for i in range(random.randint(0, 2)):
+		node.setAttribute(f"k{i}", random.choice(("v", "", "<&\">")))
+	for _ in range(random.choice((0, 1, 1, 2, 3))):
+		node.appendChild(randomNode(document, depth + 1))
+	return node
+
+document = minidom.getDOMImplementation().createDocument(None, None, None)
+for _ in range(2000):
+	node = randomNode(document, 0)
+	for indent, newline in (("", ""), ("\t", "\n")):
+		expected = io.StringIO()
+		node.writexml(expected, "", indent, newline)
+		output   = io.StringIO()
+		stream   = XMLStream(output, indent if newline else None)
+		stream.writeNode(node)
+		assert output.getvalue() == expected.getvalue(), f"XMLStream differs for: {expected.getvalue()!r}"
+print("XMLStream: OK")
+
+# We compare random values, like the ones of data blocks
+def randomValue( depth:int ):
+	if depth > 3 or random.random() < 0.4:
+		return random.choice(("", "text", "<&>", 0, -1, 1.5, True, False, None))
+	elif random.random() < 0.5:
+		return [randomValue(depth + 1) for _ in range(random.randint(0, 3))]
+	else:
+		return {random.choice("abc"):randomValue(depth + 1) for _ in range(random.randint(0, 3))}
+
+for _ in range(2000):
+	children = [randomValue(1) for _ in range(random.randint(0, 3))]
+	for indent, newline in (("", ""), ("\t", "\n")):
+		expected = io.StringIO()
+		xml(document, "value", *children).writexml(expected, "", indent, newline)
+		output   = io.StringIO()
+		XMLStream(output, indent if newline else None).element("value", *children)
+		assert output.getvalue() == expected.getvalue(), f"XMLStream.element differs for: {children!r}"
+print("XMLStream.element: OK")
+
+# EOF - vim: ts=4 sw=4 noet
@@ -0,0 +1,60 @@
+from polyblocks.parser import Parser
+from polyblocks.writer import JSONWriter, NDJSONWriter
+import io, json
+
+__doc__ = """
+Ensures that `NDJSONWriter` writes the same blocks as `JSONWriter`, one
+per line, in chunks, and tagged with their path when given one.
+"""
+
+DOCUMENT = """\
+@title NDJSON
+@p
+	A paragraph
+	on two lines
+@json
+	{"list": [1, 2, "three\\nlines"], "nested": {"a": null}}
+@date
+	2020-01-01
+@symbol name
+""" * 100
+
+class Output( io.StringIO ):
+	"""Counts the writes and flushes."""
+
+	def __init__( self ):
+		super().__init__()
+		self.writes  = 0
+		self.flushes = 0
+
+	def write( self, text:str ) -> int:
+		self.writes += 1
+		return super().write(text)
+
+	def flush( self ):
+		self.flushes += 1
+
+blocks   = Parser(useCache=False).parseText(DOCUMENT)
+output   = io.StringIO()
+JSONWriter().write(blocks, output)
+expected = json.loads(output.getvalue())
+
+# All the blocks are written in a single chunk
+output = Output()
+NDJSONWriter().write(blocks, output)
+lines  = output.getvalue().split("\n")
+assert lines[-1] == "", "The output should end with a newline"
+assert [json.loads(_) for _ in lines[:-1]] == expected
+assert output.writes == output.flushes == 1
+
+# The blocks are written in chunks, with their path
+writer = NDJSONWriter()
+writer.BUFFER = 1024
+output = Output()
+writer.write(blocks, output, "document.block")
+lines  = output.getvalue().split("\n")
+assert [json.loads(_) for _ in lines[:-1]] == [{"path":"document.block", "block":_} for _ in expected]
+assert output.writes == output.flushes > 1
+print("OK")
+
+# EOF - vim: ts=4 sw=4 noet
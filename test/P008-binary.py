@@ -0,0 +1,88 @@
+from polyblocks.parser import Parser
+from polyblocks.writer import BinaryWriter
+from polyblocks.model  import Block, Data, Symbol, EMPTY_ATTRIBUTES
+from polyblocks        import binary
+import io, sys
+
+__doc__ = """
+Ensures that the blocks written by `BinaryWriter` are loaded back by
+`polyblocks.binary` as the same blocks, including when the output is
+made of several segments, written in chunks. Only the registered block
+classes are loaded, without importing the modules named by the data.
+"""
+
+DOCUMENT = """\
+@title Binary
+@p
+	A paragraph with non-ASCII characters: àéî ☃
+	and a line long enough to need more than one byte for its length, which is a varint
+@code {lang=js}{}
+	console.log("code")
+@json
+	{"list": [1, -1, 0, 1.5, -2.25, true, false, null, "", "a"], "": {"nested": [[], {}]}, "big": 123456789012345678901234567890}
+@date
+	2020-02-29T12:30:00
+@symbol type name
+@symbol name
+"""
+
+def signature( blocks ):
+	return [(_.__class__, _.type, _.name, _.attributes, _.value, getattr(_, "source", None)) for _ in blocks]
+
+blocks = Parser(useCache=False).parseText(DOCUMENT)
+# Values that the parser doesn't produce
+blocks.append(Data({1:"one", (2, 3):{"a":[-(2**70), 2**70]}, "x":("a", "b")}, source="custom"))
+blocks.append(Symbol("symbol").setAttributes({"key":"value", "count":3}))
+expected = signature(blocks)
+assert signature(binary.loads(binary.dumps(blocks))) == expected
+assert binary.loads(binary.dumps([])) == []
+
+# Lazy blocks are written as their actual block
+lazy = Parser(useCache=False, lazy=True).parseText(DOCUMENT)
+assert signature(binary.loads(binary.dumps(lazy))) == expected[:len(lazy)]
+
+# The output is made of segments, written in chunks
+writer = BinaryWriter()
+writer.BUFFER = 64
+output = io.BytesIO()
+writer.write(blocks, output, "first.block")
+writer.write(blocks[:2], output)
+segments = list(binary.BinaryDecoder(output.getvalue()).iterSegments())
+assert [_[0] for _ in segments] == ["first.block", None]
+assert signature(segments[0][1]) == expected
+assert signature(segments[1][1]) == expected[:2]
+assert signature(binary.loads(output.getvalue())) == expected + expected[:2]
+assert binary.loads(output.getvalue())[0].attributes is EMPTY_ATTRIBUTES
+
+# The block classes of the block inputs (like `Data` for `@json`) are
+# registered, other classes need to be.
+class Custom(Block):
+	__slots__ = ()
+
+def rejects( data:bytes, name:str ):
+	try:
+		binary.loads(data)
+	except ValueError as e:
+		assert name in str(e), e
+	else:
+		raise AssertionError(f"Loading a block of class {name} should fail")
+
+rejects(binary.dumps([Custom("custom")]), binary.getClassName(Custom))
+binary.registerClass(Custom)
+assert signature(binary.loads(binary.dumps([Custom("custom")]))) == [(Custom, "custom", "block", EMPTY_ATTRIBUTES, "custom", None)]
+
+# Unknown classes are rejected before their module is imported
+assert "this" not in sys.modules
+encoder = binary.BinaryEncoder()
+encoder.writeStart()
+encoder.data.append(binary.BLOCK)
+encoder.writeSymbol("this:Block")
+encoder.writeSymbol("block")
+encoder.writeValue({})
+encoder.writeValue(None)
+encoder.writeEnd()
+rejects(encoder.flush(), "this:Block")
+assert "this" not in sys.modules
+print("OK")
+
+# EOF - vim: ts=4 sw=4 noet
@@ -0,0 +1,51 @@
+from polyblocks.command import run
+import io, os, sys, tempfile, contextlib
+
+__doc__ = """
+Ensures that `--output-dir` writes the output of each file to its own
+file, the same as the output on stdout, and only rewrites the files whose
+output changed.
+"""
+
+DOCUMENT = """\
+@title Output {index}
+@p
+	A paragraph
+"""
+
+def stdout( args ) -> str:
+	output = io.StringIO()
+	with contextlib.redirect_stdout(output):
+		run(args)
+	return output.getvalue()
+
+with tempfile.TemporaryDirectory() as temp:
+	paths = []
+	for name in ("a.block", "b.block", os.path.join("sub", "c.block")):
+		path = os.path.join(temp, "src", name)
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+		with open(path, "wt") as f:
+			f.write(DOCUMENT.format(index=name))
+		paths.append(path)
+	dist    = os.path.join(temp, "dist")
+	outputs = [os.path.join(dist, _) for _ in ("a.xml", "b.xml", os.path.join("sub", "c.xml"))]
+	for jobs in ("1", "2"):
+		assert stdout(["--no-cache", "-j", jobs, "--output-dir", dist] + paths) == ""
+		for path, output in zip(paths, outputs):
+			with open(output, "rt") as f:
+				assert f.read() == stdout(["--no-cache", path]), f"{output} differs"
+	# Only the output of the changed file is rewritten
+	mtimes = [os.stat(_).st_mtime_ns for _ in outputs]
+	for _ in outputs:
+		os.utime(_, ns=(0, 0))
+	with open(paths[0], "at") as f:
+		f.write("@p\n\tAnother paragraph\n")
+	run(["--no-cache", "--output-dir", dist] + paths)
+	assert [os.stat(_).st_mtime_ns != 0 for _ in outputs] == [True, False, False]
+	assert sorted(os.listdir(dist)) == ["a.xml", "b.xml", "sub"]
+	# The paths are relative to the base, with the given suffix
+	run(["--no-cache", "-O", "json", "--output-dir", dist, "--base", os.path.join(temp, "src", "sub"), "--suffix", ".c.json", paths[2]])
+	assert os.path.exists(os.path.join(dist, "c.c.json"))
+	print("OK")
+
+# EOF - vim: ts=4 sw=4 noet
@@ -0,0 +1,91 @@
+from polyblocks.command import run
+from polyblocks.watch   import Watcher
+import io, os, sys, time, tempfile, subprocess, contextlib
+
+__doc__ = """
+Ensures that `--watch` keeps watching when a file is edited into an
+invalid state (or removed) and back, reporting the error without writing
+any partial output, and that the files it parses are not memory-mapped,
+so that a file truncated while it is parsed doesn't raise SIGBUS.
+"""
+
+BASE    = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "py")
+VALID   = "@title Version {0}\n@p\n\tSome text\n"
+INVALID = "@title Version 2\n@notatag\n\tSome text\n"
+TIMEOUT = 20.0
+
+# Starts parsing a file like the watcher, truncates it and then parses the
+# rest, which raises SIGBUS if the file is memory-mapped.
+TRUNCATED = """\
+import sys, os
+from polyblocks.parser import EmbeddedParser
+path = sys.argv[1]
+with open(path, "wt") as f:
+	f.write("@title Truncated\\n" + "@p\\n\\tSome text\\n" * 20000)
+inputs = EmbeddedParser(useCache=False, mapFiles=False).iterPathInputs(path)
+next(inputs)
+os.truncate(path, 0)
+print(sum(1 for _ in inputs))
+"""
+
+def stdout( args ) -> str:
+	output = io.StringIO()
+	with contextlib.redirect_stdout(output):
+		run(args)
+	return output.getvalue()
+
+def wait( path:str, text:str ):
+	"""Waits until the file at the given path contains the given text."""
+	deadline = time.time() + TIMEOUT
+	while time.time() < deadline:
+		with open(path, "rt") as f:
+			if text in f.read():
+				return
+		time.sleep(0.05)
+	raise AssertionError(f"Timed out waiting for {text!r} in {path}")
+
+def edit( path:str, text:str ):
+	with open(path, "wt") as f:
+		f.write(text)
+
+with tempfile.TemporaryDirectory() as temp:
+	path     = os.path.join(temp, "document.block")
+	output   = os.path.join(temp, "output.xml")
+	errors   = os.path.join(temp, "errors.txt")
+	expected = []
+	for version in (1, 3):
+		edit(path, VALID.format(version))
+		expected.append(stdout(["--no-cache", path]))
+	# A file that can't be read has no digest
+	assert Watcher([path]).digest(os.path.join(temp, "missing.block")) is None
+	edit(path, VALID.format(1))
+	env = dict(os.environ)
+	env["PYTHONPATH"] = os.pathsep.join((BASE, env.get("PYTHONPATH", "")))
+	with open(output, "wb") as out, open(errors, "wb") as err:
+		process = subprocess.Popen(
+			[sys.executable, "-m", "polyblocks.command", "--no-cache", "--watch", "--interval", "0.05", path],
+			env=env, stdout=out, stderr=err,
+		)
+		try:
+			wait(output, "Version 1")
+			edit(path, INVALID)
+			wait(errors, "No block defined for tag")
+			os.unlink(path)
+			time.sleep(0.5)
+			assert process.poll() is None, "The watcher should still be running"
+			edit(path, VALID.format(3))
+			wait(output, "Version 3")
+			assert process.poll() is None, "The watcher should still be running"
+		finally:
+			process.terminate()
+			process.wait()
+	with open(output, "rt") as f:
+		assert f.read() == "".join(expected), "The output should only have the valid versions"
+	# The rest of the file is parsed from the bytes read before it was
+	# truncated.
+	result = subprocess.run([sys.executable, "-c", TRUNCATED, os.path.join(temp, "truncated.block")], env=env, capture_output=True)
+	assert result.returncode == 0, f"Parsing a truncated file failed with {result.returncode}"
+	assert result.stdout.strip() == b"20000"
+	print("OK")
+
+# EOF - vim: ts=4 sw=4 noet
@@ -0,0 +1,121 @@
+from polyblocks.parser import Parser, EmbeddedParser
+import random
+
+__doc__ = """
+Ensures that `Parser.reparse` gives the same result as `parseDocument` on
+the edited text, for standalone and embedded sources, including edits
+that add, remove or cross block headers and delimiters, and edits that
+change whether the following blocks are stable boundaries (see
+`_isStableBoundary`).
+"""
+
+PLAIN = """\
+@title Reparse
+@p
+	First paragraph
+	on two lines
+@code {lang=js}
+	console.log(1)
+
+@h2 Section
+@p
+	Second
+@json
+	[1, 2]"""
+
+EMBEDDED = """\
+# @title Embedded
+# @p
+#   Some text
+import os
+def f():
+	return 1
+# @hide
+hidden = True
+# @show
+x = 2
+# @p
+#	More
+y = 3"""
+
+# The `(start, end, lines)` edits of each source
+EDITS = {
+	PLAIN:[
+		(2, 3, ["\tFirst edited paragraph"]),    # Inside a block
+		(1, 2, []),                              # Removes a header
+		(3, 3, ["@p", "\tSplit"]),               # Adds a header
+		(3, 9, ["\tmerged"]),                    # Crosses headers
+		(0, 0, ["@h1 Start"]),                   # Before the first block
+		(12, 12, ["@p", "\tEnd"]),               # After the last block
+		(0, 12, ["@p", "\tReplaced"]),           # Everything
+	],
+	EMBEDDED:[
+		(4, 5, ["def g():"]),                    # Inside host code
+		(1, 2, []),                              # Removes a delimiter
+		(4, 4, ["# @p", "#\tInserted"]),         # Adds a delimiter
+		(2, 11, ["z = 0"]),                      # Crosses delimiters
+		(3, 3, ["# @hide"]),                     # Hides the host code after
+		(8, 9, []),                              # Removes a `@show`
+		(6, 7, []),                              # Removes a `@hide`
+		(12, 13, ["# @p", "#\tLast"]),           # Host code to a block
+	],
+}
+
+# The lines that random edits are made of
+PIECES = [
+	"@p", "\tinserted", "@h3 New", "", "# @p", "#\tcomment", "z = 1",
+	"# @hide", "# @show", "@title T", "\tmore text",
+]
+
+def signature( result ):
+	return (
+		[(_.__class__, _.type, _.name, _.attributes, repr(_.value), getattr(_, "source", None)) for _ in result.blocks],
+		result.ranges, result.lines,
+	)
+
+def check( parserClass, text:str, path:str, start:int, end:int, lines ) -> bool:
+	"""Checks that reparsing the given edit gives the same result as
+	parsing the edited text, returning `False` if the edited text can't
+	be parsed (eg. when an edit breaks a `@json` block)."""
+	source = text.split("\n")
+	edited = "\n".join(source[:start] + lines + source[end:])
+	try:
+		expected = parserClass(useCache=False).parseDocument(edited, path)
+	except ValueError:
+		return False
+	parser   = parserClass(useCache=False)
+	previous = parser.parseDocument(text, path)
+	result, changed = parser.reparse(previous, start, end, lines)
+	assert signature(result) == signature(expected), f"{path}: reparse({start}, {end}, {lines!r})"
+	# The blocks that did not change are reused
+	for i, block in enumerate(result.blocks):
+		if i not in changed:
+			assert any(block is _ for _ in previous.blocks), f"{path}: block {i} should be reused"
+	return True
+
+for parserClass, text, path in (
+	(Parser, PLAIN, "document.block"),
+	(EmbeddedParser, PLAIN, "document.block"),
+	(EmbeddedParser, EMBEDDED, "document.py"),
+):
+	for start, end, lines in EDITS[text]:
+		assert check(parserClass, text, path, start, end, lines)
+	count = len(text.split("\n"))
+	rnd   = random.Random(path)
+	for _ in range(200):
+		start = rnd.randint(0, count)
+		end   = rnd.randint(start, min(count, start + 3))
+		check(parserClass, text, path, start, end, [rnd.choice(PIECES) for _ in range(rnd.randint(0, 3))])
+	print(f"{parserClass.__name__} {path}: OK")
+
+# An edit that empties the document leaves a single empty line, like
+# splitting the empty string.
+for parserClass, text, path in ((Parser, PLAIN, "document.block"), (EmbeddedParser, EMBEDDED, "document.py")):
+	parser   = parserClass(useCache=False)
+	previous = parser.parseDocument(text, path)
+	result, changed = parser.reparse(previous, 0, len(previous.lines), [])
+	assert signature(result) == signature(parserClass(useCache=False).parseDocument("", path))
+	assert result.lines == [""] and changed == list(range(len(result.blocks)))
+print("Empty: OK")
+
+# EOF - vim: ts=4 sw=4 noet
@@ -0,0 +1,64 @@
+from polyblocks.model  import Symbol, Anchor, XMLTree, Collection, Heading
+from polyblocks.parser import Parser
+from polyblocks.writer import JSONWriter, XMLWriter, XMLDOMWriter
+from polyblocks        import binary
+import io, pickle
+
+__doc__ = """
+Ensures that the blocks keep the API and output they had before they
+had `__slots__`: symbols and anchors have a `{"name", "type"}` dict as
+value, `XMLTree` and `Collection` blocks are named `block`, and the type
+of a block can be set on the instance. The expected values are the ones
+given by the model before the change.
+"""
+
+DOCUMENT = """\
+@symbol type name
+@anchor a
+@symbol plain
+"""
+
+def write( writer, blocks ) -> str:
+	output = io.StringIO()
+	writer.write(blocks, output)
+	return output.getvalue()
+
+def signature( block ):
+	return (block.__class__.__name__, block.name, block.type, block.value, block.attributes, block.toPrimitive())
+
+blocks = [
+	Symbol("name", "type"), Anchor("anchor"), Symbol("s").setAttributes({"k":"v"}),
+	XMLTree("<a/>"), Collection([1, 2]), Heading("Title"),
+]
+assert [signature(_) for _ in blocks] == [
+	("Symbol",     "symbol",  "symbol",     {"name":"name", "type":"type"}, {},         {"name":"name", "type":"type"}),
+	("Anchor",     "anchor",  "anchor",     {"name":"anchor", "type":None}, {},         {"name":"anchor", "type":None}),
+	("Symbol",     "symbol",  "symbol",     {"name":"s", "type":None},      {"k":"v"},  {"k":"v", "name":"s", "type":None}),
+	("XMLTree",    "block",   "xmltree",    "<a/>",                         {},         None),
+	("Collection", "block",   "collection", [1, 2],                         {},         None),
+	("Heading",    "heading", "heading",    "Title",                        {},         {"heading":"Title"}),
+]
+assert write(JSONWriter(), blocks) == '[{"name":"name","type":"type"},{"name":"anchor","type":null},{"k":"v","name":"s","type":null},null,null,{"heading":"Title"}]'
+
+parsed = Parser(useCache=False).parseText(DOCUMENT)
+assert [(_.name, _.type, _.value) for _ in parsed] == [
+	("symbol", "symbol", {"name":"name", "type":"type"}),
+	("anchor", "anchor", {"name":"a", "type":None}),
+	("symbol", "symbol", {"name":"plain", "type":None}),
+]
+assert write(JSONWriter(), parsed) == '[{"name":"name","type":"type"},{"name":"a","type":null},{"name":"plain","type":null}]'
+expected = '<?xml version="1.0" ?><block><symbol name="name" type="type"/><anchor name="a" type="None"/><symbol name="plain" type="None"/></block>'
+assert write(XMLDOMWriter(), parsed) == expected
+assert write(XMLWriter(), parsed) == expected
+
+# The type can be set per instance, and is kept by pickling (as used by
+# the cache) and by the binary format.
+heading = Heading("Title")
+heading.type = "title"
+assert heading.type == "title" and Heading("Other").type == "heading"
+for block in (heading, *blocks, *parsed):
+	assert signature(pickle.loads(pickle.dumps(block))) == signature(block)
+	assert signature(binary.loads(binary.dumps([block]))[0]) == signature(block)
+print("OK")
+
+# EOF - vim: ts=4 sw=4 noet
@@ -0,0 +1,85 @@
+from polyblocks.parser import Parser
+from polyblocks.util   import Cache
+import os, tempfile
+
+__doc__ = """
+Ensures that the blocks memoized by the cache are invalidated when their
+source changes and when the cache `VERSION` changes, for both the
+in-memory and the on-disk tiers, so that a cached parse always gives the
+same blocks as a parse without the cache. Only the expensive and the long
+blocks are memoized, the other ones are processed again.
+"""
+
+# Long enough to be memoized, see `Parser.CACHE_MIN`
+LONG = "\n".join(f"\tLine {i} of a long paragraph" for i in range(Parser.CACHE_MIN // 20))
+
+# The two JSON blocks and the long paragraph are memoized
+DOCUMENT = f"""\
+@title Cache
+@p
+	A paragraph
+@code {{lang=js}}
+	console.log("code")
+@json
+	{{"items": [1, 2, 3]}}
+@json
+	{{"items": [4, 5, 6]}}
+@p
+{LONG}
+"""
+
+# The same document with one of the memoized blocks changed
+EDITED = DOCUMENT.replace("[4, 5, 6]", "[4, 5, 6, 7]")
+
+# A document with short text blocks only, which are not memoized
+SHORT = """\
+@title Short
+@p
+	A paragraph
+@code
+	print("code")
+"""
+
+def signature( blocks ):
+	return [(_.__class__, _.name, _.type, _.attributes, repr(_.value)) for _ in blocks]
+
+def parse( cache:Cache, text:str ):
+	"""Parses the given text with the given cache, returning the blocks
+	and the number of cache hits and misses."""
+	hits, misses = cache.hits, cache.misses
+	blocks = Parser().parseText(text)
+	assert signature(blocks) == signature(Parser(useCache=False).parseText(text))
+	return blocks, cache.hits - hits, cache.misses - misses
+
+version = Cache.VERSION
+with tempfile.TemporaryDirectory() as temp:
+	root = os.path.join(temp, "cache")
+	Cache.CACHE = cache = Cache(root)
+	# Short text blocks produce no entry, in either tier
+	assert parse(cache, SHORT)[1:] == (0, 0)
+	assert not cache.memory and not os.listdir(root)
+	count = 3
+	assert parse(cache, DOCUMENT)[1:] == (0, count)
+	assert len(cache.memory) == len(os.listdir(root)) == count
+	# The memory tier
+	assert parse(cache, DOCUMENT)[1:] == (count, 0)
+	# A changed block is the only one processed again
+	assert parse(cache, EDITED)[1:] == (count - 1, 1)
+	# The disk tier, as used by another process
+	Cache.CACHE = cache = Cache(root)
+	assert parse(cache, DOCUMENT)[1:] == (count, 0)
+	assert cache.diskHits == count
+	assert parse(cache, EDITED)[1:] == (count, 0)
+	# A new version invalidates all the entries, in both tiers
+	Cache.VERSION = version + ".test"
+	try:
+		assert parse(cache, EDITED)[1:] == (0, count)
+		# The entries of the new version are on disk too
+		Cache.CACHE = cache = Cache(root)
+		assert parse(cache, DOCUMENT)[1:] == (count - 1, 1)
+	finally:
+		Cache.VERSION = version
+	Cache.CACHE = None
+	print("OK")
+
+# EOF - vim: ts=4 sw=4 noet
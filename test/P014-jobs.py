@@ -0,0 +1,65 @@
+from polyblocks.command import run
+import io, os, tempfile, contextlib
+
+__doc__ = """
+Ensures that processing files with `-j N` workers gives the same output,
+in the same order, as processing them serially, in every output format
+and when directories are given (which are expanded the same way with and
+without workers), and that a negative number of jobs is rejected.
+"""
+
+DOCUMENT = """\
+@title Document {index}
+@p
+	A paragraph, with non-ASCII characters: àéî ☃
+@json
+	{{"index": "{index}", "items": [1, 2.5, null]}}
+"""
+
+EMBEDDED = """\
+# @title Embedded {index}
+import os
+# @p
+#	Some text
+x = 1
+"""
+
+def stdout( args ) -> bytes:
+	output = io.TextIOWrapper(io.BytesIO(), encoding="utf8")
+	with contextlib.redirect_stdout(output):
+		run(args)
+	output.flush()
+	return output.buffer.getvalue()
+
+with tempfile.TemporaryDirectory() as temp:
+	paths = []
+	for index, name in enumerate(("a.block", "b.py", os.path.join("sub", "c.block"), os.path.join("sub", "d.js"))):
+		path = os.path.join(temp, "src", name)
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+		with open(path, "wt") as f:
+			f.write((EMBEDDED if name.endswith(("py", "js")) else DOCUMENT).format(index=index).replace("#", "//" if name.endswith("js") else "#"))
+		paths.append(path)
+	# Not a source file, so not expanded from the directory
+	with open(os.path.join(temp, "src", "notes.txt"), "wt") as f:
+		f.write("Some notes\n")
+	directory = os.path.join(temp, "src")
+	for format in ("xml", "json", "ndjson"):
+		serial = stdout(["--no-cache", "-O", format] + paths)
+		assert serial
+		for jobs in ("2", "3", "0"):
+			assert stdout(["--no-cache", "-O", format, "-j", jobs] + paths) == serial, f"-j {jobs} -O {format} differs"
+		# A directory gives the same output as its files
+		expanded = stdout(["--no-cache", "-O", format, directory])
+		assert expanded == serial, f"-O {format} differs for a directory"
+		assert stdout(["--no-cache", "-O", format, "-j", "2", directory]) == expanded, f"-j 2 -O {format} differs for a directory"
+	for jobs in ("-1", "-2"):
+		with contextlib.redirect_stderr(io.StringIO()):
+			try:
+				run(["--no-cache", "-j", jobs] + paths)
+			except SystemExit as e:
+				assert e.code == 2
+			else:
+				raise AssertionError(f"-j {jobs} should be rejected")
+	print("OK")
+
+# EOF - vim: ts=4 sw=4 noet
@@ -0,0 +1,70 @@
+from polyblocks.parser import Parser
+from polyblocks.model  import LazyBlock, EMPTY_ATTRIBUTES
+from polyblocks.writer import JSONWriter
+import io
+
+__doc__ = """
+Ensures that the blocks of a lazy parser are only processed when their
+value (or output) is accessed, once, and that their name, type and
+attributes are known without processing them.
+"""
+
+DOCUMENT = """\
+@title Lazy
+@date
+	2020-02-29T12:30:00
+@data:json {source=inline}{}
+	{"items": [1, 2, 3]}
+@p
+	A paragraph
+"""
+
+def counted( function ):
+	"""Wraps the given function (or method) to count its calls."""
+	def wrapper( *args, **kwargs ):
+		wrapper.count += 1
+		return function(*args, **kwargs)
+	wrapper.count = 0
+	return wrapper
+
+def write( blocks ) -> str:
+	output = io.StringIO()
+	JSONWriter().write(blocks, output)
+	return output.getvalue()
+
+expected = Parser(useCache=False).parseText(DOCUMENT)
+process  = Parser.processInput = counted(Parser.processInput)
+blocks   = Parser(useCache=False, lazy=True).parseText(DOCUMENT)
+assert all(isinstance(_, LazyBlock) for _ in blocks)
+assert process.count == 0, "Parsing should not process the blocks"
+
+# The header gives the name, type and attributes
+assert [(_.name, _.type, _.attributes) for _ in blocks] == [(_.name, _.type, _.attributes) for _ in expected]
+assert not any(_.isEvaluated for _ in blocks)
+assert process.count == 0, "The name, type and attributes should not process the blocks"
+
+# Each block is processed once, on its first access
+data = blocks[2]
+assert data.value == expected[2].value
+assert data.isEvaluated and process.count == 1
+assert data.value == expected[2].value and data.source == expected[2].source
+assert process.count == 1, "A block should only be processed once"
+assert [_.isEvaluated for _ in blocks] == [False, False, True, False]
+
+# Attributes set before processing are kept
+blocks[3].setAttributes({"class":"note"})
+assert process.count == 1
+assert blocks[3].block.attributes == {"class":"note"}
+assert process.count == 2
+
+# The output is the same as without laziness
+expected[3].setAttributes({"class":"note"})
+assert write(blocks) == write(expected)
+assert process.count == len(blocks)
+
+# Clearing the attributes of an evaluated block gives empty attributes
+assert blocks[3].setAttributes(None).block.attributes is EMPTY_ATTRIBUTES
+assert blocks[3].toPrimitive() == Parser(useCache=False).parseText(DOCUMENT)[3].toPrimitive()
+print("OK")
+
+# EOF - vim: ts=4 sw=4 noet
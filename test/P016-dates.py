@@ -0,0 +1,72 @@
+from polyblocks.inputs import DateInput
+from datetime          import datetime, timezone, timedelta
+import sys, locale
+
+__doc__ = """
+Ensures that the dates parsed directly by `DateInput` (without `dateutil`)
+are the same as with `strptime` in the C locale and as with `dateutil`
+(when installed), and that they don't depend on the locale.
+"""
+
+# The dates parsed directly, with their value and their `strptime` format
+# (in the C locale), if any.
+FIXED = [
+	("2020-02-29",                datetime(2020, 2, 29),                None),
+	("2020-02-29T12:30:00",       datetime(2020, 2, 29, 12, 30),        None),
+	("2020-02-29 12:30:15.250",   datetime(2020, 2, 29, 12, 30, 15, 250000), None),
+	("2020-02-29T12:30+02:00",    datetime(2020, 2, 29, 12, 30, tzinfo=timezone(timedelta(hours=2))), None),
+	("2020/02/29",                datetime(2020, 2, 29),                "%Y/%m/%d"),
+	("02/29/2020",                datetime(2020, 2, 29),                "%m/%d/%Y"),
+	("2/9/2020",                  datetime(2020, 2, 9),                 "%m/%d/%Y"),
+	("February 29, 2020",         datetime(2020, 2, 29),                "%B %d, %Y"),
+	("march 1, 2021",             datetime(2021, 3, 1),                 "%B %d, %Y"),
+	("29 February 2020",          datetime(2020, 2, 29),                "%d %B %Y"),
+	("1 DECEMBER 1999",           datetime(1999, 12, 1),                "%d %B %Y"),
+]
+
+# The dates that are given to `dateutil`
+OTHER = ["Feb 29, 2020", "February 30, 2020", "29 Février 2020", "Saturday, February 29, 2020"]
+
+# The locales that have other month names, when available
+LOCALES = ("C", "fr_FR.UTF-8", "de_DE.UTF-8", "ja_JP.UTF-8")
+
+assert "dateutil.parser" not in sys.modules
+for text, expected, format in FIXED:
+	assert DateInput.ParseDate(text) == expected, f"ParseDate({text!r})"
+assert "dateutil.parser" not in sys.modules, "The fixed dates should not need dateutil"
+
+previous = locale.setlocale(locale.LC_TIME)
+try:
+	for name in LOCALES:
+		try:
+			locale.setlocale(locale.LC_TIME, name)
+		except locale.Error:
+			continue
+		for text, expected, format in FIXED:
+			assert DateInput.ParseFixedDate(text) == expected, f"{name}: ParseFixedDate({text!r})"
+		for text in OTHER:
+			assert DateInput.ParseFixedDate(text) is None, f"{name}: ParseFixedDate({text!r}) should be None"
+		if name == "C":
+			for text, expected, format in FIXED:
+				if format:
+					assert datetime.strptime(text, format) == expected, f"strptime({text!r}, {format!r})"
+		print(f"{name}: OK")
+finally:
+	locale.setlocale(locale.LC_TIME, previous)
+
+try:
+	import dateutil.parser
+except ImportError:
+	print("dateutil: SKIPPED (not installed)")
+else:
+	for text, expected, format in FIXED:
+		assert DateInput.ParseAnyDate(text) == expected, f"ParseAnyDate({text!r})"
+	for text in OTHER:
+		try:
+			expected = dateutil.parser.parse(text)
+		except (ValueError, OverflowError):
+			continue
+		assert DateInput.ParseDate(text) == expected, f"ParseDate({text!r})"
+	print("dateutil: OK")
+
+# EOF - vim: ts=4 sw=4 noet
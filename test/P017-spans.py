@@ -0,0 +1,88 @@
+from polyblocks.parser import Parser
+from polyblocks.inputs import Span
+import os, tempfile
+
+__doc__ = """
+Ensures that the long content runs kept as spans refer to the right part
+of their source, whether the file is scanned as a `str` or as a
+memory-mapped buffer (where offsets are in bytes), and that the blocks
+are the same as when the lines are parsed one by one.
+"""
+
+# Long enough to be kept as a span, with non-ASCII characters so that the
+# byte and character offsets differ.
+LONG = "\n".join(f"\tLine {i}, with non-ASCII characters: àéî ☃" for i in range(Parser.SPAN_MIN // 20))
+
+DOCUMENT = f"""\
+@title Spans ☃
+@p
+{LONG}
+@code {{lang=js}}{{}}
+	console.log("short")
+# A comment between blocks
+@p
+{LONG}
+
+{LONG}
+@p
+	Short, after a long run
+@code
+{LONG}"""
+
+def signature( blocks ):
+	return [(_.name, _.type, _.attributes, _.value) for _ in blocks]
+
+def content( source:str, start:int, end:int ) -> str:
+	"""Returns the block content lines within the given source text, as
+	they are given to the block input (without their leading tab)."""
+	return "\n".join(_[1:] if _.startswith("\t") else _ for _ in source[start:end].split("\n"))
+
+def check( text:str, buffer, inputs ):
+	"""Checks the spans and positions of the given block inputs, scanned
+	from the given buffer holding the given text."""
+	is_text = isinstance(buffer, str)
+	spans   = 0
+	for block_input in inputs:
+		position = block_input.getPosition()
+		source   = buffer[position.start:position.end]
+		source   = source if is_text else str(source, "utf8")
+		assert source.startswith("@"), f"Position {position} should start at the header"
+		assert text.find(source) >= 0, f"Position {position} should be in the source"
+		for line in block_input.inputLines:
+			if isinstance(line, Span):
+				spans += 1
+				if is_text:
+					# Text buffers are not copied
+					assert line.source is buffer
+				expected = content(line.source, line.start, line.end)
+				assert line.getText() == expected
+				assert expected in content(source, 0, len(source)), "The span should be within its block"
+	# The empty line doesn't end a run, so the second paragraph is one span
+	assert spans == 3, f"Expected 3 spans, got {spans}"
+
+with tempfile.TemporaryDirectory() as temp:
+	for text in (DOCUMENT, DOCUMENT + "\n"):
+		path = os.path.join(temp, "document.block")
+		with open(path, "wt") as f:
+			f.write(text)
+		parser = Parser(useCache=False)
+		# The text is scanned as a `str`
+		check(text, text, list(parser.iterTextInputs(text, path)))
+		# The file is scanned as a memory-mapped buffer
+		buffer = parser._mapPath(path)
+		assert buffer is not None and not isinstance(buffer, str)
+		try:
+			check(text, buffer, list(parser.iterPathInputs(path)))
+		finally:
+			buffer.close()
+		# The blocks are the same as when parsing line by line, the text
+		# being split on newlines and the file read as lines (so without
+		# an empty last line).
+		expected = signature(Parser(useCache=False).parseLines(text.split("\n"), path))
+		assert signature(Parser(useCache=False).parseText(text, path)) == expected
+		with open(path, "rt") as f:
+			expected = signature(Parser(useCache=False).parseLines(f.readlines(), path))
+		assert signature(Parser(useCache=False).parsePath(path)) == expected
+	print("OK")
+
+# EOF - vim: ts=4 sw=4 noet
@@ -0,0 +1,74 @@
+from polyblocks.parser import Parser
+import os, sys, tempfile
+
+__doc__ = """
+Ensures that the block types registered as `module:Class` references are
+only imported when a header uses them, that the types and tags declared
+by the entry points of installed packages are resolved (without
+overriding the built-in ones), and that an unknown tag still fails.
+"""
+
+MODULE = """\
+from polyblocks.inputs import TextInput
+from polyblocks.model  import Text
+
+class {name}(TextInput):
+
+	def process( self ):
+		return Text("{name}:" + self.getInputAsString().strip())
+"""
+
+# A package declaring a type and tags with its entry points, one of them
+# (`p`) being already defined.
+ENTRY_POINTS = """\
+[polyblocks.types]
+fake = fakemodule:FakeInput
+[polyblocks.tags]
+fk = fake
+p = fake
+"""
+
+def values( parser:Parser, text:str ):
+	return [_.value for _ in parser.parseText(text)]
+
+with tempfile.TemporaryDirectory() as temp:
+	for name in ("somemodule", "fakemodule"):
+		with open(os.path.join(temp, f"{name}.py"), "wt") as f:
+			f.write(MODULE.format(name="SomeInput" if name == "somemodule" else "FakeInput"))
+	dist = os.path.join(temp, "fakeblocks-1.0.dist-info")
+	os.makedirs(dist)
+	with open(os.path.join(dist, "METADATA"), "wt") as f:
+		f.write("Metadata-Version: 2.1\nName: fakeblocks\nVersion: 1.0\n")
+	with open(os.path.join(dist, "entry_points.txt"), "wt") as f:
+		f.write(ENTRY_POINTS)
+	sys.path.insert(0, temp)
+	try:
+		# A `module:Class` reference is only imported when used
+		parser = Parser(useCache=False)
+		parser.mapping.register("some", "somemodule:SomeInput", ("sm",))
+		assert values(parser, "@p\n\tText\n") == ["\nText\n"]
+		assert "somemodule" not in sys.modules, "The module should not be imported before it is used"
+		assert not parser.mapping.hasEntryPoints, "The entry points should only be read for unknown headers"
+		assert values(parser, "@sm\n\tSome\n@x:some\n\tOther\n") == ["SomeInput:Some", "SomeInput:Other"]
+		assert "somemodule" in sys.modules
+
+		# The entry points are read for the headers that are not known,
+		# and don't override the built-in tags.
+		parser = Parser(useCache=False)
+		assert "fakemodule" not in sys.modules
+		assert values(parser, "@fk\n\tFake\n@x:fake\n\tOther\n@p\n\tText\n") == ["FakeInput:Fake", "FakeInput:Other", "\nText\n"]
+		assert parser.mapping.hasEntryPoints
+
+		# An unknown tag still fails, with or without the entry points
+		for parser in (Parser(useCache=False), parser):
+			try:
+				parser.parseText("@unknowntag\n\tText\n")
+			except ValueError as e:
+				assert "unknowntag" in str(e)
+			else:
+				raise AssertionError("An unknown tag should raise a ValueError")
+	finally:
+		sys.path.remove(temp)
+	print("OK")
+
+# EOF - vim: ts=4 sw=4 noet